@@ -1,20 +1,36 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+import contextvars
 import json
 import os
+import re
+import time
+from datetime import datetime
 
 import sys
 import os
 from dotenv import load_dotenv
+from starlette.routing import Match
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from services.document_processor import DocumentProcessor
-from services.knowledge_base import KnowledgeBase
+from services.knowledge_base import KnowledgeBase, KnowledgeBaseRegistry
 from services.test_generator import TestGenerator
 from services.script_generator import ScriptGenerator
-from services.llm_client import GeminiClient
+from services.llm_providers import create_llm_providers
+from services.maintenance import compact_and_measure, disk_footprint
+from services.cache import ResultCache
+from services.concurrency import SingleFlight
+from services.context_packer import estimate_tokens
+from services.deadline import Deadline
+from services.metrics import REGISTRY, cache_collector
+from services.snapshot import SnapshotError, read_manifest
+from services.tracing import PROFILE_MODES, ProfilerBusy, Trace, TraceStore, span, traced
+from services.uploads import UploadSizeLimit, UploadTooLarge
 
 load_dotenv()
 
@@ -29,65 +45,513 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+HTTP_IN_FLIGHT = REGISTRY.gauge("qa_http_requests_in_flight", "Requests currently being handled", ("method", "route"))
+HTTP_DURATION = REGISTRY.histogram("qa_http_request_duration_seconds", "End-to-end request latency", ("method", "route"))
+HTTP_REQUESTS = REGISTRY.counter("qa_http_requests_total", "Handled requests by response status", ("method", "route", "status"))
+
+def route_template(request: Request) -> str:
+    """Path pattern of the matching route, so metrics are not split per job id or source"""
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    labels = {"method": request.method, "route": route_template(request)}
+    HTTP_IN_FLIGHT.inc(**labels)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_IN_FLIGHT.dec(**labels)
+        HTTP_DURATION.observe(time.perf_counter() - started, **labels)
+        HTTP_REQUESTS.inc(status=str(status), **labels)
+
+# Opt-in profiling: send "X-Profile: spans|sample|cprofile" (or ?profile=...)
+# and fetch the result from /profiles/{trace_id}, named in the X-Trace-Id header.
+# Only one cprofile request runs at a time (others get 409), and on Python
+# 3.12+ its profile covers the whole process, not just that request
+trace_store = TraceStore()
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    mode = request.headers.get("x-profile") or request.query_params.get("profile")
+    if not mode:
+        return await call_next(request)
+    
+    mode = "spans" if mode.lower() in ("1", "true", "yes") else mode.lower()
+    if mode not in PROFILE_MODES:
+        return JSONResponse(status_code=400, content={"detail": f"Unknown profile mode: {mode}"})
+    
+    trace = Trace(f"{request.method} {request.url.path}", mode=mode)
+    try:
+        with traced(trace):
+            response = await call_next(request)
+    except ProfilerBusy as e:
+        return JSONResponse(status_code=409, content={"detail": str(e)})
+    trace_store.add(trace)
+    response.headers["X-Trace-Id"] = trace.trace_id
+    return response
+
 # Initialize services
 doc_processor = DocumentProcessor()
-knowledge_base = KnowledgeBase()
-llm_client = GeminiClient()
+# One knowledge base per project (``project`` on requests), opened on first
+# use; requests without a project use the default one
+knowledge_bases = KnowledgeBaseRegistry()
+knowledge_base = knowledge_bases.default
+# Fresh nodes can start from a prebuilt snapshot instead of re-embedding documents
+if os.getenv("KB_SNAPSHOT") and not knowledge_base.sources:
+    snapshot_manifest = knowledge_base.import_snapshot(os.getenv("KB_SNAPSHOT"))
+    print(f"Loaded {snapshot_manifest['chunk_count']} chunks from snapshot {os.getenv('KB_SNAPSHOT')}")
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "./snapshots")
+# Uploaded files are parsed straight from the temporary files Starlette spools
+# them to. Upload requests above MAX_UPLOAD_REQUEST_BYTES are cut off while
+# being received, and files above MAX_UPLOAD_BYTES are rejected; both with 413
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(4 * MAX_UPLOAD_BYTES)))
+app.add_middleware(UploadSizeLimit, max_bytes=MAX_UPLOAD_REQUEST_BYTES, paths=("/upload-documents",))
+# Every known LLM provider; requests may pick one with ``provider``
+llm_providers = create_llm_providers()
+llm_client = llm_providers.get(os.getenv("LLM_PROVIDER", "gemini"), llm_providers["gemini"])
 test_generator = TestGenerator(knowledge_base, llm_client=llm_client)
 script_generator = ScriptGenerator(knowledge_base)
 
+# Identical generation requests that arrive while one is already running
+# wait for it and share its result instead of repeating the work
+test_case_flight = SingleFlight()
+script_flight = SingleFlight()
+
+def cache_stats():
+    """Stats of every result cache; each open project has its own query cache"""
+    # Shared by every project; Prometheus treats an empty label as absent
+    caches = [
+        ({"cache": "test_cases", "project": ""}, test_generator.cache.stats()),
+        ({"cache": "scripts", "project": ""}, script_generator.cache.stats())
+    ]
+    caches += [
+        ({"cache": "kb_queries", "project": name}, kb.query_cache.stats())
+        for name, kb in knowledge_bases.open_projects().items()
+    ]
+    return caches
+
+REGISTRY.register_collector(cache_collector(cache_stats))
+
+def collect_service_metrics():
+    flights = {"test_cases": test_case_flight.stats(), "scripts": script_flight.stats()}
+    open_projects = knowledge_bases.open_projects()
+    registry = knowledge_bases.stats()
+    return [
+        ("qa_knowledge_base_version", "gauge", "Current knowledge base version",
+         [("qa_knowledge_base_version", {"project": name}, kb.version) for name, kb in open_projects.items()]),
+        ("qa_knowledge_base_sources", "gauge", "Indexed source documents",
+         [("qa_knowledge_base_sources", {"project": name}, len(kb.sources)) for name, kb in open_projects.items()]),
+        ("qa_knowledge_base_open_projects", "gauge", "Project knowledge bases currently open",
+         [("qa_knowledge_base_open_projects", {}, len(open_projects))]),
+        ("qa_knowledge_base_project_evictions_total", "counter", "Projects closed to stay within KB_MAX_OPEN_PROJECTS",
+         [("qa_knowledge_base_project_evictions_total", {}, registry["evictions"])]),
+        ("qa_single_flight_coalesced_total", "counter", "Requests that shared an identical in-flight execution",
+         [("qa_single_flight_coalesced_total", {"endpoint": name}, stats["coalesced"]) for name, stats in flights.items()]),
+        ("qa_single_flight_in_flight", "gauge", "Distinct generation executions currently running",
+         [("qa_single_flight_in_flight", {"endpoint": name}, stats["in_flight"]) for name, stats in flights.items()])
+    ]
+
+REGISTRY.register_collector(collect_service_metrics)
+
 class TestCaseRequest(BaseModel):
     query: str
+    # Optional retrieval scope; sections match a full heading path or any of
+    # its first three levels (see GET /sources for the indexed sections)
+    sources: Optional[List[str]] = None
+    content_types: Optional[List[str]] = None
+    sections: Optional[List[str]] = None
+    products: Optional[List[str]] = None
+    pages: Optional[List[int]] = None
+    # Overrides the default context token budget (CONTEXT_TOKEN_BUDGET)
+    token_budget: Optional[int] = Field(default=None, gt=0)
+    # "fast" returns rule-based cases at once and refines them with the LLM
+    # in the background; poll /generate-test-cases/jobs/{job_id} for the result
+    mode: Literal["full", "fast"] = "full"
+    # LLM provider name (see GET /llm/providers); defaults to LLM_PROVIDER
+    provider: Optional[str] = None
+    # Time budget for the whole request; stages degrade to stay within it
+    deadline_ms: Optional[int] = Field(default=None, gt=0)
+    # Project knowledge base to retrieve from (see GET /projects); defaults to "default"
+    project: Optional[str] = None
+
+    def filters(self) -> dict:
+        return {
+            "sources": self.sources,
+            "content_types": self.content_types,
+            "sections": self.sections,
+            "products": self.products,
+            "pages": self.pages
+        }
     
+class ProviderComparisonRequest(BaseModel):
+    query: str
+    providers: Optional[List[str]] = None
+    sources: Optional[List[str]] = None
+    content_types: Optional[List[str]] = None
+    sections: Optional[List[str]] = None
+    products: Optional[List[str]] = None
+    pages: Optional[List[int]] = None
+    token_budget: Optional[int] = Field(default=None, gt=0)
+    project: Optional[str] = None
+
+class SnapshotRequest(BaseModel):
+    # Directory name under SNAPSHOT_DIR; defaults to a timestamped name
+    name: Optional[str] = None
+
 class ScriptGenerationRequest(BaseModel):
     test_case: dict
     html_content: str
+    deadline_ms: Optional[int] = Field(default=None, gt=0)
+    project: Optional[str] = None
+
+def get_llm_provider(name: Optional[str]):
+    """Resolve a provider name from a request, defaulting to the configured client"""
+    if name is None:
+        return llm_client
+    if name not in llm_providers:
+        raise HTTPException(status_code=400, detail=f"Unknown LLM provider: {name}")
+    return llm_providers[name]
+
+# Knowledge bases held by the current request; released when it finishes so
+# the registry never closes a project while a request is still using it
+request_knowledge_bases: contextvars.ContextVar = contextvars.ContextVar("request_knowledge_bases", default=None)
+
+@app.middleware("http")
+async def release_knowledge_bases(request: Request, call_next):
+    held = []
+    token = request_knowledge_bases.set(held)
+    try:
+        return await call_next(request)
+    finally:
+        request_knowledge_bases.reset(token)
+        for project_kb in held:
+            project_kb.release()
+
+def get_knowledge_base(project: Optional[str]) -> KnowledgeBase:
+    """Resolve a project name from a request, opening its knowledge base if it is not open yet.
+    
+    The knowledge base is held (kept from eviction) until the request finishes.
+    """
+    held = request_knowledge_bases.get()
+    try:
+        project_kb = knowledge_bases.get(project, acquire=held is not None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if held is not None:
+        held.append(project_kb)
+    return project_kb
 
 @app.post("/upload-documents")
-async def upload_documents(files: List[UploadFile] = File(...)):
-    """Upload and process support documents"""
+async def upload_documents(files: List[UploadFile] = File(...), product: Optional[str] = Form(None)):
+    """Upload and process support documents, optionally tagged with the product they describe"""
     try:
         processed_docs = []
         for file in files:
-            content = await file.read()
-            processed_doc = doc_processor.process_document(
-                content, file.filename, file.content_type
-            )
+            if file.size is not None and 0 < MAX_UPLOAD_BYTES < file.size:
+                raise UploadTooLarge(f"{file.filename} is larger than the {MAX_UPLOAD_BYTES} byte upload limit")
+        for file in files:
+            try:
+                # Groups the file's read, extract and chunk spans in a profiled request
+                with span("upload", filename=file.filename, size_bytes=file.size):
+                    processed_doc = await run_in_threadpool(
+                        doc_processor.process_stream, file.file, file.filename, file.content_type
+                    )
+            finally:
+                await file.close()
+            if product:
+                processed_doc['metadata']['product'] = product
             processed_docs.append(processed_doc)
         
         return {"message": f"Processed {len(processed_docs)} documents", "documents": processed_docs}
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Endpoints that do blocking embedding/search/LLM work are plain functions so
+# FastAPI runs them in its threadpool; an ``async def`` here would stall every
+# other request for the duration of a knowledge base rebuild.
 @app.post("/build-knowledge-base")
-async def build_knowledge_base(documents: List[dict]):
-    """Build vector database from processed documents"""
+def build_knowledge_base(documents: List[dict], project: Optional[str] = None):
+    """Build vector database from processed documents, replacing only the given project's index"""
+    project_kb = get_knowledge_base(project)
     try:
-        knowledge_base.build_from_documents(documents)
-        return {"message": "Knowledge base built successfully"}
+        project_kb.build_from_documents(documents)
+        return {"message": "Knowledge base built successfully", "project": project_kb.project,
+                **project_kb.last_build_stats}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/generate-test-cases")
-async def generate_test_cases(request: TestCaseRequest):
+def generate_test_cases(request: TestCaseRequest):
     """Generate test cases based on query and knowledge base"""
+    deadline = Deadline.from_ms(request.deadline_ms)
+    provider = get_llm_provider(request.provider)
+    project_kb = get_knowledge_base(request.project)
     try:
-        test_cases = test_generator.generate_test_cases(request.query)
-        return {"test_cases": test_cases}
+        def run():
+            report = {}
+            job_id = None
+            if request.mode == "fast":
+                test_cases, job_id = test_generator.generate_fast(
+                    request.query, filters=request.filters(), token_budget=request.token_budget, report=report,
+                    llm_client=provider, deadline=deadline, knowledge_base=project_kb
+                )
+            else:
+                test_cases = test_generator.generate_test_cases(
+                    request.query, filters=request.filters(), token_budget=request.token_budget, report=report,
+                    llm_client=provider, deadline=deadline, knowledge_base=project_kb
+                )
+            return test_cases, report, job_id, deadline.degradations
+        
+        key = ResultCache.make_key(project_kb.version, request.model_dump())
+        (test_cases, report, job_id, degradations), shared = test_case_flight.do(key, run)
+        return {
+            "test_cases": test_cases,
+            "report": dict(report, coalesced=shared),
+            "degradations": degradations,
+            "refinement": {"job_id": job_id, "status": "pending"} if job_id else None
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/generate-test-cases/jobs/{job_id}")
+def get_test_case_refinement(job_id: str, wait: float = 0):
+    """Fetch LLM-refined test cases for a fast-mode request, waiting up to ``wait`` seconds"""
+    job = test_generator.get_refinement(job_id, wait=min(max(wait, 0), 30))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+@app.get("/llm/providers")
+def list_llm_providers():
+    """List LLM providers, whether each is usable here, and which one is the default"""
+    return {
+        "default": llm_client.name,
+        "providers": [
+            {"name": name, "display_name": provider.display_name, "configured": provider.is_configured}
+            for name, provider in llm_providers.items()
+        ]
+    }
+
+@app.post("/llm/compare")
+def compare_llm_providers(request: ProviderComparisonRequest):
+    """Run the same packed context and prompt through several providers and time each"""
+    names = request.providers or [name for name, provider in llm_providers.items() if provider.is_configured]
+    providers = [get_llm_provider(name) for name in names]
+    project_kb = get_knowledge_base(request.project)
+    filters = {
+        "sources": request.sources,
+        "content_types": request.content_types,
+        "sections": request.sections,
+        "products": request.products,
+        "pages": request.pages
+    }
+    try:
+        context, packing = test_generator.build_context(request.query, filters, request.token_budget,
+                                                        knowledge_base=project_kb)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not context:
+        raise HTTPException(status_code=400, detail="No relevant documentation found for this query")
+    
+    results = []
+    for provider in providers:
+        result = {
+            "provider": provider.name,
+            "prompt_tokens": provider.estimate_prompt_tokens(request.query, context)
+        }
+        started = time.perf_counter()
+        try:
+            test_cases = provider.generate_test_cases(request.query, context)
+            elapsed = time.perf_counter() - started
+            output_tokens = estimate_tokens(json.dumps(test_cases))
+            result.update(
+                status="ok",
+                latency_ms=round(elapsed * 1000, 1),
+                test_case_count=len(test_cases),
+                approx_output_tokens_per_second=round(output_tokens / elapsed, 1) if elapsed else None,
+                test_cases=test_cases
+            )
+        except Exception as e:
+            result.update(status="error", latency_ms=round((time.perf_counter() - started) * 1000, 1), error=str(e))
+        results.append(result)
+    
+    return {"context": packing, "results": results}
+
 @app.post("/generate-script")
-async def generate_script(request: ScriptGenerationRequest):
+def generate_script(request: ScriptGenerationRequest):
     """Generate Selenium script from test case"""
+    deadline = Deadline.from_ms(request.deadline_ms)
+    project_kb = get_knowledge_base(request.project)
+    try:
+        key = ResultCache.make_key(project_kb.version, request.model_dump())
+        def run():
+            script = script_generator.generate_selenium_script(
+                request.test_case, request.html_content, deadline, knowledge_base=project_kb
+            )
+            return script, deadline.degradations
+        
+        (script, degradations), shared = script_flight.do(key, run)
+        return {"script": script, "coalesced": shared, "degradations": degradations}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/projects")
+def list_projects():
+    """List projects with an index in the store and which of them are open"""
+    return {"projects": knowledge_bases.projects(), "registry": knowledge_bases.stats()}
+
+@app.get("/sources")
+def list_sources(project: Optional[str] = None):
+    """List indexed source documents with their manifest details"""
+    return {"sources": get_knowledge_base(project).list_sources()}
+
+@app.delete("/sources/{source:path}")
+def delete_source(source: str, project: Optional[str] = None):
+    """Remove a single source document from the knowledge base"""
+    project_kb = get_knowledge_base(project)
+    try:
+        removed = project_kb.delete_source(source)
+        return {"message": f"Removed {source}", "source": removed}
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Source not found: {source}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def snapshot_path(name: str) -> str:
+    """Resolve a snapshot name inside SNAPSHOT_DIR, rejecting anything that could escape it"""
+    if not re.fullmatch(r"[A-Za-z0-9_-][A-Za-z0-9_.-]*", name):
+        raise HTTPException(status_code=400, detail=f"Invalid snapshot name: {name}")
+    return os.path.join(SNAPSHOT_DIR, name)
+
+@app.post("/knowledge-base/snapshots")
+def export_snapshot(request: SnapshotRequest, project: Optional[str] = None):
+    """Export the live index (chunks, metadata and embeddings) as a portable snapshot"""
+    project_kb = get_knowledge_base(project)
+    name = request.name or f"kb-{project_kb.project}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    path = snapshot_path(name)
+    try:
+        manifest = project_kb.export_snapshot(path)
+        return {"message": f"Exported snapshot {name}", "name": name, "manifest": manifest}
+    except FileExistsError:
+        raise HTTPException(status_code=409, detail=f"Snapshot already exists: {name}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/knowledge-base/snapshots")
+def list_snapshots():
+    """List snapshots available under SNAPSHOT_DIR"""
+    snapshots = []
+    if os.path.isdir(SNAPSHOT_DIR):
+        for name in sorted(os.listdir(SNAPSHOT_DIR)):
+            if name.startswith("."):
+                continue
+            try:
+                manifest = read_manifest(os.path.join(SNAPSHOT_DIR, name))
+            except SnapshotError:
+                continue
+            snapshots.append({"name": name, **{key: value for key, value in manifest.items() if key != "files"}})
+    return {"snapshots": snapshots}
+
+@app.post("/knowledge-base/snapshots/{name}/load")
+def load_snapshot(name: str, verify: bool = True, project: Optional[str] = None):
+    """Replace a project's knowledge base with a snapshot after verifying its checksums"""
+    path = snapshot_path(name)
+    if not os.path.isdir(path):
+        raise HTTPException(status_code=404, detail=f"Snapshot not found: {name}")
+    project_kb = get_knowledge_base(project)
     try:
-        script = script_generator.generate_selenium_script(
-            request.test_case, request.html_content
+        manifest = project_kb.import_snapshot(path, verify=verify)
+        return {"message": f"Loaded snapshot {name}", "project": project_kb.project, "manifest": manifest,
+                **project_kb.last_build_stats}
+    except SnapshotError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/knowledge-base/footprint")
+def get_footprint():
+    """Disk used by the Chroma store per collection and source, and how much compaction would reclaim"""
+    try:
+        return disk_footprint(knowledge_bases.persist_directory)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/knowledge-base/compact")
+def compact_knowledge_base(measure: bool = True, queries: int = 20):
+    """Reclaim space left by dropped collections, timing store open and queries before and after"""
+    try:
+        # Holds off rebuilds, and opening projects, in every worker while the SQLite file is rewritten
+        return compact_and_measure(
+            knowledge_bases.persist_directory, queries=min(max(queries, 1), 500), measure_timing=measure
         )
-        return {"script": script}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/stats")
+def get_stats(project: Optional[str] = None):
+    """Report knowledge base version and result cache effectiveness"""
+    return {
+        "knowledge_base": get_knowledge_base(project).stats(),
+        "projects": knowledge_bases.stats(),
+        "caches": {
+            "test_cases": test_generator.cache.stats(),
+            "scripts": script_generator.cache.stats(),
+            "kb_queries": {name: kb.query_cache.stats() for name, kb in knowledge_bases.open_projects().items()}
+        },
+        "llm": {name: provider.stats() for name, provider in llm_providers.items()},
+        "embedding_service": knowledge_base.embedding_model.stats() if knowledge_base.embedding_socket else None,
+        "refinement_jobs": test_generator.jobs.stats(),
+        "single_flight": {
+            "test_cases": test_case_flight.stats(),
+            "scripts": script_flight.stats()
+        }
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus metrics: per-stage latency histograms, cache hit rates and in-flight requests"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/profiles")
+def list_profiles():
+    """List recently profiled requests, newest first"""
+    return {"profiles": trace_store.list()}
+
+@app.get("/profiles/{trace_id}")
+def get_profile(trace_id: str):
+    """Nested timing spans recorded for a profiled request"""
+    trace = trace_store.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Unknown trace: {trace_id}")
+    return trace.to_dict()
+
+@app.get("/profiles/{trace_id}/artifact")
+def download_profile(trace_id: str):
+    """Download the profile: folded stacks for sample mode, a pstats file for cprofile mode"""
+    trace = trace_store.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Unknown trace: {trace_id}")
+    
+    if trace.mode == "sample":
+        content, media_type, filename = trace.collapsed_stacks(), "text/plain", f"{trace_id}.folded"
+    elif trace.mode == "cprofile":
+        content, media_type, filename = trace.pstats_dump(), "application/octet-stream", f"{trace_id}.prof"
+    else:
+        content, media_type, filename = json.dumps(trace.to_dict(), indent=2), "application/json", f"{trace_id}.json"
+    return Response(content=content, media_type=media_type,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
@@ -0,0 +1,130 @@
+import re
+from typing import Any, Dict, List, Tuple
+
+# Words and individual punctuation marks; close enough to subword token counts
+# for budgeting without shipping a tokenizer for each LLM backend
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+SENTENCE_END = re.compile(r"[.!?\n]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the number of LLM tokens in a piece of text"""
+    return len(TOKEN_PATTERN.findall(text))
+
+
+class ContextPacker:
+    """Pack retrieved chunks into a prompt context that fits a token budget.
+
+    Adjacent or overlapping chunks of the same source are stitched back
+    together so the shared overlap text is sent once, then the merged
+    passages are added in order of relevance until the budget is spent.
+    """
+
+    def __init__(self, token_budget: int = 1500, min_passage_tokens: int = 40):
+        self.token_budget = token_budget
+        self.min_passage_tokens = min_passage_tokens
+
+    def pack(self, chunks: List[Dict[str, Any]], token_budget: int = None) -> Tuple[str, Dict[str, Any]]:
+        """Return the packed context string and statistics about what was kept"""
+        budget = token_budget or self.token_budget
+        passages = self._merge_passages(chunks)
+        passages.sort(key=lambda passage: passage['distance'])
+
+        parts = []
+        used = 0
+        truncated = 0
+        dropped = 0
+        for passage in passages:
+            header = f"[Source: {passage['source']}]\n"
+            header_tokens = estimate_tokens(header)
+            text_tokens = estimate_tokens(passage['text'])
+            remaining = budget - used - header_tokens
+
+            text = passage['text']
+            if text_tokens > remaining:
+                if remaining < self.min_passage_tokens:
+                    dropped += 1
+                    continue
+                text = self._truncate(text, remaining)
+                text_tokens = estimate_tokens(text)
+                truncated += 1
+
+            parts.append(f"{header}{text}\n")
+            used += header_tokens + text_tokens
+
+        input_tokens = sum(estimate_tokens(chunk['text']) for chunk in chunks)
+        stats = {
+            'token_budget': budget,
+            'context_tokens': used,
+            'input_tokens': input_tokens,
+            'chunks': len(chunks),
+            'passages': len(passages),
+            'passages_packed': len(parts),
+            'passages_truncated': truncated,
+            'passages_dropped': dropped
+        }
+        return "\n".join(parts), stats
+
+    def _merge_passages(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Stitch consecutive chunks of each source into contiguous passages"""
+        by_source: Dict[str, List[Dict[str, Any]]] = {}
+        for chunk in chunks:
+            by_source.setdefault(chunk['metadata']['source'], []).append(chunk)
+
+        passages = []
+        for source, source_chunks in by_source.items():
+            source_chunks.sort(key=self._position)
+            current = None
+            for chunk in source_chunks:
+                distance = chunk.get('distance', 0.0)
+                if current is not None and self._is_adjacent(current['last'], chunk):
+                    current['text'] = self._stitch(current['text'], chunk['text'])
+                    current['distance'] = min(current['distance'], distance)
+                    current['last'] = chunk
+                    continue
+
+                if current is not None:
+                    passages.append(current)
+                current = {'source': source, 'text': chunk['text'], 'distance': distance, 'last': chunk}
+
+            if current is not None:
+                passages.append(current)
+
+        for passage in passages:
+            del passage['last']
+        return passages
+
+    def _position(self, chunk: Dict[str, Any]) -> Tuple[int, int]:
+        metadata = chunk['metadata']
+        return metadata.get('start_char', 0), metadata.get('chunk_index', 0)
+
+    def _is_adjacent(self, previous: Dict[str, Any], chunk: Dict[str, Any]) -> bool:
+        prev_meta, meta = previous['metadata'], chunk['metadata']
+        if 'end_char' in prev_meta and 'start_char' in meta:
+            return meta['start_char'] <= prev_meta['end_char']
+        if 'chunk_index' in prev_meta and 'chunk_index' in meta:
+            return meta['chunk_index'] - prev_meta['chunk_index'] == 1
+        return False
+
+    def _stitch(self, first: str, second: str) -> str:
+        """Join two texts, writing their shared overlap only once"""
+        if second in first:
+            return first
+
+        # The longest suffix of `first` that is also a prefix of `second`
+        for size in range(min(len(first), len(second)), 0, -1):
+            if first.endswith(second[:size]):
+                return first + second[size:]
+        return f"{first}\n{second}"
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text to roughly max_tokens, preferring to end on a sentence"""
+        tokens = list(TOKEN_PATTERN.finditer(text))
+        if len(tokens) <= max_tokens:
+            return text
+
+        cut = tokens[max_tokens - 1].end()
+        sentence_ends = [match.end() for match in SENTENCE_END.finditer(text, 0, cut)]
+        if sentence_ends and sentence_ends[-1] > cut // 2:
+            cut = sentence_ends[-1]
+        return text[:cut].rstrip()
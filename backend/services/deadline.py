@@ -0,0 +1,48 @@
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class Deadline:
+    """Time budget for one request, shared by every pipeline stage it passes through.
+
+    Stages check ``remaining()`` before expensive work and, when time is
+    short, do something cheaper and record it with ``degrade`` so the
+    response can say which shortcuts were taken. A deadline created with
+    ``seconds=None`` never expires.
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+        self.degradations: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_ms(cls, milliseconds: Optional[int]) -> "Deadline":
+        return cls(milliseconds / 1000 if milliseconds is not None else None)
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (infinite when unbounded)"""
+        if self.expires_at is None:
+            return math.inf
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def degrade(self, stage: str, action: str, detail: Optional[str] = None):
+        """Record a shortcut a stage took to stay within the deadline"""
+        entry = {'stage': stage, 'action': action}
+        if detail:
+            entry['detail'] = detail
+        with self._lock:
+            self.degradations.append(entry)
+        print(f"Deadline degradation in {stage}: {action}{f' ({detail})' if detail else ''}")
+
+    @property
+    def degraded(self) -> bool:
+        with self._lock:
+            return bool(self.degradations)
@@ -0,0 +1,89 @@
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Largest Mersenne prime below 2**64; universal hashes are taken modulo it
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+class NearDuplicateFilter:
+    """Detect near-duplicate chunks with MinHash signatures and an LSH index.
+
+    Each text is reduced to word shingles, summarised by a MinHash signature
+    and bucketed by bands of that signature. Only texts sharing a bucket are
+    compared, and a pair counts as a duplicate when the estimated Jaccard
+    similarity of their shingle sets reaches ``threshold``.
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 64, bands: int = 16,
+                 shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.RandomState(seed)
+        # a, b < 2**32 keep a * hash + b within uint64 for 32-bit shingle hashes
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def _shingle_hashes(self, text: str) -> np.ndarray:
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        if len(tokens) < self.shingle_size:
+            shingles = {' '.join(tokens)}
+        else:
+            shingles = {
+                ' '.join(tokens[i:i + self.shingle_size])
+                for i in range(len(tokens) - self.shingle_size + 1)
+            }
+        return np.fromiter(
+            (zlib.crc32(shingle.encode('utf-8')) for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of the text's word shingles"""
+        hashes = self._shingle_hashes(text)
+        permuted = (np.outer(hashes, self._a) + self._b) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=0)
+
+    def find_duplicates(self, texts: List[str]) -> Dict[int, int]:
+        """Map the index of every near-duplicate text to the earlier text it duplicates"""
+        buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+        signatures = []
+        duplicates: Dict[int, int] = {}
+
+        for i, text in enumerate(texts):
+            signature = self.signature(text)
+            signatures.append(signature)
+            band_keys = [
+                (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                for band in range(self.bands)
+            ]
+
+            candidates = set()
+            for key in band_keys:
+                candidates.update(buckets.get(key, ()))
+
+            for candidate in sorted(candidates):
+                similarity = float(np.mean(signatures[candidate] == signature))
+                if similarity >= self.threshold:
+                    duplicates[i] = candidate
+                    break
+            else:
+                # Only texts that were kept are indexed, so every match points
+                # at a chunk that survives deduplication
+                for key in band_keys:
+                    buckets[key].append(i)
+
+        return duplicates
@@ -1,13 +1,46 @@
-import json
+import bisect
+import hashlib
+import mmap
+import os
 import fitz  # PyMuPDF
-from typing import Dict, Any
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Any, List, Tuple, Union
 from bs4 import BeautifulSoup
-import re
+
+from .json_records import format_path, iter_json_records, path_titles
+from .metrics import timed
+from .text_structure import BANNER_HEADING, MARKDOWN_HEADING, html_to_structured_text, parse_blocks, split_points
+
+# A section starts at a character offset in the extracted text and carries
+# its heading path, e.g. {'start': 120, 'path': ['Checkout', 'Discounts']}.
+# PDF sections are pages and additionally carry the page number. JSON
+# sections are records that also end at an offset and are chunked one by one,
+# as are the section units of structure-aware chunking.
+Section = Dict[str, Any]
+
+SECTION_LEVELS = 3
+# 'fixed' cuts text into overlapping windows of chunk_size characters;
+# 'structure' keeps markdown/HTML sections, lists and tables whole where they fit
+CHUNK_MODES = ('fixed', 'structure')
 
 class DocumentProcessor:
     """Process various document types and extract text content"""
     
-    def __init__(self):
+    def __init__(self, chunk_size: int = None, chunk_overlap: int = None, chunk_mode: str = None):
+        if chunk_size is None:
+            chunk_size = int(os.getenv("CHUNK_SIZE", "1000"))
+        if chunk_overlap is None:
+            chunk_overlap = int(os.getenv("CHUNK_OVERLAP", "200"))
+        if chunk_mode is None:
+            chunk_mode = os.getenv("CHUNK_MODE", "fixed")
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError("chunk_overlap must be at least 0 and smaller than chunk_size")
+        if chunk_mode not in CHUNK_MODES:
+            raise ValueError(f"chunk_mode must be one of {', '.join(CHUNK_MODES)}")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.chunk_mode = chunk_mode
+        
         self.supported_types = {
             'text/plain': self._process_text,
             'text/markdown': self._process_text,
@@ -23,25 +56,88 @@ class DocumentProcessor:
             processor = self._get_processor(content_type, filename)
             
             # Process the document
-            text_content = processor(content)
+            with timed('document_processor', 'extract'):
+                text_content, sections = processor(content)
+            
+            return self._build_document(filename, content_type, processor, text_content, sections,
+                                        hashlib.sha256(content).hexdigest(), len(content))
+        except Exception as e:
+            raise Exception(f"Error processing {filename}: {str(e)}")
+    
+    def process_file(self, path: str, filename: str, content_type: str) -> Dict[str, Any]:
+        """Process a document stored at ``path`` without reading it into memory as one bytes object"""
+        with open(path, 'rb') as f:
+            return self.process_stream(f, filename, content_type)
+    
+    def process_stream(self, stream: BinaryIO, filename: str, content_type: str) -> Dict[str, Any]:
+        """Process an open binary file, such as the spooled file behind an UploadFile.
+        
+        A file on disk is parsed and hashed through a read-only memory map
+        rather than copied, so only the extracted text is held in memory.
+        """
+        try:
+            processor = self._get_processor(content_type, filename)
             
-            # Chunk the content
-            chunks = self._chunk_text(text_content, filename)
+            with self._map_stream(stream) as content:
+                with timed('document_processor', 'extract'):
+                    text_content, sections = processor(content)
+                content_hash = hashlib.sha256(content).hexdigest()
+                size_bytes = len(content)
             
-            return {
-                'filename': filename,
-                'content_type': content_type,
-                'text_content': text_content,
-                'chunks': chunks,
-                'metadata': {
-                    'source': filename,
-                    'type': content_type,
-                    'chunk_count': len(chunks)
-                }
-            }
+            return self._build_document(filename, content_type, processor, text_content, sections,
+                                        content_hash, size_bytes)
         except Exception as e:
             raise Exception(f"Error processing {filename}: {str(e)}")
     
+    def _build_document(self, filename: str, content_type: str, processor, text_content: str,
+                        sections: List[Section], content_hash: str, size_bytes: int) -> Dict[str, Any]:
+        """Chunk extracted text and describe the processed document"""
+        # Chunk the content; JSON is chunked along the records it was split into
+        with timed('document_processor', 'chunk'):
+            if processor == self._process_json and sections:
+                chunks = self._chunk_records(text_content, filename, sections)
+            elif self.chunk_mode == 'structure' and processor in (self._process_text, self._process_html):
+                chunks = self._chunk_records(text_content, filename, self._structure_units(text_content))
+            else:
+                chunks = self._chunk_text(text_content, filename, self.chunk_size, self.chunk_overlap, sections)
+        
+        return {
+            'filename': filename,
+            'content_type': content_type,
+            'text_content': text_content,
+            'chunks': chunks,
+            'metadata': {
+                'source': filename,
+                'type': content_type,
+                'chunk_count': len(chunks),
+                'content_hash': content_hash,
+                'size_bytes': size_bytes
+            }
+        }
+    
+    @contextmanager
+    def _map_stream(self, stream: BinaryIO):
+        """Read-only memory map of an open file, or its bytes when it is not on disk or is empty"""
+        # A SpooledTemporaryFile still held in memory (Starlette keeps uploads
+        # up to 1MB there) would be written to disk by fileno()
+        if getattr(stream, '_rolled', True):
+            try:
+                fileno = stream.fileno()
+            except (AttributeError, OSError):
+                fileno = None
+            if fileno is not None:
+                stream.flush()
+                if os.fstat(fileno).st_size:
+                    with timed('document_processor', 'read'):
+                        content = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+                    with content:
+                        yield content
+                    return
+        with timed('document_processor', 'read'):
+            stream.seek(0)
+            content = stream.read()
+        yield content
+    
     def _get_processor(self, content_type: str, filename: str):
         """Determine appropriate processor"""
         if content_type in self.supported_types:
@@ -60,57 +156,205 @@ class DocumentProcessor:
         else:
             return self._process_text  # Default fallback
     
-    def _process_text(self, content: bytes) -> str:
+    # Text processors take bytes or a read-only memory map of the file
+    def _process_text(self, content: bytes) -> Tuple[str, List[Section]]:
         """Process plain text or markdown files"""
-        return content.decode('utf-8')
+        text = str(content, 'utf-8')
+        return text, self._extract_text_sections(text)
     
-    def _process_json(self, content: bytes) -> str:
-        """Process JSON files"""
+    def _process_json(self, content: bytes) -> Tuple[str, List[Section]]:
+        """Process JSON files into one compact line per record (endpoint, object or group of values)"""
+        text = str(content, 'utf-8-sig')
         try:
-            data = json.loads(content.decode('utf-8'))
-            # Convert JSON to readable text format
-            return json.dumps(data, indent=2)
-        except json.JSONDecodeError:
-            return content.decode('utf-8')
+            records = list(iter_json_records(text, self.chunk_size))
+        except ValueError:
+            # Not valid JSON; index it as plain text
+            return text, []
+        
+        lines = []
+        sections = []
+        offset = 0
+        for path, value in records:
+            json_path = format_path(path)
+            line = f"{json_path} {value}"
+            sections.append({
+                'start': offset,
+                'end': offset + len(line),
+                'path': path_titles(path),
+                'json_path': json_path
+            })
+            lines.append(line)
+            offset += len(line) + 1
+        return '\n'.join(lines), sections
     
-    def _process_html(self, content: bytes) -> str:
+    def _process_html(self, content: bytes) -> Tuple[str, List[Section]]:
         """Process HTML files"""
         try:
+            if self.chunk_mode == 'structure':
+                # Keep headings, lists and tables visible to the structure chunker
+                text = html_to_structured_text(str(content, 'utf-8'))
+                return text, self._extract_text_sections(text)
             # Use BeautifulSoup to extract text from HTML
-            soup = BeautifulSoup(content.decode('utf-8'), 'html.parser')
+            soup = BeautifulSoup(str(content, 'utf-8'), 'html.parser')
             # Remove script and style elements
             for script in soup(["script", "style"]):
                 script.decompose()
+            headings = [
+                (int(tag.name[1]), self._collapse_whitespace(tag.get_text()))
+                for tag in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+            ]
             # Get text and clean it up
-            text = soup.get_text()
-            # Clean up whitespace
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = ' '.join(chunk for chunk in chunks if chunk)
-            return text
+            text = self._collapse_whitespace(soup.get_text())
+            return text, self._locate_headings(text, headings)
         except:
-            return content.decode('utf-8')
+            return str(content, 'utf-8'), []
     
-    def _process_pdf(self, content: bytes) -> str:
-        """Process PDF files"""
+    def _process_pdf(self, content: Union[bytes, mmap.mmap]) -> Tuple[str, List[Section]]:
+        """Process PDF files, given as bytes or a memory map of the file"""
         try:
-            doc = fitz.open(stream=content, filetype="pdf")
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            doc.close()
-            return text
+            # The view must be released, and the document closed, before the map is
+            with memoryview(content) as view:
+                doc = fitz.open(stream=view, filetype="pdf")
+                text = ""
+                sections = []
+                for page in doc:
+                    sections.append({
+                        'start': len(text),
+                        'path': [f"Page {page.number + 1}"],
+                        'page': page.number + 1
+                    })
+                    text += page.get_text()
+                doc.close()
+            return text, sections
         except:
             raise Exception("Failed to process PDF file")
     
-    def _chunk_text(self, text: str, source: str, chunk_size: int = 1000, overlap: int = 200) -> list:
-        """Split text into chunks for vector storage"""
+    def _collapse_whitespace(self, text: str) -> str:
+        """Join the non-empty phrases of extracted HTML text with single spaces"""
+        lines = (line.strip() for line in text.splitlines())
+        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+        return ' '.join(chunk for chunk in chunks if chunk)
+    
+    def _extract_text_sections(self, text: str) -> List[Section]:
+        """Find markdown '#' headings and '=== TITLE ===' banners with their offsets"""
+        sections = []
+        path: List[Tuple[int, str]] = []
+        offset = 0
+        in_code_block = False
+        
+        for line in text.splitlines(keepends=True):
+            stripped = line.strip()
+            if stripped.startswith('```'):
+                in_code_block = not in_code_block
+            elif not in_code_block:
+                heading = None
+                markdown = MARKDOWN_HEADING.match(stripped)
+                banner = BANNER_HEADING.match(stripped)
+                if markdown:
+                    heading = (len(markdown.group(1)), markdown.group(2))
+                elif banner:
+                    heading = (1, banner.group(1))
+                
+                if heading:
+                    level, title = heading
+                    while path and path[-1][0] >= level:
+                        path.pop()
+                    path.append(heading)
+                    sections.append({'start': offset, 'path': [t for _, t in path]})
+            offset += len(line)
+        
+        return sections
+    
+    def _locate_headings(self, text: str, headings: List[Tuple[int, str]]) -> List[Section]:
+        """Map HTML headings, in document order, to offsets in the extracted text"""
+        sections = []
+        path: List[Tuple[int, str]] = []
+        cursor = 0
+        
+        for level, title in headings:
+            if not title:
+                continue
+            position = text.find(title, cursor)
+            if position < 0:
+                continue
+            while path and path[-1][0] >= level:
+                path.pop()
+            path.append((level, title))
+            sections.append({'start': position, 'path': [t for _, t in path]})
+            cursor = position + len(title)
+        
+        return sections
+    
+    def _section_metadata(self, sections: List[Section], starts: List[int], start: int, end: int) -> Dict[str, Any]:
+        """Describe the section covering the largest part of text[start:end].
+        
+        Coverage is compared level by level, so a parent heading whose
+        subsections together dominate the chunk wins over a larger sibling leaf.
+        """
+        if not sections:
+            return {}
+        
+        first = max(bisect.bisect_right(starts, start) - 1, 0)
+        covered = []
+        for i in range(first, len(sections)):
+            if sections[i]['start'] >= end:
+                break
+            section_end = sections[i + 1]['start'] if i + 1 < len(sections) else end
+            overlap = min(end, section_end) - max(start, sections[i]['start'])
+            if overlap > 0:
+                covered.append((sections[i], overlap))
+        
+        path: List[str] = []
+        while True:
+            totals: Dict[str, int] = {}
+            for section, overlap in covered:
+                if len(section['path']) > len(path) and section['path'][:len(path)] == path:
+                    title = section['path'][len(path)]
+                    totals[title] = totals.get(title, 0) + overlap
+            if not totals:
+                break
+            path.append(max(totals, key=totals.get))
+        
+        if not path:
+            return {}
+        best = next(section for section, _ in covered if section['path'][:len(path)] == path)
+        
+        metadata = self._path_metadata(path)
+        if 'page' in best:
+            metadata['page'] = best['page']
+        return metadata
+    
+    def _path_metadata(self, path: List[str]) -> Dict[str, Any]:
+        """Section metadata for a heading path"""
+        if not path:
+            return {}
+        # Chroma can only match metadata values exactly, so the first heading
+        # levels are stored individually to allow scoping to a parent section
+        metadata = {
+            'section': ' > '.join(path),
+            'section_title': path[-1]
+        }
+        for level, title in enumerate(path[:SECTION_LEVELS], start=1):
+            metadata[f'section_l{level}'] = title
+        return metadata
+    
+    def _chunk_text(self, text: str, source: str, chunk_size: int = 1000, overlap: int = 200,
+                    sections: List[Section] = None) -> list:
+        """Split text into chunks for vector storage.
+        
+        A chunk ends after the last sentence or line break in its second
+        half, if there is one. The next chunk starts ``overlap`` characters
+        before that end, but always after the previous chunk's start, and
+        no chunk follows the one that reaches the end of the text.
+        """
         chunks = []
+        sections = sections or []
+        section_starts = [section['start'] for section in sections]
         
         # Simple chunking by character count with overlap
         start = 0
         while start < len(text):
-            end = start + chunk_size
+            end = min(start + chunk_size, len(text))
             chunk = text[start:end]
             
             # Try to break at sentence boundaries
@@ -119,20 +363,156 @@ class DocumentProcessor:
                 last_newline = chunk.rfind('\n')
                 break_point = max(last_period, last_newline)
                 
-                if break_point > start + chunk_size // 2:
-                    chunk = text[start:break_point + 1]
-                    end = break_point + 1
+                if break_point > chunk_size // 2:
+                    chunk = text[start:start + break_point + 1]
+                    end = start + break_point + 1
+            
+            metadata = {
+                'source': source,
+                'chunk_index': len(chunks),
+                'start_char': start,
+                'end_char': end
+            }
+            metadata.update(self._section_metadata(sections, section_starts, start, end))
             
             chunks.append({
                 'text': chunk.strip(),
-                'metadata': {
+                'metadata': metadata
+            })
+            
+            if end >= len(text):
+                break
+            # A sentence break can shorten the chunk below the overlap; always move forward
+            start = max(end - overlap, start + 1)
+        
+        return chunks
+    
+    def _chunk_records(self, text: str, source: str, records: List[Section]) -> list:
+        """One chunk per record; a record longer than chunk_size is split like plain text.
+        
+        A record's optional 'prefix' (e.g. a heading breadcrumb) is prepended
+        to the text of each of its chunks and counts towards chunk_size, but
+        not towards the character offsets.
+        """
+        chunks = []
+        for record in records:
+            start, end = record['start'], record['end']
+            prefix = record.get('prefix', '')
+            if end - start + len(prefix) <= self.chunk_size:
+                pieces = [(start, end, text[start:end])]
+            else:
+                # The prefix is repeated on every piece, so it comes out of each piece's budget
+                room = max(self.chunk_size - len(prefix), 1)
+                pieces = [
+                    (start + piece['metadata']['start_char'], start + piece['metadata']['end_char'], piece['text'])
+                    for piece in self._chunk_text(text[start:end], source, room, min(self.chunk_overlap, room // 2))
+                ]
+            
+            for piece_start, piece_end, piece_text in pieces:
+                metadata = {
                     'source': source,
                     'chunk_index': len(chunks),
-                    'start_char': start,
-                    'end_char': end
+                    'start_char': piece_start,
+                    'end_char': piece_end
                 }
-            })
+                if 'json_path' in record:
+                    metadata['json_path'] = record['json_path']
+                metadata.update(self._path_metadata(record['path']))
+                chunks.append({'text': prefix + piece_text, 'metadata': metadata})
+        
+        return chunks
+    
+    def _structure_units(self, text: str) -> List[Section]:
+        """Split markdown-like text into section units for structure-aware chunking.
+        
+        A section (heading plus body) that fits chunk_size is one unit,
+        labelled with its own heading path; sections are never merged with
+        their siblings. A bare heading directly followed by its first
+        subsection, and a one-line title before the first heading, are
+        carried into the section below them. Larger sections are packed block
+        by block, so paragraphs, lists and tables are only cut when one of
+        them alone exceeds chunk_size. Sizes include the breadcrumb prefix.
+        """
+        sections = []
+        path: List[Tuple[int, str]] = []
+        current = {'path': [], 'blocks': []}
+        for block in parse_blocks(text):
+            if block['kind'] == 'heading':
+                if current['blocks']:
+                    sections.append(current)
+                while path and path[-1][0] >= block['level']:
+                    path.pop()
+                path.append((block['level'], block['title']))
+                current = {'path': [t for _, t in path], 'blocks': []}
+            current['blocks'].append(block)
+        if current['blocks']:
+            sections.append(current)
+        
+        units: List[Section] = []
+        carried = None
+        for section in sections:
+            blocks, path, lead = section['blocks'], section['path'], section['path']
+            if carried and path[:len(carried['path'])] == carried['path']:
+                blocks = carried['blocks'] + blocks
+                lead = carried['lead']
+            elif carried:
+                units.extend(self._section_units(text, carried['blocks'], carried['path'], carried['lead']))
+            carried = None
             
-            start = end - overlap
+            bare_heading = all(block['kind'] == 'heading' for block in section['blocks'])
+            title_line = not path and len(blocks) == 1 and '\n' not in text[blocks[0]['start']:blocks[0]['end']]
+            if bare_heading or title_line:
+                carried = {'blocks': blocks, 'path': path, 'lead': lead}
+            else:
+                units.extend(self._section_units(text, blocks, path, lead))
+        if carried:
+            units.extend(self._section_units(text, carried['blocks'], carried['path'], carried['lead']))
+        return units
+    
+    def _breadcrumb(self, path: List[str], opens_with_heading: bool) -> str:
+        """Prefix naming the headings above a unit's first line; a heading it opens with is already in its text"""
+        crumbs = path[:-1] if opens_with_heading else path
+        return ' > '.join(crumbs) + '\n' if crumbs else ''
+    
+    def _section_units(self, text: str, blocks: List[Dict[str, Any]], path: List[str],
+                       lead: List[str]) -> List[Section]:
+        """One unit for a section that fits, otherwise its blocks packed into several.
+        
+        ``path`` labels the units; ``lead`` is the heading path at the first
+        block, which differs when ancestor headings were carried in.
+        """
+        prefix = self._breadcrumb(lead, blocks[0]['kind'] == 'heading')
+        if blocks[-1]['end'] - blocks[0]['start'] + len(prefix) <= self.chunk_size:
+            return [{'start': blocks[0]['start'], 'end': blocks[-1]['end'], 'path': path, 'prefix': prefix}]
+        return self._pack_blocks(text, blocks, path, lead)
+    
+    def _pack_blocks(self, text: str, blocks: List[Dict[str, Any]], path: List[str],
+                     lead: List[str]) -> List[Section]:
+        """Greedily pack the blocks of an oversized section into units of at most chunk_size"""
+        continuation = self._breadcrumb(path, False)
+        pieces = []
+        for block in blocks:
+            size = block['end'] - block['start'] + len(continuation)
+            if size <= self.chunk_size or block['kind'] not in ('list', 'table'):
+                pieces.append((block['start'], block['end'], '', block['kind'] == 'heading'))
+                continue
+            cuts, repeated = split_points(text, block)
+            bounds = [block['start']] + cuts + [block['end']]
+            for i in range(len(bounds) - 1):
+                piece_end = bounds[i] + len(text[bounds[i]:bounds[i + 1]].rstrip())
+                pieces.append((bounds[i], piece_end, repeated if i else '', False))
         
-        return chunks
\ No newline at end of file
+        units: List[Section] = []
+        unit = None
+        for start, end, repeated, is_heading in pieces:
+            # Headings always stay with the block after them
+            if unit and (unit['heading_only'] or end - unit['start'] + len(unit['prefix']) <= self.chunk_size):
+                unit['end'] = end
+                unit['heading_only'] = unit['heading_only'] and is_heading
+                continue
+            prefix = self._breadcrumb(lead, is_heading) if unit is None else continuation + repeated
+            unit = {'start': start, 'end': end, 'path': path, 'prefix': prefix, 'heading_only': is_heading}
+            units.append(unit)
+        for unit in units:
+            del unit['heading_only']
+        return units
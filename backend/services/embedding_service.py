@@ -0,0 +1,343 @@
+"""
+Shared embedding model served over a Unix socket.
+
+Every uvicorn worker that builds a KnowledgeBase would otherwise load its
+own SentenceTransformer copy. Run one embedding service instead and point
+the workers at it with EMBEDDING_SOCKET:
+
+    cd backend && python -m services.embedding_service --socket /tmp/qa-embeddings.sock
+    EMBEDDING_SOCKET=/tmp/qa-embeddings.sock uvicorn main:app --workers 4
+
+Concurrent encode requests are collected into micro-batches for up to
+``max_wait_ms`` so single-query encodes share one forward pass. Bulk
+requests (knowledge base builds) are split into batch-sized slices that
+yield to interactive requests between slices.
+
+Wire format: every message is a 4-byte big-endian length followed by the
+payload. Requests are JSON; replies are a JSON header, followed for encode
+requests by a second message holding the raw embedding bytes.
+"""
+
+import argparse
+import functools
+import itertools
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+DEFAULT_SOCKET_PATH = '/tmp/qa-embeddings.sock'
+
+_LENGTH = struct.Struct('>I')
+# Interactive requests are batched ahead of slices of bulk requests
+_INTERACTIVE, _BULK, _STOP = 0, 1, 2
+
+
+@functools.lru_cache(maxsize=4)
+def load_embedding_model(name: str):
+    """Load a sentence-transformers model once per process"""
+    # Imported here so processes that only talk to the service never load torch
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name)
+
+
+def _send(sock: socket.socket, payload: bytes):
+    sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray()
+    while len(buffer) < size:
+        data = sock.recv(min(size - len(buffer), 1 << 20))
+        if not data:
+            raise ConnectionError("Embedding service closed the connection")
+        buffer.extend(data)
+    return bytes(buffer)
+
+
+def _recv(sock: socket.socket) -> bytes:
+    (size,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    return _recv_exact(sock, size)
+
+
+class MicroBatcher:
+    """Coalesce concurrent encode calls into batches for one model"""
+
+    def __init__(self, model, max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.PriorityQueue[Tuple[int, int, Optional[List[str]], Optional[Future]]]" = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._stats_lock = threading.Lock()
+        self._stats = {'requests': 0, 'texts': 0, 'batches': 0, 'max_batch': 0, 'encode_seconds': 0.0}
+        self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+        self._thread.start()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embed texts, sharing forward passes with concurrent callers"""
+        with self._stats_lock:
+            self._stats['requests'] += 1
+            self._stats['texts'] += len(texts)
+        if not texts:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        priority = _INTERACTIVE if len(texts) <= self.max_batch_size else _BULK
+        futures = []
+        for start in range(0, len(texts), self.max_batch_size):
+            future: Future = Future()
+            self._queue.put((priority, next(self._sequence), texts[start:start + self.max_batch_size], future))
+            futures.append(future)
+        parts = [future.result() for future in futures]
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def _next_batch(self) -> List[Tuple[List[str], Future]]:
+        priority, sequence, texts, future = self._queue.get()
+        if priority == _STOP:
+            return []
+        batch = [(texts, future)]
+        size = len(texts)
+        wait_until = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = wait_until - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item[0] == _STOP or size + len(item[2]) > self.max_batch_size:
+                # Leave it for the next batch
+                self._queue.put(item)
+                break
+            batch.append((item[2], item[3]))
+            size += len(item[2])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            texts = [text for batch_texts, _ in batch for text in batch_texts]
+            started = time.perf_counter()
+            try:
+                embeddings = np.asarray(
+                    self.model.encode(texts, batch_size=self.max_batch_size), dtype=np.float32
+                )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            with self._stats_lock:
+                self._stats['batches'] += 1
+                self._stats['max_batch'] = max(self._stats['max_batch'], len(texts))
+                self._stats['encode_seconds'] += time.perf_counter() - started
+            offset = 0
+            for batch_texts, future in batch:
+                future.set_result(embeddings[offset:offset + len(batch_texts)])
+                offset += len(batch_texts)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['avg_batch'] = round(stats['texts'] / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['encode_seconds'] = round(stats['encode_seconds'], 3)
+        stats['queued'] = self._queue.qsize()
+        return stats
+
+    def close(self):
+        self._queue.put((_STOP, next(self._sequence), None, None))
+        self._thread.join(timeout=5)
+
+
+class _EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    """Serve requests on one persistent client connection"""
+
+    def handle(self):
+        server: EmbeddingServer = self.server
+        while True:
+            try:
+                request = json.loads(_recv(self.request))
+            except (ConnectionError, OSError):
+                return
+            try:
+                if request.get('op') == 'encode':
+                    embeddings = server.batcher.encode([str(text) for text in request['texts']])
+                    header = {'shape': list(embeddings.shape), 'dtype': 'float32'}
+                    _send(self.request, json.dumps(header).encode('utf-8'))
+                    _send(self.request, np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+                elif request.get('op') == 'info':
+                    _send(self.request, json.dumps(server.info()).encode('utf-8'))
+                else:
+                    _send(self.request, json.dumps({'error': f"Unknown op: {request.get('op')}"}).encode('utf-8'))
+            except (ConnectionError, OSError):
+                return
+            except Exception as e:
+                _send(self.request, json.dumps({'error': f"Error encoding texts: {str(e)}"}).encode('utf-8'))
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server holding the only copy of the embedding model"""
+
+    daemon_threads = True
+    # Every worker thread holds a connection; a short backlog refuses bursts of new ones
+    request_queue_size = 128
+
+    def __init__(self, socket_path: str, model_name: str = DEFAULT_EMBEDDING_MODEL,
+                 max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        self.socket_path = socket_path
+        self.model_name = model_name
+        model = load_embedding_model(model_name)
+        self.dimension = model.get_sentence_embedding_dimension()
+        self.batcher = MicroBatcher(model, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+        # A socket file left by a crashed server would make bind fail
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _EmbeddingRequestHandler)
+        os.chmod(socket_path, 0o660)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            'model': self.model_name,
+            'dimension': self.dimension,
+            'pid': os.getpid(),
+            'batching': self.batcher.stats()
+        }
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class EmbeddingClient:
+    """Drop-in for SentenceTransformer.encode backed by the embedding service.
+
+    Each thread keeps its own connection so concurrent queries reach the
+    server together and can be batched. Bulk encodes are sent in slices of
+    ``request_slice_size`` texts, so ``timeout`` bounds one slice rather
+    than a whole knowledge base build.
+    """
+
+    def __init__(self, socket_path: str, model_name: Optional[str] = None,
+                 timeout: float = 60.0, connect_timeout: Optional[float] = None,
+                 request_slice_size: int = 256):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.request_slice_size = request_slice_size
+        if connect_timeout is None:
+            connect_timeout = float(os.getenv("EMBEDDING_CONNECT_TIMEOUT", "30"))
+        self._local = threading.local()
+
+        # Workers may start before the service finishes loading its model
+        give_up_at = time.monotonic() + connect_timeout
+        while True:
+            try:
+                info = self.info()
+                break
+            except OSError as e:
+                if time.monotonic() >= give_up_at:
+                    raise ConnectionError(f"Embedding service at {socket_path} is not reachable: {str(e)}")
+                time.sleep(0.5)
+
+        if model_name and info['model'] != model_name:
+            raise ValueError(f"Embedding service at {socket_path} serves {info['model']}, not {model_name}")
+        self.model_name = info['model']
+        self.dimension = info['dimension']
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+        return sock
+
+    def _reset_connection(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def _call(self, request: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[bytes]]:
+        # Requests are idempotent, so one retry on a fresh connection covers a restarted server
+        for attempt in range(2):
+            try:
+                sock = self._connection()
+                _send(sock, json.dumps(request).encode('utf-8'))
+                header = json.loads(_recv(sock))
+                payload = _recv(sock) if 'shape' in header else None
+                break
+            except OSError:
+                self._reset_connection()
+                if attempt:
+                    raise
+        if 'error' in header:
+            raise Exception(header['error'])
+        return header, payload
+
+    def info(self) -> Dict[str, Any]:
+        return self._call({'op': 'info'})[0]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs) -> np.ndarray:
+        """Embed one string (1-d result) or a list of strings (2-d result).
+
+        Batching is decided by the server, so ``batch_size`` is ignored.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        parts = []
+        for start in range(0, len(texts), self.request_slice_size):
+            header, payload = self._call({'op': 'encode', 'texts': texts[start:start + self.request_slice_size]})
+            parts.append(np.frombuffer(payload, dtype=header['dtype']).reshape(header['shape']))
+        embeddings = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        return embeddings[0] if single else embeddings
+
+    def stats(self) -> Dict[str, Any]:
+        info = self.info()
+        return {'socket': self.socket_path, 'model': info['model'], 'server_pid': info['pid'], **info['batching']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the embedding model to backend workers over a Unix socket")
+    parser.add_argument("--socket", default=os.getenv("EMBEDDING_SOCKET", DEFAULT_SOCKET_PATH))
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL))
+    parser.add_argument("--max-batch-size", type=int, default=64, help="Most texts encoded in one forward pass")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="How long a request may wait for others to join its batch")
+    args = parser.parse_args()
+
+    server = EmbeddingServer(args.socket, args.model, args.max_batch_size, args.max_wait_ms)
+    print(f"Embedding service for {args.model} listening on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
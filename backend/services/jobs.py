@@ -0,0 +1,82 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class JobStore:
+    """Run work in the background and keep the outcome for later retrieval.
+
+    Finished jobs are retained up to ``max_jobs``; beyond that the oldest
+    finished jobs are forgotten so memory stays bounded.
+    """
+
+    def __init__(self, max_workers: int = 2, max_jobs: int = 256):
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._events: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> str:
+        """Schedule fn and return the id used to fetch its result"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'status': 'pending',
+                'result': None,
+                'error': None,
+                'created_at': time.time(),
+                'finished_at': None
+            }
+            self._events[job_id] = threading.Event()
+            self._evict()
+
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id: str, fn: Callable[..., Any], args, kwargs):
+        try:
+            result, error, status = fn(*args, **kwargs), None, 'done'
+        except Exception as e:
+            print(f"Background job {job_id} failed: {e}")
+            result, error, status = None, str(e), 'failed'
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(status=status, result=result, error=error, finished_at=time.time())
+            event = self._events.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    def _evict(self):
+        """Drop the oldest finished jobs once over capacity (caller holds the lock)"""
+        if len(self._jobs) <= self.max_jobs:
+            return
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[job_id]['status'] != 'pending':
+                del self._jobs[job_id]
+
+    def get(self, job_id: str, wait: float = 0) -> Optional[Dict[str, Any]]:
+        """Return a snapshot of the job, optionally blocking up to ``wait`` seconds for it to finish"""
+        with self._lock:
+            event = self._events.get(job_id)
+        if event is not None and wait > 0:
+            event.wait(wait)
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return {'jobs': len(self._jobs), 'by_status': counts}
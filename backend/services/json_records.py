@@ -0,0 +1,246 @@
+"""
+Structure-aware splitting of JSON documents into self-contained records.
+
+The document text is held as one string, but it is not parsed into a
+single object tree: a value is decoded only when its raw text is within a
+few times the record budget, and each value is decoded at most once.
+Larger containers are split by scanning the text for their members, so
+the parsed objects alive at a time stay around the size of a record. A
+value that fits the size budget becomes one compact record; anything
+larger is split into its members. Objects whose members
+are all sizeable objects (e.g. the endpoints of an API spec) are split
+even when they fit, giving one record per endpoint. Small sibling values
+are grouped under their parent's path so they do not end up as tiny chunks.
+
+Records are ``(path, compact_json)``; paths are lists of object keys,
+array indices and, for a group of array elements, slices.
+"""
+
+import json
+import re
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+PathPart = Union[str, int, slice]
+JsonRecord = Tuple[List[PathPart], str]
+# (key or index, decoded value, compact form, walk) for a member of a container being split;
+# value and compact form are None when it is too large to decode, and walk() yields its own records
+Member = Tuple[PathPart, Any, Optional[str], Callable[[], Iterator[JsonRecord]]]
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRUCTURE = re.compile(r'[{}\[\]"]')
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_-]*$')
+_DECODER = json.JSONDecoder()
+
+# Values whose raw text is this many times the budget are never decoded whole;
+# indentation rarely makes the compact form that much smaller
+_MAX_EXPANSION = 4
+_TOO_LARGE = object()
+
+
+def compact_json(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def format_path(path: List[PathPart]) -> str:
+    """JSONPath-style rendering, e.g. $.endpoints.cart.add_item or $.items[3:8]"""
+    parts = ['$']
+    for part in path:
+        if isinstance(part, slice):
+            parts.append(f"[{part.start}:{part.stop}]")
+        elif isinstance(part, int):
+            parts.append(f"[{part}]")
+        elif _IDENTIFIER.match(part):
+            parts.append(f".{part}")
+        else:
+            parts.append(f"[{json.dumps(part, ensure_ascii=False)}]")
+    return ''.join(parts)
+
+
+def path_titles(path: List[PathPart]) -> List[str]:
+    """Path as heading-style titles, with array positions attached to their key"""
+    titles: List[str] = []
+    for part in path:
+        if isinstance(part, (int, slice)):
+            index = f"[{part}]" if isinstance(part, int) else f"[{part.start}:{part.stop}]"
+            if titles:
+                titles[-1] += index
+            else:
+                titles.append(index)
+        else:
+            titles.append(part)
+    return titles
+
+
+class _RecordWalker:
+    def __init__(self, text: str, max_chars: int, min_record_chars: int):
+        self.text = text
+        self.max_chars = max_chars
+        self.min_record_chars = min_record_chars
+
+    def _skip(self, position: int) -> int:
+        return _WHITESPACE.match(self.text, position).end()
+
+    def _value_end(self, start: int) -> int:
+        """Index just past the value at ``start``, found without decoding containers"""
+        if self.text[start] not in '{[':
+            return _DECODER.raw_decode(self.text, start)[1]
+        depth = 0
+        position = start
+        while True:
+            match = _STRUCTURE.search(self.text, position)
+            if match is None:
+                raise ValueError(f"Unterminated JSON container at offset {start}")
+            if match.group() == '"':
+                string = _STRING.match(self.text, match.start())
+                if string is None:
+                    raise ValueError(f"Unterminated JSON string at offset {match.start()}")
+                position = string.end()
+                continue
+            depth += 1 if match.group() in '{[' else -1
+            position = match.end()
+            if depth == 0:
+                return position
+
+    def _budget(self, path: List[PathPart]) -> int:
+        # Every record is written as "<path> <json>"
+        return self.max_chars - len(format_path(path)) - 1
+
+    def _decode(self, start: int, end: int, path: List[PathPart]):
+        """The value at ``start`` if its raw text is small enough to decode whole, else _TOO_LARGE"""
+        if end - start > self._budget(path) * _MAX_EXPANSION:
+            return _TOO_LARGE
+        return _DECODER.raw_decode(self.text, start)[0]
+
+    def _members(self, start: int) -> List[Tuple[PathPart, int, int]]:
+        """(key or index, value start, value end) for each member of the container at ``start``"""
+        is_object = self.text[start] == '{'
+        closing = '}' if is_object else ']'
+        members = []
+        position = self._skip(start + 1)
+        if self.text[position] == closing:
+            return members
+        while True:
+            if is_object:
+                key, position = _DECODER.raw_decode(self.text, position)
+                if not isinstance(key, str):
+                    raise ValueError(f"Object keys must be strings (offset {position})")
+                position = self._skip(position)
+                if self.text[position] != ':':
+                    raise ValueError(f"Expected ':' at offset {position}")
+                position = self._skip(position + 1)
+            else:
+                key = len(members)
+            end = self._value_end(position)
+            members.append((key, position, end))
+            position = self._skip(end)
+            if self.text[position] == ',':
+                position = self._skip(position + 1)
+            elif self.text[position] == closing:
+                return members
+            else:
+                raise ValueError(f"Expected ',' or '{closing}' at offset {position}")
+
+    def _is_record_collection(self, values: List, compacts: List[str]) -> bool:
+        """Whether every member is a container and they are sizeable on average"""
+        if len(values) < 2 or not all(isinstance(value, (dict, list)) for value in values):
+            return False
+        return sum(len(compact) for compact in compacts) / len(compacts) >= self.min_record_chars
+
+    def walk(self, start: int, end: int, path: List[PathPart]) -> Iterator[JsonRecord]:
+        value = self._decode(start, end, path)
+        if value is not _TOO_LARGE:
+            yield from self._walk_value(value, path)
+            return
+        if self.text[start] not in '{[':
+            # A scalar too long for one record is still one record; the chunker splits it
+            yield path, compact_json(_DECODER.raw_decode(self.text, start)[0])
+            return
+
+        spans = self._members(start)
+
+        def members():
+            # Decoded one at a time, as the grouping reaches them
+            for key, member_start, member_end in spans:
+                member_path = path + [key]
+                member = self._decode(member_start, member_end, member_path)
+                if member is _TOO_LARGE:
+                    yield key, None, None, lambda s=member_start, e=member_end, p=member_path: self.walk(s, e, p)
+                else:
+                    compact = compact_json(member)
+                    yield key, member, compact, lambda v=member, c=compact, p=member_path: self._walk_value(v, p, c)
+
+        yield from self._walk_members(members(), len(spans), path, self.text[start] == '{')
+
+    def _walk_value(self, value, path: List[PathPart], compact: Optional[str] = None) -> Iterator[JsonRecord]:
+        """Records of a value that has already been decoded"""
+        compact = compact_json(value) if compact is None else compact
+        if not isinstance(value, (dict, list)):
+            yield path, compact
+            return
+
+        items = list(value.items()) if isinstance(value, dict) else list(enumerate(value))
+        compacts = [compact_json(member) for _, member in items]
+        if len(compact) <= self._budget(path) and not self._is_record_collection([m for _, m in items], compacts):
+            yield path, compact
+            return
+        members = [
+            (key, member, member_compact, lambda v=member, c=member_compact, p=path + [key]: self._walk_value(v, p, c))
+            for (key, member), member_compact in zip(items, compacts)
+        ]
+        yield from self._walk_members(members, len(members), path, isinstance(value, dict))
+
+    def _walk_members(
+        self, members: Iterable[Member], count: int, path: List[PathPart], is_object: bool
+    ) -> Iterator[JsonRecord]:
+        """Group small members into records under ``path``; large or sizeable container members get their own"""
+        budget = self._budget(path)
+        if not is_object:
+            # A group of elements is recorded under its slice, e.g. $.items[120:135]
+            budget -= len(f"[{count}:{count}]")
+        group: List[Tuple[PathPart, str]] = []
+        group_size = 2
+
+        def flush():
+            if len(group) == 1:
+                key, compact = group[0]
+                return path + [key], compact
+            if is_object:
+                return path, '{' + ','.join(f"{compact_json(key)}:{compact}" for key, compact in group) + '}'
+            return path + [slice(group[0][0], group[-1][0] + 1)], '[' + ','.join(c for _, c in group) + ']'
+
+        for key, value, compact, walk in members:
+            fits = compact is not None and len(compact) <= self._budget(path + [key])
+            own_record = not fits or (isinstance(value, (dict, list)) and len(compact) >= self.min_record_chars)
+            if own_record:
+                if group:
+                    yield flush()
+                    group, group_size = [], 2
+                yield from walk()
+                continue
+
+            entry_size = len(compact) + 1 + (len(compact_json(key)) + 1 if is_object else 0)
+            if group and group_size + entry_size > budget:
+                yield flush()
+                group, group_size = [], 2
+            group.append((key, compact))
+            group_size += entry_size
+
+        if group:
+            yield flush()
+
+
+def iter_json_records(text: str, max_chars: int, min_record_chars: Optional[int] = None) -> Iterator[JsonRecord]:
+    """Split a JSON document into records of at most ``max_chars`` characters (path included).
+
+    Raises ValueError (json.JSONDecodeError included) for malformed input;
+    records before the error may already have been yielded.
+    """
+    walker = _RecordWalker(text, max_chars, min_record_chars or max(max_chars // 8, 1))
+    start = walker._skip(0)
+    if start == len(text):
+        raise ValueError("Empty JSON document")
+    end = walker._value_end(start)
+    if walker._skip(end) != len(text):
+        raise ValueError(f"Extra data after JSON value at offset {end}")
+    yield from walker.walk(start, end, [])
@@ -1,121 +1,1106 @@
 import chromadb
+import numpy as np
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Set
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
 import uuid
 import os
 
+from .cache import ResultCache
+from .concurrency import ReadWriteLock, SingleFlight, store_lock
+from .deadline import Deadline
+from .dedup import NearDuplicateFilter
+from .embedding_service import DEFAULT_EMBEDDING_MODEL, EmbeddingClient, load_embedding_model
+from .maintenance import maintenance_lock
+from .metrics import timed
+from .snapshot import Snapshot, SnapshotError, write_snapshot
+from .tracing import propagate
+
+# Chunk metadata recorded by DocumentProcessor that is carried into the index;
+# character offsets let the context packer stitch overlapping chunks back together
+CHUNK_METADATA_KEYS = (
+    'start_char', 'end_char',
+    'section', 'section_title', 'section_l1', 'section_l2', 'section_l3', 'page', 'json_path'
+)
+
+# Document-level metadata copied onto each of its chunks
+DOCUMENT_METADATA_KEYS = ('product',)
+
+# Query filter name -> chunk metadata fields it matches against
+FILTER_FIELDS = {
+    'sources': ('source',),
+    'content_types': ('content_type',),
+    'products': ('product',),
+    'sections': ('section', 'section_title', 'section_l1', 'section_l2', 'section_l3'),
+    'pages': ('page',)
+}
+
+# With less time than this left on a request deadline, fewer neighbours are fetched
+QUERY_SHORT_DEADLINE_SECONDS = 0.5
+
+# Neighbours fetched per requested result, so that collapsing text repeated
+# across sources still leaves n_results distinct chunks
+QUERY_DEDUP_OVERFETCH = 2
+
+# How documents are assigned to shards: by a hash of the source name, or of
+# the document's ``product`` metadata so a product's sources share a shard
+SHARD_STRATEGIES = ('source', 'product')
+
+# The default project keeps the original collection name so existing stores
+# stay readable; other projects get their own collections alongside it
+DEFAULT_PROJECT = 'default'
+BASE_COLLECTION_NAME = 'qa_documents'
+# No underscores, so project collections never collide with __shard_/__shadow_ names
+PROJECT_NAME_PATTERN = re.compile(r'^[a-z0-9]([a-z0-9-]{0,38}[a-z0-9])?$')
+
+# Versions are unique across every knowledge base in the process, so a
+# project that is closed and reopened never reuses a cached result
+_KB_VERSIONS = itertools.count(1)
+
+# Shadow and retired collections that a rebuild in this process is still
+# filling or swapping. Another instance opened for the same project (after
+# eviction) must not drop them as leftovers of an interrupted rebuild.
+_ACTIVE_COLLECTIONS: Set[str] = set()
+_ACTIVE_COLLECTIONS_GUARD = threading.Lock()
+
+def _mark_active(name: str):
+    with _ACTIVE_COLLECTIONS_GUARD:
+        _ACTIVE_COLLECTIONS.add(name)
+
+def _mark_inactive(names: List[str]):
+    with _ACTIVE_COLLECTIONS_GUARD:
+        _ACTIVE_COLLECTIONS.difference_update(names)
+
+def project_collection_name(project: Optional[str]) -> str:
+    """Collection name for a project; raises ValueError for an invalid name"""
+    project = project or DEFAULT_PROJECT
+    if not PROJECT_NAME_PATTERN.match(project):
+        raise ValueError(
+            f"Invalid project name {project!r}: use 1-40 lowercase letters, digits or hyphens"
+        )
+    if project == DEFAULT_PROJECT:
+        return BASE_COLLECTION_NAME
+    return f"{BASE_COLLECTION_NAME}_{project}"
+
 class KnowledgeBase:
     """Vector database for storing and retrieving document chunks"""
     
-    def __init__(self, persist_directory: str = "./chroma_db"):
+    def __init__(self, persist_directory: str = "./chroma_db", query_cache_size: int = 512,
+                 dedup_threshold: Optional[float] = 0.85, embedding_model_name: Optional[str] = None,
+                 index_params: Optional[Dict[str, Any]] = None, embedding_socket: Optional[str] = None,
+                 num_shards: Optional[int] = None, shard_by: Optional[str] = None,
+                 project: Optional[str] = None, client=None, embedding_model=None):
         self.persist_directory = persist_directory
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.embedding_model_name = embedding_model_name or os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+        self.project = project or DEFAULT_PROJECT
+        self.collection_name = project_collection_name(self.project)
+        
+        # With an embedding service running, workers share its model instead of loading their own
+        self.embedding_socket = embedding_socket or os.getenv("EMBEDDING_SOCKET")
+        if embedding_model is not None:
+            # Shared by every project a KnowledgeBaseRegistry opens
+            self.embedding_model = embedding_model
+        elif self.embedding_socket:
+            self.embedding_model = EmbeddingClient(self.embedding_socket, self.embedding_model_name)
+        else:
+            self.embedding_model = load_embedding_model(self.embedding_model_name)
+        # Extra HNSW settings for new collections, e.g. {"hnsw:M": 32, "hnsw:search_ef": 100}
+        self.index_params = dict(index_params or {})
+        
+        # Chunks are partitioned across this many collections, searched concurrently
+        self.num_shards = num_shards or int(os.getenv("KB_SHARDS", "1"))
+        self.shard_by = shard_by or os.getenv("KB_SHARD_BY", "source")
+        if self.num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+        if self.shard_by not in SHARD_STRATEGIES:
+            raise ValueError(f"shard_by must be one of {', '.join(SHARD_STRATEGIES)}")
+        
+        # Initialize ChromaDB. Several processes (e.g. uvicorn workers) may
+        # share the store: each picks up the others' changes through the stamp.
+        self.client = client or chromadb.PersistentClient(path=persist_directory)
+        self.layout_path = os.path.join(persist_directory, f"{self.collection_name}_layout.json")
+        # Rewritten whenever the live data changes
+        self.stamp_path = os.path.join(persist_directory, f"{self.collection_name}_stamp")
+        # Per-source summary kept alongside the collection so listing sources
+        # never has to scan chunk metadata
+        self.manifest_path = os.path.join(persist_directory, f"{self.collection_name}_manifest.json")
         
-        # Initialize ChromaDB
-        self.client = chromadb.PersistentClient(path=persist_directory)
-        self.collection_name = "qa_documents"
+        # Queries share the lock; swapping in a rebuilt collection takes it
+        # exclusively. Only one rebuild may run at a time.
+        self._lock = ReadWriteLock()
+        self._build_lock = threading.Lock()
         
-        # Get or create collection
+        # Replaced every time the corpus changes; derived results are cached
+        # against it so they are invalidated by any rebuild or clear.
+        self._version = next(_KB_VERSIONS)
+        self.query_cache = ResultCache(max_entries=query_cache_size)
+        # Requests and background jobs holding this instance; a registry only closes idle ones
+        self._users = 0
+        self._users_lock = threading.Lock()
+        self._latency_lock = threading.Lock()
+        self._search_latency = {
+            'filtered': {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0},
+            'unfiltered': {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+        }
+        self._collapsed_hits = 0
+        
+        # Near-duplicate chunks (repeated boilerplate across documents) are
+        # dropped before embedding; pass dedup_threshold=None to keep them all
+        self.dedup_filter = NearDuplicateFilter(threshold=dedup_threshold) if dedup_threshold else None
+        self.last_build_stats: Dict[str, Any] = {}
+        
+        # Open the live shards in the layout they were built with; a different
+        # num_shards takes effect at the next rebuild. Creating or dropping
+        # collections waits for any compaction of the store to finish.
+        with maintenance_lock(persist_directory, shared=True):
+            with self._store_lock('swap', shared=True):
+                self._stamp = self._read_stamp()
+                live_shards = self._load_layout()
+                if live_shards != self.num_shards:
+                    print(f"Knowledge base has {live_shards} shard(s); the next build re-partitions it into {self.num_shards}")
+                self.shards = [self._get_or_create_collection(name) for name in self._shard_names(live_shards)]
+                self.sources = self._load_manifest()
+            self._drop_stale_collections()
+        # Threads are only started once a query fans out to several shards
+        self._search_pool = ThreadPoolExecutor(
+            max_workers=max(self.num_shards, live_shards) * 4, thread_name_prefix='kb-search'
+        )
+    
+    @property
+    def version(self) -> int:
+        """Corpus version; changes with every rebuild, import, clear or delete, in any process"""
+        self.refresh()
+        return self._version
+    
+    @contextmanager
+    def _building(self):
+        """Exclude other builds, imports, exports and deletes of this collection, and
+        compaction of the store, in this and every other process, starting from
+        the current live data"""
+        with maintenance_lock(self.persist_directory, shared=True), self._build_lock, self._store_lock('build'):
+            self.refresh()
+            yield
+    
+    def _store_lock(self, kind: str, shared: bool = False, blocking: bool = True):
+        """Cross-process lock of this collection: ``build`` serializes writers for a
+        whole rebuild, ``swap`` covers changing the live data and opening it"""
+        return store_lock(self.persist_directory, f"{self.collection_name}_{kind}", shared, blocking)
+    
+    def _read_stamp(self):
+        try:
+            stat = os.stat(self.stamp_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+    
+    def _save_stamp(self):
+        self._write_atomic(self.stamp_path, uuid.uuid4().hex)
+        self._stamp = self._read_stamp()
+    
+    def _write_atomic(self, path: str, content: str):
+        os.makedirs(self.persist_directory, exist_ok=True)
+        # Unique per writer: processes opening the store may write the same file
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    
+    def refresh(self) -> bool:
+        """Reopen the live data if another process sharing the store changed it.
+        
+        Costs one stat() when nothing changed; returns whether anything was reloaded.
+        """
+        if self._read_stamp() == self._stamp:
+            return False
+        with self._store_lock('swap', shared=True), self._lock.write_locked():
+            stamp = self._read_stamp()
+            if stamp == self._stamp:
+                return False
+            self.shards = [self.client.get_collection(name) for name in self._shard_names(self._load_layout())]
+            self.sources = self._load_manifest()
+            self._version = next(_KB_VERSIONS)
+            self._stamp = stamp
+        print(f"Reloaded knowledge base {self.collection_name} after a change by another process")
+        return True
+    
+    def _create_collection(self, name: str):
+        """Create an empty collection using cosine distance"""
+        return self.client.create_collection(
+            name=name,
+            metadata={"hnsw:space": "cosine", **self.index_params}
+        )
+    
+    def _create_shadow(self):
+        """Create an empty shadow collection, kept from stale-collection cleanup until promoted or dropped"""
+        name = f"{self._shadow_prefix()}{uuid.uuid4().hex}"
+        _mark_active(name)
+        try:
+            return self._create_collection(name)
+        except Exception:
+            _mark_inactive([name])
+            raise
+    
+    def _get_or_create_collection(self, name: str):
         try:
-            self.collection = self.client.get_collection(self.collection_name)
+            return self.client.get_collection(name)
         except:
-            self.collection = self.client.create_collection(
-                name=self.collection_name,
-                metadata={"hnsw:space": "cosine"}
-            )
+            try:
+                return self._create_collection(name)
+            except Exception:
+                # Created meanwhile by another process opening the same store
+                return self.client.get_collection(name)
     
-    def build_from_documents(self, documents: List[Dict[str, Any]]):
-        """Build knowledge base from processed documents"""
+    def _shard_names(self, count: int) -> List[str]:
+        """Live collection names; an unsharded store keeps the plain collection name"""
+        if count == 1:
+            return [self.collection_name]
+        return [f"{self.collection_name}__shard_{index}" for index in range(count)]
+    
+    def _collection_names(self) -> List[str]:
+        # Older chromadb versions return Collection objects, newer ones names
+        return [getattr(c, 'name', c) for c in self.client.list_collections()]
+    
+    def _load_layout(self) -> int:
+        """Number of shards the live data was built with"""
+        if os.path.exists(self.layout_path):
+            try:
+                with open(self.layout_path, 'r', encoding='utf-8') as f:
+                    return int(json.load(f)['num_shards'])
+            except Exception as e:
+                print(f"Failed to read shard layout: {e}")
+        
+        # Stores created before sharding hold a single collection under the plain name
         try:
-            # Clear existing collection
-            self.client.delete_collection(self.collection_name)
-            self.collection = self.client.create_collection(
-                name=self.collection_name,
-                metadata={"hnsw:space": "cosine"}
-            )
-            
-            all_chunks = []
-            all_embeddings = []
-            all_metadatas = []
-            all_ids = []
-            
-            for doc in documents:
-                for chunk in doc['chunks']:
-                    # Generate embedding
-                    embedding = self.embedding_model.encode(chunk['text']).tolist()
-                    
-                    # Prepare metadata
-                    metadata = {
-                        'source': doc['filename'],
-                        'content_type': doc['content_type'],
-                        'chunk_index': chunk['metadata']['chunk_index']
-                    }
-                    
-                    all_chunks.append(chunk['text'])
-                    all_embeddings.append(embedding)
-                    all_metadatas.append(metadata)
-                    all_ids.append(str(uuid.uuid4()))
-            
-            # Add to collection in batch
-            if all_chunks:
-                self.collection.add(
-                    documents=all_chunks,
-                    embeddings=all_embeddings,
-                    metadatas=all_metadatas,
-                    ids=all_ids
-                )
-            
-            return len(all_chunks)
+            if self.collection_name in self._collection_names():
+                return 1
+        except Exception:
+            pass
+        return self.num_shards
+    
+    def _save_layout(self, count: int):
+        self._write_atomic(self.layout_path, json.dumps({'num_shards': count, 'shard_by': self.shard_by}))
+    
+    def _shard_for(self, doc: Dict[str, Any], count: int) -> int:
+        """Stable shard index for a document, independent of process and hash seed"""
+        key = doc['filename']
+        if self.shard_by == 'product':
+            key = doc.get('metadata', {}).get('product') or key
+        return int(hashlib.sha1(key.encode('utf-8')).hexdigest()[:8], 16) % count
+    
+    def _shadow_prefix(self) -> str:
+        return f"{self.collection_name}__shadow_"
+    
+    def _retired_prefix(self) -> str:
+        return f"{self.collection_name}__retired_"
+    
+    def _drop_stale_collections(self):
+        """Remove shadow/retired collections left behind by an interrupted rebuild"""
+        with self._store_lock('build', blocking=False) as idle:
+            if not idle:
+                # A rebuild is running in some process; its shadows are not stale
+                return
+            try:
+                names = self._collection_names()
+            except Exception:
+                return
             
+            with _ACTIVE_COLLECTIONS_GUARD:
+                active = set(_ACTIVE_COLLECTIONS)
+            for name in names:
+                if name in active:
+                    # Still being built or swapped by another instance of this project
+                    continue
+                if name.startswith(self._shadow_prefix()) or name.startswith(self._retired_prefix()):
+                    try:
+                        self.client.delete_collection(name)
+                    except Exception as e:
+                        print(f"Failed to drop stale collection {name}: {e}")
+    
+    def _load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        """Load the source manifest, rebuilding it once from the collection if missing"""
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Failed to read source manifest, rebuilding it: {e}")
+        
+        # Collections built before the manifest existed only carry chunk metadata
+        sources = {}
+        try:
+            for index, shard in enumerate(self.shards):
+                if not shard.count():
+                    continue
+                results = shard.get(include=['metadatas'])
+                for metadata in results['metadatas']:
+                    entry = sources.setdefault(metadata['source'], {
+                        'source': metadata['source'],
+                        'content_type': metadata.get('content_type'),
+                        'sections': [],
+                        'chunk_count': 0,
+                        'content_hash': None,
+                        'size_bytes': None,
+                        'ingested_at': None,
+                        'shard': index
+                    })
+                    entry['chunk_count'] += 1
+            if sources:
+                self._save_manifest(sources)
         except Exception as e:
-            raise Exception(f"Error building knowledge base: {str(e)}")
+            print(f"Failed to rebuild source manifest: {e}")
+        return sources
+    
+    def _save_manifest(self, sources: Dict[str, Dict[str, Any]]):
+        """Persist the manifest atomically next to the Chroma store"""
+        self._write_atomic(self.manifest_path, json.dumps(sources, indent=2))
+    
+    def _manifest_entry(self, doc: Dict[str, Any], chunk_count: int, ingested_at: str) -> Dict[str, Any]:
+        """Summarize one processed document for the source manifest"""
+        doc_metadata = doc.get('metadata', {})
+        content_hash = doc_metadata.get('content_hash')
+        size_bytes = doc_metadata.get('size_bytes')
+        if content_hash is None or size_bytes is None:
+            # Documents processed by older clients only carry the extracted text
+            encoded = doc.get('text_content', '').encode('utf-8')
+            content_hash = content_hash or hashlib.sha256(encoded).hexdigest()
+            size_bytes = size_bytes if size_bytes is not None else len(encoded)
+        
+        sections = sorted({
+            chunk['metadata']['section'] for chunk in doc['chunks'] if chunk['metadata'].get('section')
+        })
+        
+        return {
+            'source': doc['filename'],
+            'content_type': doc['content_type'],
+            'sections': sections,
+            'chunk_count': chunk_count,
+            'content_hash': content_hash,
+            'size_bytes': size_bytes,
+            'ingested_at': ingested_at,
+            'product': doc_metadata.get('product')
+        }
+    
+    def _swap_in(self, shadows: List[Any], sources: Dict[str, Dict[str, Any]]):
+        """Atomically promote fully populated shadow shards to live"""
+        retired = []
+        retired_names = []
+        promoted = []
+        shadow_names = [shadow.name for shadow in shadows]
+        
+        with self._store_lock('swap'), self._lock.write_locked():
+            # Renames are metadata-only, so readers are blocked only briefly
+            try:
+                for shard in self.shards:
+                    live_name = shard.name
+                    retired_name = f"{self._retired_prefix()}{uuid.uuid4().hex}"
+                    _mark_active(retired_name)
+                    retired_names.append(retired_name)
+                    shard.modify(name=retired_name)
+                    retired.append((shard, live_name))
+                for shadow, name in zip(shadows, self._shard_names(len(shadows))):
+                    shadow.modify(name=name)
+                    promoted.append(shadow)
+            except Exception:
+                for shadow in promoted:
+                    shadow_name = f"{self._shadow_prefix()}{uuid.uuid4().hex}"
+                    _mark_active(shadow_name)
+                    shadow.modify(name=shadow_name)
+                for shard, live_name in retired:
+                    shard.modify(name=live_name)
+                # The caller drops the shadows under their current names
+                _mark_inactive(retired_names + shadow_names)
+                raise
+            self.shards = list(shadows)
+            self.sources = sources
+            self._version = next(_KB_VERSIONS)
+            self._save_layout(len(shadows))
+            self._save_manifest(sources)
+            self._save_stamp()
+        _mark_inactive(shadow_names)
+        
+        # Dropping the old data can be slow; do it after readers resume
+        for shard, _ in retired:
+            try:
+                self.client.delete_collection(shard.name)
+            except Exception as e:
+                print(f"Failed to drop retired collection {shard.name}: {e}")
+            # Left over only if the delete failed; the next open retries it
+            _mark_inactive([shard.name])
+    
+    def _drop_near_duplicates(self, texts: List[str], metadatas: List[Dict[str, Any]]):
+        """Drop chunks that nearly repeat an earlier chunk of the same source.
+        
+        Sources are deduplicated independently: a chunk shared by two
+        documents is kept in both, so source, section and product filters,
+        per-source chunk counts and deleting one of the documents never lose
+        the other's content. Copies across sources are collapsed in query
+        results instead (see _collapse_cross_source).
+        """
+        removed_by_source: Dict[str, int] = {}
+        if self.dedup_filter is None or not texts:
+            return texts, metadatas, removed_by_source
+        
+        by_source: Dict[str, List[int]] = {}
+        for index, metadata in enumerate(metadatas):
+            by_source.setdefault(metadata['source'], []).append(index)
+        
+        duplicates = set()
+        for source, indices in by_source.items():
+            found = self.dedup_filter.find_duplicates([texts[i] for i in indices])
+            if found:
+                removed_by_source[source] = len(found)
+                duplicates.update(indices[i] for i in found)
+        
+        kept_texts = [text for i, text in enumerate(texts) if i not in duplicates]
+        kept_metadatas = [metadata for i, metadata in enumerate(metadatas) if i not in duplicates]
+        print(f"Removed {len(duplicates)} near-duplicate chunks out of {len(texts)}")
+        return kept_texts, kept_metadatas, removed_by_source
+    
+    def build_from_documents(self, documents: List[Dict[str, Any]]):
+        """Build knowledge base from processed documents.
+        
+        Chunks are written to shadow collections while queries keep being
+        served from the live ones; the shadows are swapped in once complete.
+        With several shards, each shard is embedded and indexed in parallel.
+        """
+        with self._building():
+            shadows = []
+            try:
+                shard_count = self.num_shards
+                shadows = [self._create_shadow() for _ in range(shard_count)]
+                
+                all_chunks = []
+                all_metadatas = []
+                sources = {}
+                ingested_at = datetime.now(timezone.utc).isoformat()
+                
+                for doc in documents:
+                    entry = self._manifest_entry(doc, 0, ingested_at)
+                    if doc['filename'] in sources:
+                        entry['sections'] = sorted(set(entry['sections']) | set(sources[doc['filename']]['sections']))
+                    # A source lives in exactly one shard, so deletes and source filters touch only that shard
+                    entry['shard'] = sources.get(doc['filename'], {}).get('shard', self._shard_for(doc, shard_count))
+                    sources[doc['filename']] = entry
+                    doc_metadata = doc.get('metadata', {})
+                    for chunk in doc['chunks']:
+                        # Prepare metadata
+                        metadata = {
+                            'source': doc['filename'],
+                            'content_type': doc['content_type'],
+                            'chunk_index': chunk['metadata']['chunk_index']
+                        }
+                        for key in CHUNK_METADATA_KEYS:
+                            if key in chunk['metadata']:
+                                metadata[key] = chunk['metadata'][key]
+                        for key in DOCUMENT_METADATA_KEYS:
+                            if doc_metadata.get(key) is not None:
+                                metadata[key] = doc_metadata[key]
+                        
+                        all_chunks.append(chunk['text'])
+                        all_metadatas.append(metadata)
+                
+                with timed('knowledge_base', 'dedup'):
+                    all_chunks, all_metadatas, removed_by_source = self._drop_near_duplicates(all_chunks, all_metadatas)
+                for metadata in all_metadatas:
+                    sources[metadata['source']]['chunk_count'] += 1
+                
+                partitions = [[] for _ in range(shard_count)]
+                for index, metadata in enumerate(all_metadatas):
+                    partitions[sources[metadata['source']]['shard']].append(index)
+                
+                def index_shard(shard_index: int) -> int:
+                    indices = partitions[shard_index]
+                    if not indices:
+                        return 0
+                    texts = [all_chunks[i] for i in indices]
+                    # Embed in batches rather than one forward pass per chunk
+                    with timed('knowledge_base', 'embed_documents'):
+                        embeddings = self.embedding_model.encode(texts, batch_size=64).tolist()
+                    with timed('knowledge_base', 'index'):
+                        shadows[shard_index].add(
+                            documents=texts,
+                            embeddings=embeddings,
+                            metadatas=[all_metadatas[i] for i in indices],
+                            ids=[str(uuid.uuid4()) for _ in indices]
+                        )
+                    return len(indices)
+                
+                shard_chunks = self._run_per_shard(index_shard, shard_count)
+                
+                self.last_build_stats = {
+                    'chunks_indexed': len(all_chunks),
+                    'duplicates_removed': sum(removed_by_source.values()),
+                    'duplicates_removed_by_source': removed_by_source,
+                    'shard_chunks': shard_chunks
+                }
+                with timed('knowledge_base', 'swap'):
+                    self._swap_in(shadows, sources)
+                return len(all_chunks)
+                
+            except Exception as e:
+                self._drop_shadows(shadows)
+                raise Exception(f"Error building knowledge base: {str(e)}")
+    
+    def _run_per_shard(self, fn, shard_count: int) -> List[int]:
+        """Call fn(shard_index) for every shard, in parallel when there are several"""
+        if shard_count == 1:
+            return [fn(0)]
+        with ThreadPoolExecutor(max_workers=shard_count, thread_name_prefix='kb-build') as pool:
+            futures = [pool.submit(propagate(fn), i) for i in range(shard_count)]
+            return [future.result() for future in futures]
+    
+    def _drop_shadows(self, shadows: List[Any]):
+        """Remove shadow collections of a failed build that never went live"""
+        for shadow in shadows:
+            if not any(shadow is shard for shard in self.shards):
+                try:
+                    self.client.delete_collection(shadow.name)
+                except Exception:
+                    pass
+                _mark_inactive([shadow.name])
     
-    def query(self, query_text: str, n_results: int = 5) -> List[Dict[str, Any]]:
-        """Query the knowledge base for relevant chunks"""
+    def _add_batch_size(self, requested: int) -> int:
+        # Chroma rejects adds larger than its SQLite-derived limit
         try:
-            # Generate query embedding
-            query_embedding = self.embedding_model.encode(query_text).tolist()
+            return min(requested, self.client.get_max_batch_size())
+        except Exception:
+            return requested
+    
+    def export_snapshot(self, directory: str, batch_size: int = 5000) -> Dict[str, Any]:
+        """Write the live index to a portable snapshot directory and return its manifest.
+        
+        Holds the build lock so the index cannot change mid-export; queries
+        keep being served.
+        """
+        with self._building():
+            try:
+                shards = list(self.shards)
+                counts = [shard.count() for shard in shards]
+                
+                def batches():
+                    for shard, count in zip(shards, counts):
+                        for offset in range(0, count, batch_size):
+                            results = shard.get(
+                                include=['embeddings', 'documents', 'metadatas'], limit=batch_size, offset=offset
+                            )
+                            yield (results['ids'], results['documents'], results['metadatas'],
+                                   np.asarray(results['embeddings'], dtype=np.float32))
+                
+                info = {
+                    'embedding_model': self.embedding_model_name,
+                    'collection': self.collection_name,
+                    'num_shards': len(shards),
+                    'shard_by': self.shard_by,
+                    'index_params': self.index_params,
+                    'knowledge_base_version': self._version
+                }
+                with timed('knowledge_base', 'export_snapshot'):
+                    return write_snapshot(
+                        directory, sum(counts), self.embedding_model.get_sentence_embedding_dimension(),
+                        batches(), self.sources, info
+                    )
+            except FileExistsError:
+                raise
+            except Exception as e:
+                raise Exception(f"Error exporting knowledge base snapshot: {str(e)}")
+    
+    def import_snapshot(self, directory: str, verify: bool = True, batch_size: int = 5000) -> Dict[str, Any]:
+        """Replace the live index with a snapshot's chunks and embeddings, without re-embedding.
+        
+        Checksums are verified first unless ``verify`` is False. The snapshot
+        must have been built with this knowledge base's embedding model.
+        Like a rebuild, it is loaded into shadow shards and swapped in.
+        """
+        with self._building():
+            shadows = []
+            try:
+                with timed('knowledge_base', 'read_snapshot'):
+                    snapshot = Snapshot(directory, verify=verify)
+                manifest = snapshot.manifest
+                if manifest['embedding_model'] != self.embedding_model_name:
+                    raise SnapshotError(
+                        f"Snapshot was embedded with {manifest['embedding_model']}, "
+                        f"but this knowledge base uses {self.embedding_model_name}"
+                    )
+                if manifest['embedding_dimension'] != self.embedding_model.get_sentence_embedding_dimension():
+                    raise SnapshotError(f"Snapshot embeddings have dimension {manifest['embedding_dimension']}, "
+                                        f"which does not match {self.embedding_model_name}")
+                
+                # Re-partition for this node's shard layout, which may differ from the exporter's
+                shard_count = self.num_shards
+                sources = snapshot.sources
+                for source, entry in sources.items():
+                    entry['shard'] = self._shard_for(
+                        {'filename': source, 'metadata': {'product': entry.get('product')}}, shard_count
+                    )
+                partitions = [[] for _ in range(shard_count)]
+                for index, source in enumerate(snapshot.column('source')):
+                    partitions[sources[source]['shard']].append(index)
+                
+                shadows = [self._create_shadow() for _ in range(shard_count)]
+                add_batch_size = self._add_batch_size(batch_size)
+                
+                def load_shard(shard_index: int) -> int:
+                    for ids, texts, metadatas, embeddings in snapshot.batches(partitions[shard_index], add_batch_size):
+                        shadows[shard_index].add(
+                            ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings.tolist()
+                        )
+                    return len(partitions[shard_index])
+                
+                with timed('knowledge_base', 'index'):
+                    shard_chunks = self._run_per_shard(load_shard, shard_count)
+                
+                self.last_build_stats = {
+                    'chunks_indexed': len(snapshot),
+                    'duplicates_removed': 0,
+                    'duplicates_removed_by_source': {},
+                    'shard_chunks': shard_chunks,
+                    'snapshot': {'path': os.path.abspath(directory), 'created_at': manifest['created_at']}
+                }
+                with timed('knowledge_base', 'swap'):
+                    self._swap_in(shadows, sources)
+                return manifest
+                
+            except SnapshotError:
+                self._drop_shadows(shadows)
+                raise
+            except Exception as e:
+                self._drop_shadows(shadows)
+                raise Exception(f"Error importing knowledge base snapshot: {str(e)}")
+    
+    def _build_where(self, filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Translate query filters into a Chroma ``where`` clause"""
+        conditions = []
+        for name, fields in FILTER_FIELDS.items():
+            values = (filters or {}).get(name)
+            if not values:
+                continue
+            if isinstance(values, (str, int)):
+                values = [values]
             
-            # Query the collection
-            results = self.collection.query(
+            matches = [{field: {'$in': list(values)}} for field in fields]
+            conditions.append(matches[0] if len(matches) == 1 else {'$or': matches})
+        
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {'$and': conditions}
+    
+    def _target_shards(self, filters: Optional[Dict[str, Any]]) -> List[Any]:
+        """Live shards that can hold chunks matching the source/product filters"""
+        if len(self.shards) == 1:
+            return self.shards
+        
+        wanted_sources = (filters or {}).get('sources')
+        wanted_products = (filters or {}).get('products')
+        if not wanted_sources and not wanted_products:
+            return self.shards
+        if isinstance(wanted_sources, str):
+            wanted_sources = [wanted_sources]
+        if isinstance(wanted_products, str):
+            wanted_products = [wanted_products]
+        
+        indices = set()
+        for entry in self.sources.values():
+            if wanted_sources and entry['source'] not in wanted_sources:
+                continue
+            if wanted_products and entry.get('product') not in wanted_products:
+                continue
+            shard = entry.get('shard')
+            if shard is None or shard >= len(self.shards):
+                # Manifest written before sharding; the source could be anywhere
+                return self.shards
+            indices.add(shard)
+        return [self.shards[index] for index in sorted(indices)]
+    
+    def _search_shard(self, shard, query_embedding: List[float], n_results: int,
+                      where: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        fetch = n_results
+        while True:
+            results = shard.query(
                 query_embeddings=[query_embedding],
-                n_results=n_results,
+                n_results=fetch,
+                where=where,
                 include=['documents', 'metadatas', 'distances']
             )
-            
-            # Format results
-            formatted_results = []
-            for i in range(len(results['documents'][0])):
-                formatted_results.append({
-                    'text': results['documents'][0][i],
+            documents = results['documents'][0]
+            # Chunks deleted by another process sharing the store stay in this
+            # process's loaded index, but come back without a document
+            hits = [
+                {
+                    'text': documents[i],
                     'metadata': results['metadatas'][0][i],
                     'distance': results['distances'][0][i]
-                })
+                }
+                for i in range(len(documents)) if documents[i] is not None
+            ]
+            if len(hits) >= n_results or len(documents) < fetch:
+                return hits[:n_results]
+            fetch += fetch - len(hits)
+    
+    def _scatter_search(self, shards: List[Any], query_embedding: List[float], n_results: int,
+                        where: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Query every shard concurrently and merge their top-k by distance"""
+        if len(shards) == 1:
+            return self._search_shard(shards[0], query_embedding, n_results, where)
+        if self._search_pool is None:
+            # Closed by the registry while a request still held this knowledge base
+            hits = [hit for shard in shards for hit in self._search_shard(shard, query_embedding, n_results, where)]
+        else:
+            futures = [
+                self._search_pool.submit(propagate(self._search_shard), shard, query_embedding, n_results, where)
+                for shard in shards
+            ]
+            hits = [hit for future in futures for hit in future.result()]
+        return sorted(hits, key=lambda hit: hit['distance'])[:n_results]
+    
+    def _record_search_latency(self, filtered: bool, elapsed_ms: float):
+        with self._latency_lock:
+            bucket = self._search_latency['filtered' if filtered else 'unfiltered']
+            bucket['count'] += 1
+            bucket['total_ms'] += elapsed_ms
+            bucket['max_ms'] = max(bucket['max_ms'], elapsed_ms)
+    
+    def query(self, query_text: str, n_results: int = 5,
+              filters: Optional[Dict[str, Any]] = None,
+              deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        """Query the knowledge base for relevant chunks.
+        
+        ``filters`` may restrict the search to ``sources``, ``content_types``,
+        ``sections`` (a full heading path or any of its first levels) and PDF
+        ``pages``.
+        When ``deadline`` is nearly spent fewer results are fetched.
+        """
+        try:
+            where = self._build_where(filters)
+            cache_key = ResultCache.make_key(query_text, n_results, where)
+            cached = self.query_cache.get(cache_key, self.version)
+            if cached is not None:
+                return cached
+            
+            if deadline is not None and n_results > 1 and deadline.remaining() < QUERY_SHORT_DEADLINE_SECONDS:
+                reduced = 1 if deadline.expired else max(n_results // 2, 1)
+                deadline.degrade('retrieval', 'reduced_n_results', f'{n_results} -> {reduced}')
+                n_results = reduced
+                cache_key = ResultCache.make_key(query_text, n_results, where)
+            
+            # Generate query embedding
+            with timed('knowledge_base', 'embed_query'):
+                query_embedding = self.embedding_model.encode(query_text).tolist()
             
+            # Query the shards that can hold matching chunks
+            fetch = n_results * QUERY_DEDUP_OVERFETCH if self.dedup_filter else n_results
+            for attempt in range(2):
+                try:
+                    with self._lock.read_locked():
+                        version = self._version
+                        shards = self._target_shards(filters)
+                        started = time.perf_counter()
+                        with timed('knowledge_base', 'search'):
+                            hits = self._scatter_search(shards, query_embedding, fetch, where) if shards else []
+                        self._record_search_latency(where is not None, (time.perf_counter() - started) * 1000)
+                    break
+                except Exception:
+                    # Another process swapped in new shards and dropped the ones this one had open
+                    if attempt or not self.refresh():
+                        raise
+            
+            with timed('knowledge_base', 'dedup_results'):
+                formatted_results = self._collapse_cross_source(hits)[:n_results]
+            self.query_cache.put(cache_key, version, formatted_results)
             return formatted_results
             
         except Exception as e:
             raise Exception(f"Error querying knowledge base: {str(e)}")
     
+    def _collapse_cross_source(self, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Keep only the closest copy of text repeated across sources.
+        
+        The copies' sources are listed in the kept hit's ``also_in`` metadata,
+        so boilerplate shared by several documents takes one result slot.
+        """
+        if self.dedup_filter is None or len(hits) < 2:
+            return hits
+        
+        also_in: Dict[int, List[str]] = {}
+        dropped = set()
+        # Hits are ordered by distance, so every duplicate points at a closer copy
+        for index, original in self.dedup_filter.find_duplicates([hit['text'] for hit in hits]).items():
+            source = hits[index]['metadata']['source']
+            if source == hits[original]['metadata']['source']:
+                continue
+            dropped.add(index)
+            sources = also_in.setdefault(original, [])
+            if source not in sources:
+                sources.append(source)
+        if not dropped:
+            return hits
+        
+        with self._latency_lock:
+            self._collapsed_hits += len(dropped)
+        return [
+            {**hit, 'metadata': {**hit['metadata'], 'also_in': also_in[index]}} if index in also_in else hit
+            for index, hit in enumerate(hits) if index not in dropped
+        ]
+    
+    def stats(self) -> Dict[str, Any]:
+        """Report the corpus version, query cache effectiveness and search latency"""
+        with self._latency_lock:
+            search_latency = {
+                mode: {
+                    'count': bucket['count'],
+                    'avg_ms': round(bucket['total_ms'] / bucket['count'], 3) if bucket['count'] else 0.0,
+                    'max_ms': round(bucket['max_ms'], 3)
+                }
+                for mode, bucket in self._search_latency.items()
+            }
+            collapsed_hits = self._collapsed_hits
+        
+        return {
+            'version': self.version,
+            'project': self.project,
+            'collection': self.collection_name,
+            'shards': {
+                'count': len(self.shards),
+                'configured': self.num_shards,
+                'shard_by': self.shard_by,
+                'chunks': [shard.count() for shard in self.shards]
+            },
+            'embedding_model': self.embedding_model_name,
+            'embedding_service': self.embedding_socket or 'in-process',
+            'source_count': len(self.sources),
+            'last_build': self.last_build_stats,
+            'query_cache': self.query_cache.stats(),
+            'search_latency': search_latency,
+            'cross_source_duplicates_collapsed': collapsed_hits
+        }
+    
     def get_all_sources(self) -> List[str]:
         """Get list of all source documents in the knowledge base"""
-        try:
-            results = self.collection.get(include=['metadatas'])
-            sources = set()
-            for metadata in results['metadatas']:
-                sources.add(metadata['source'])
-            return list(sources)
-        except:
-            return []
+        return list(self.sources)
+    
+    def list_sources(self) -> List[Dict[str, Any]]:
+        """Return the manifest entry for every source in the knowledge base"""
+        return [dict(entry) for entry in self.sources.values()]
+    
+    def delete_source(self, source: str) -> Dict[str, Any]:
+        """Remove every chunk of one source, using the metadata index rather than a scan"""
+        with self._building():
+            if source not in self.sources:
+                raise KeyError(source)
+            
+            shard = self.sources[source].get('shard')
+            shards = [self.shards[shard]] if shard is not None and shard < len(self.shards) else self.shards
+            try:
+                with self._store_lock('swap'), self._lock.write_locked():
+                    for collection in shards:
+                        collection.delete(where={'source': source})
+                    sources = dict(self.sources)
+                    removed = sources.pop(source)
+                    self.sources = sources
+                    self._version = next(_KB_VERSIONS)
+                    self._save_manifest(sources)
+                    self._save_stamp()
+                return removed
+            except Exception as e:
+                raise Exception(f"Error deleting source {source}: {str(e)}")
     
     def clear(self):
         """Clear the knowledge base"""
+        with self._building():
+            shadows = []
+            try:
+                shadows = [self._create_shadow() for _ in range(self.num_shards)]
+                self._swap_in(shadows, {})
+            except Exception as e:
+                self._drop_shadows(shadows)
+                raise Exception(f"Error clearing knowledge base: {str(e)}")
+    
+    def acquire(self):
+        """Mark the instance as in use by a request or background job until ``release``"""
+        with self._users_lock:
+            self._users += 1
+    
+    def release(self):
+        with self._users_lock:
+            self._users -= 1
+    
+    @property
+    def in_use(self) -> bool:
+        with self._users_lock:
+            return self._users > 0
+    
+    def close(self):
+        """Release search threads and cached results; the data stays on disk.
+        
+        Waits for running queries. A closed knowledge base still answers
+        queries, searching its shards one after another.
+        """
+        with self._lock.write_locked():
+            pool, self._search_pool = self._search_pool, None
+            self.query_cache.clear()
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+
+class KnowledgeBaseRegistry:
+    """Knowledge bases for many projects served from one process.
+    
+    Projects are opened lazily on first use and share one Chroma client and
+    one embedding model. At most ``max_open`` stay open: opening another
+    closes the least recently used idle project, which is reopened from disk
+    rather than rebuilt the next time it is requested. A project is idle
+    when nothing holds it (see ``use``) and it is not rebuilding; while none
+    is, more than ``max_open`` stay open. The default project is never
+    evicted.
+    """
+    
+    def __init__(self, persist_directory: str = "./chroma_db", max_open: Optional[int] = None,
+                 segment_cache_bytes: Optional[int] = None, **kb_kwargs):
+        self.persist_directory = persist_directory
+        self.max_open = max_open or int(os.getenv("KB_MAX_OPEN_PROJECTS", "8"))
+        if self.max_open < 1:
+            raise ValueError("max_open must be at least 1")
+        self.kb_kwargs = kb_kwargs
+        
+        # Chroma keeps every HNSW index it has loaded in memory; with a limit
+        # set, it unloads the least recently used ones across all projects
+        if segment_cache_bytes is None and os.getenv("KB_SEGMENT_CACHE_BYTES"):
+            segment_cache_bytes = int(os.getenv("KB_SEGMENT_CACHE_BYTES"))
+        settings = Settings(
+            chroma_segment_cache_policy="LRU", chroma_memory_limit_bytes=segment_cache_bytes
+        ) if segment_cache_bytes else Settings()
+        self.client = chromadb.PersistentClient(path=persist_directory, settings=settings)
+        
+        self._lock = threading.Lock()
+        self._open: "OrderedDict[str, KnowledgeBase]" = OrderedDict()
+        # Concurrent first requests for a project open it once
+        self._opening = SingleFlight()
+        self._stats = {'opens': 0, 'hits': 0, 'evictions': 0, 'open_seconds': 0.0}
+        self._embedding_model = None
+        self.default = self.get(DEFAULT_PROJECT)
+    
+    def get(self, project: Optional[str] = None, acquire: bool = False) -> KnowledgeBase:
+        """Knowledge base for a project, opening it if needed; raises ValueError for an invalid name.
+        
+        With ``acquire`` it is held for the caller, who must call its
+        ``release()``; a held knowledge base is never evicted.
+        """
+        project = project or DEFAULT_PROJECT
+        project_collection_name(project)
+        opened = False
+        while True:
+            with self._lock:
+                knowledge_base = self._open.get(project)
+                if knowledge_base is not None:
+                    if acquire:
+                        knowledge_base.acquire()
+                    self._open.move_to_end(project)
+                    if not opened:
+                        self._stats['hits'] += 1
+                    return knowledge_base
+            # Looked up again after opening: it is only held once back under the lock
+            self._opening.do(project, lambda: self._open_project(project))
+            opened = True
+    
+    @contextmanager
+    def use(self, project: Optional[str] = None):
+        """Hold a project's knowledge base open for the duration of the block"""
+        knowledge_base = self.get(project, acquire=True)
         try:
-            self.client.delete_collection(self.collection_name)
-            self.collection = self.client.create_collection(
-                name=self.collection_name,
-                metadata={"hnsw:space": "cosine"}
+            yield knowledge_base
+        finally:
+            knowledge_base.release()
+    
+    def _open_project(self, project: str) -> KnowledgeBase:
+        with self._lock:
+            # Opened by a call that finished between our lookup and joining the single flight
+            if project in self._open:
+                return self._open[project]
+        
+        started = time.perf_counter()
+        with timed('knowledge_base', 'open_project'):
+            knowledge_base = KnowledgeBase(
+                persist_directory=self.persist_directory, project=project, client=self.client,
+                embedding_model=self._embedding_model, **self.kb_kwargs
             )
-        except Exception as e:
-            raise Exception(f"Error clearing knowledge base: {str(e)}")
\ No newline at end of file
+        
+        with self._lock:
+            # The first project loads the embedding model (or connects to the service) for all of them
+            self._embedding_model = self._embedding_model or knowledge_base.embedding_model
+            self._open[project] = knowledge_base
+            self._stats['opens'] += 1
+            self._stats['open_seconds'] += time.perf_counter() - started
+            evicted = self._evict_locked(keep=project)
+        
+        for name, old in evicted:
+            print(f"Closing knowledge base for project {name} ({len(self._open)} of {self.max_open} open)")
+            old.close()
+        return knowledge_base
+    
+    def _evict_locked(self, keep: str) -> List[Any]:
+        """Pick least recently used projects to close until within max_open"""
+        evicted = []
+        for name in list(self._open):
+            if len(self._open) <= self.max_open:
+                break
+            knowledge_base = self._open[name]
+            # A project serving a request, or rebuilding, deleting or exporting, stays open until it finishes
+            if name in (DEFAULT_PROJECT, keep) or knowledge_base.in_use or knowledge_base._build_lock.locked():
+                continue
+            del self._open[name]
+            self._stats['evictions'] += 1
+            evicted.append((name, knowledge_base))
+        return evicted
+    
+    def open_projects(self) -> Dict[str, KnowledgeBase]:
+        """Currently open projects, least recently used first"""
+        with self._lock:
+            return dict(self._open)
+    
+    def projects(self) -> List[Dict[str, Any]]:
+        """Every project with data in the store, whether or not it is open"""
+        names = set()
+        try:
+            collections = [getattr(c, 'name', c) for c in self.client.list_collections()]
+        except Exception:
+            collections = []
+        for name in collections:
+            base = name.split('__shard_', 1)[0]
+            if '__' in base:
+                # Shadow or retired collection of an unfinished rebuild
+                continue
+            if base == BASE_COLLECTION_NAME:
+                names.add(DEFAULT_PROJECT)
+            elif base.startswith(f"{BASE_COLLECTION_NAME}_"):
+                project = base[len(BASE_COLLECTION_NAME) + 1:]
+                if PROJECT_NAME_PATTERN.match(project):
+                    names.add(project)
+        
+        open_projects = self.open_projects()
+        projects = []
+        for name in sorted(names | set(open_projects)):
+            knowledge_base = open_projects.get(name)
+            projects.append({
+                'project': name,
+                'collection': project_collection_name(name),
+                'open': knowledge_base is not None,
+                'source_count': len(knowledge_base.sources) if knowledge_base else None,
+                'version': knowledge_base.version if knowledge_base else None
+            })
+        return projects
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            open_projects = list(self._open)
+        stats['open_seconds'] = round(stats['open_seconds'], 3)
+        return {'max_open': self.max_open, 'open': open_projects, **stats}
@@ -1,6 +1,7 @@
 import json
 import os
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Optional
 
 from dotenv import load_dotenv
 
@@ -9,17 +10,150 @@ try:
 except ImportError:  # pragma: no cover - handled at runtime
     genai = None
 
+from .context_packer import estimate_tokens
+from .metrics import timed
+from .response_parser import parse_test_cases
+
 load_dotenv()
 
+# Response schema for models that support constrained JSON output
+TEST_CASE_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "test_id": {"type": "string"},
+            "feature": {"type": "string"},
+            "test_scenario": {"type": "string"},
+            "expected_result": {"type": "string"},
+            "grounded_in": {"type": "string"},
+            "test_type": {"type": "string"},
+            "steps": {"type": "array", "items": {"type": "string"}}
+        },
+        "required": ["test_id", "feature", "test_scenario", "expected_result", "grounded_in", "test_type", "steps"]
+    }
+}
+
+# Models that predate structured output and only accept free-form text
+LEGACY_MODELS = ("gemini-pro", "gemini-1.0-pro")
+
+
+class LLMClient:
+    """Common behaviour for LLM providers used for test generation.
+
+    Subclasses only implement ``_generate`` (prompt in, raw text out) and
+    ``is_configured``; prompt construction, size checks and response parsing
+    are shared so every provider is driven by exactly the same prompt.
+    """
+
+    name = "llm"
+    display_name = "LLM"
+
+    def __init__(self, max_prompt_tokens: int = 8000):
+        self.max_prompt_tokens = max_prompt_tokens
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'calls': 0,
+            'parse_failures': 0,
+            'salvaged_responses': 0,
+            'salvaged_items': 0
+        }
+
+    @property
+    def is_configured(self) -> bool:
+        """Return True when the provider can serve requests."""
+        return False
+
+    def generate_test_cases(self, query: str, context: str, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Call the model to generate structured test cases, giving up after ``timeout`` seconds."""
+        if not self.is_configured:
+            raise RuntimeError(f"{self.display_name} client is not configured.")
+
+        with timed(self.name, 'build_prompt'):
+            prompt = self._build_prompt(query, context)
+            prompt_tokens = estimate_tokens(prompt)
+        if prompt_tokens > self.max_prompt_tokens:
+            raise ValueError(
+                f"Prompt is ~{prompt_tokens} tokens, above the {self.max_prompt_tokens} token limit"
+            )
+
+        try:
+            self._count('calls')
+            with timed(self.name, 'generate'):
+                output_text = self._generate(prompt, timeout)
+            with timed(self.name, 'parse'):
+                return self._parse_response(output_text)
+        except Exception as e:
+            print(f"{self.display_name} generation failed: {e}")
+            raise RuntimeError(f"{self.display_name} API error: {e}")
+
+    def _generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """Send the prompt to the model and return its raw text output."""
+        raise NotImplementedError
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for calls and response parsing outcomes."""
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def estimate_prompt_tokens(self, query: str, context: str) -> int:
+        """Approximate token count of the prompt sent for this query and context."""
+        return estimate_tokens(self._build_prompt(query, context))
+
+    def _build_prompt(self, query: str, context: str) -> str:
+        """Compose prompt instructing the model to produce JSON output."""
+        return f"""
+You are a senior QA engineer. Use ONLY the documentation provided below to
+create detailed UI test cases for the user request.
+
+User request:
+\"\"\"{query}\"\"\"
+
+Documentation context:
+\"\"\"{context}\"\"\"
+
+Respond with pure JSON: an array of test case objects.
+Each object must include the keys: test_id, feature, test_scenario,
+expected_result, grounded_in, test_type (positive|negative|exploratory), steps.
+The steps value must be an ordered list of actionable steps.
+Use concise wording and reference the documents you relied on in grounded_in.
+"""
+
+    def _parse_response(self, output_text: str) -> List[Dict[str, Any]]:
+        """Normalize model output and convert to Python objects, salvaging what it can."""
+        try:
+            test_cases, salvaged = parse_test_cases(output_text)
+        except ValueError:
+            self._count('parse_failures')
+            raise
+
+        if salvaged:
+            self._count('parse_failures')
+            self._count('salvaged_responses')
+            self._count('salvaged_items', salvaged)
+            print(f"Salvaged {salvaged} test cases from malformed {self.display_name} output")
+        return test_cases
+
 
-class GeminiClient:
+class GeminiClient(LLMClient):
     """Wrapper around Google Gemini models used for test generation."""
 
+    name = "gemini"
+    display_name = "Gemini"
+
     def __init__(self, model_name: str = "gemini-2.5-flash"):
+        super().__init__(max_prompt_tokens=int(os.getenv("GEMINI_MAX_PROMPT_TOKENS", "8000")))
         env_model = os.getenv("GEMINI_MODEL")
         self.model_name = env_model or model_name
         self.api_key = os.getenv("GEMINI_API_KEY")
         self._model = None
+        # Cleared after the first request the SDK or model rejects with a schema
+        self.structured_output = os.getenv("GEMINI_STRUCTURED_OUTPUT", "true").lower() != "false"
+        self._stats['structured_calls'] = 0
         self._configure_client()
 
     @property
@@ -65,51 +199,48 @@ class GeminiClient:
             print(f"Failed to configure Gemini client: {e}")
             self._model = None
 
-    def generate_test_cases(self, query: str, context: str) -> List[Dict[str, Any]]:
-        """Call Gemini to generate structured test cases."""
-        if not self.is_configured:
-            raise RuntimeError("Gemini client is not configured. Check API key and model availability.")
-
-        try:
-            prompt = self._build_prompt(query, context)
-            response = self._model.generate_content(prompt)
-            output_text = response.text or ""
-            return self._parse_response(output_text)
-        except Exception as e:
-            print(f"Gemini generation failed: {e}")
-            raise RuntimeError(f"Gemini API error: {e}")
-
-    def _build_prompt(self, query: str, context: str) -> str:
-        """Compose prompt instructing Gemini to produce JSON output."""
-        return f"""
-You are a senior QA engineer. Use ONLY the documentation provided below to
-create detailed UI test cases for the user request.
-
-User request:
-\"\"\"{query}\"\"\"
-
-Documentation context:
-\"\"\"{context}\"\"\"
-
-Respond with pure JSON: an array of test case objects.
-Each object must include the keys: test_id, feature, test_scenario,
-expected_result, grounded_in, test_type (positive|negative|exploratory), steps.
-The steps value must be an ordered list of actionable steps.
-Use concise wording and reference the documents you relied on in grounded_in.
-"""
-
-    def _parse_response(self, output_text: str) -> List[Dict[str, Any]]:
-        """Normalize Gemini output and convert to Python objects."""
-        cleaned = output_text.strip()
-        if cleaned.startswith("```"):
-            cleaned = cleaned.strip("`")
-            # Remove optional language prefix like ```json
-            cleaned = cleaned.split("\n", 1)[-1]
-        try:
-            data = json.loads(cleaned)
-            if isinstance(data, dict):
-                data = [data]
-            return data
-        except json.JSONDecodeError as exc:
-            raise ValueError(f"Gemini response was not valid JSON: {exc}\nRaw output: {output_text}")
-
+    def _supports_structured_output(self) -> bool:
+        return self.structured_output and self.model_name not in LEGACY_MODELS
+
+    def _generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """Call the model, asking for schema-constrained JSON when supported."""
+        request_options = {"timeout": timeout} if timeout is not None else None
+        response = None
+        if self._supports_structured_output():
+            try:
+                response = self._model.generate_content(
+                    prompt,
+                    generation_config={
+                        "response_mime_type": "application/json",
+                        "response_schema": TEST_CASE_SCHEMA
+                    },
+                    request_options=request_options
+                )
+                self._count('structured_calls')
+            except Exception as e:
+                if not self._is_schema_rejection(e):
+                    raise
+                print(f"Structured output unavailable for {self.model_name}, using plain text: {e}")
+                self.structured_output = False
+
+        if response is None:
+            response = self._model.generate_content(prompt, request_options=request_options)
+        # Read outside the try above: .text raises ValueError for blocked or empty
+        # responses, which says nothing about structured output support
+        return response.text or ""
+
+    def _is_schema_rejection(self, error: Exception) -> bool:
+        """True when the SDK or the model refused the structured-output config itself."""
+        message = str(error).lower()
+        # Older SDKs reject unknown generation_config keys locally, naming the key
+        # ("Unknown field for GenerationConfig: response_schema")
+        if isinstance(error, (TypeError, ValueError, KeyError)):
+            return any(key in message for key in ("response_schema", "response_mime_type"))
+        # Models without schema support answer with a 400 InvalidArgument
+        return type(error).__name__ == "InvalidArgument" and any(
+            word in message for word in ("schema", "mime", "json mode")
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for calls, structured-output use and response parsing outcomes."""
+        return dict(super().stats(), structured_output=self._supports_structured_output())
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+try:
+    from llama_cpp import Llama
+except ImportError:  # pragma: no cover - optional dependency
+    Llama = None
+
+from .llm_client import GeminiClient, LLMClient
+
+SOURCE_PATTERN = re.compile(r'\[Source: ([^\]]+)\]')
+
+
+class OpenAICompatibleClient(LLMClient):
+    """Client for a local OpenAI-compatible chat completions server.
+
+    Works with llama.cpp's ``llama-server``, Ollama, vLLM or LM Studio,
+    so generation can run entirely on machines without internet access.
+    """
+
+    name = "openai_compatible"
+    display_name = "Local OpenAI-compatible"
+
+    def __init__(self, base_url: str = None, model_name: str = None, timeout: float = None):
+        super().__init__(max_prompt_tokens=int(os.getenv("LOCAL_LLM_MAX_PROMPT_TOKENS", "8000")))
+        self.base_url = (base_url or os.getenv("LOCAL_LLM_BASE_URL", "")).rstrip("/")
+        self.model_name = model_name or os.getenv("LOCAL_LLM_MODEL", "local-model")
+        self.api_key = os.getenv("LOCAL_LLM_API_KEY")
+        self.timeout = timeout or float(os.getenv("LOCAL_LLM_TIMEOUT", "120"))
+        self._session = requests.Session()
+
+    @property
+    def is_configured(self) -> bool:
+        """Return True when a server URL has been provided."""
+        return bool(self.base_url)
+
+    def _generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        response = self._session.post(
+            f"{self.base_url}/chat/completions",
+            json={
+                "model": self.model_name,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": 0.2
+            },
+            headers=headers,
+            timeout=min(self.timeout, timeout) if timeout is not None else self.timeout
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"] or ""
+
+
+class LlamaCppClient(LLMClient):
+    """In-process CPU inference on a GGUF model through llama-cpp-python.
+
+    The model is loaded on first use; calls are serialised because a Llama
+    instance is not safe to share between threads.
+    """
+
+    name = "llama_cpp"
+    display_name = "llama.cpp"
+
+    def __init__(self, model_path: str = None, n_ctx: int = None, n_threads: int = None):
+        super().__init__(max_prompt_tokens=int(os.getenv("LLAMA_MAX_PROMPT_TOKENS", "3000")))
+        self.model_path = model_path or os.getenv("LLAMA_MODEL_PATH", "")
+        self.n_ctx = n_ctx or int(os.getenv("LLAMA_N_CTX", "4096"))
+        self.n_threads = n_threads or int(os.getenv("LLAMA_N_THREADS", str(os.cpu_count() or 4)))
+        self._llm = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_configured(self) -> bool:
+        """Return True when llama-cpp-python is installed and the model file exists."""
+        return Llama is not None and bool(self.model_path) and os.path.exists(self.model_path)
+
+    def _generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        # llama.cpp offers no way to interrupt a completion, so the timeout is
+        # only honoured by not starting one that is already too late
+        if timeout is not None and timeout <= 0:
+            raise TimeoutError("No time left for local inference")
+        with self._lock:
+            if self._llm is None:
+                self._llm = Llama(
+                    model_path=self.model_path,
+                    n_ctx=self.n_ctx,
+                    n_threads=self.n_threads,
+                    verbose=False
+                )
+            result = self._llm.create_chat_completion(
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.2,
+                max_tokens=self.n_ctx // 2
+            )
+        return result["choices"][0]["message"]["content"] or ""
+
+
+class FakeLLMClient(LLMClient):
+    """Deterministic stand-in that derives test cases from the prompt itself.
+
+    The same prompt always yields the same JSON, which makes it suitable for
+    tests, benchmarks and air-gapped demos. An artificial latency can be set
+    to emulate a remote model.
+    """
+
+    name = "fake"
+    display_name = "Fake"
+
+    def __init__(self, latency_seconds: float = None, cases_per_call: int = 3):
+        super().__init__(max_prompt_tokens=int(os.getenv("FAKE_LLM_MAX_PROMPT_TOKENS", "100000")))
+        if latency_seconds is None:
+            latency_seconds = float(os.getenv("FAKE_LLM_LATENCY_MS", "0")) / 1000
+        self.latency_seconds = latency_seconds
+        self.cases_per_call = cases_per_call
+
+    @property
+    def is_configured(self) -> bool:
+        return True
+
+    def _generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        if timeout is not None and self.latency_seconds > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Fake LLM latency of {self.latency_seconds}s exceeds the {timeout:.3f}s timeout")
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+        request = prompt.split('"""')[1].strip() if prompt.count('"""') >= 2 else prompt.strip()
+        sources = sorted(set(SOURCE_PATTERN.findall(prompt))) or ["No source"]
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        test_types = ["positive", "negative", "exploratory"]
+
+        test_cases = []
+        for i in range(self.cases_per_call):
+            test_cases.append({
+                "test_id": f"TC-{i + 1:03d}",
+                "feature": request.splitlines()[0][:60] if request else "General",
+                "test_scenario": f"{test_types[i % 3].capitalize()} scenario {digest[i * 4:i * 4 + 4]} for: {request[:80]}",
+                "expected_result": "System behaves as described in the documentation",
+                "grounded_in": ", ".join(sources),
+                "test_type": test_types[i % 3],
+                "steps": [
+                    "Open the checkout page",
+                    f"Exercise the behaviour described in {sources[i % len(sources)]}",
+                    "Verify the documented outcome"
+                ]
+            })
+        return json.dumps(test_cases)
+
+
+def create_llm_providers() -> Dict[str, LLMClient]:
+    """Instantiate every known provider, keyed by name"""
+    providers: List[LLMClient] = [
+        GeminiClient(),
+        OpenAICompatibleClient(),
+        LlamaCppClient(),
+        FakeLLMClient()
+    ]
+    return {provider.name: provider for provider in providers}
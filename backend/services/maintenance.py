@@ -0,0 +1,340 @@
+"""
+Disk footprint reporting and compaction for the Chroma persistent store.
+
+Every rebuild writes new shadow collections and drops the old ones. Chroma
+removes their rows from ``chroma.sqlite3`` but leaves the freed pages in
+the file and, for HNSW indexes, the segment directory on disk, so the
+store keeps growing and takes longer to open. Compaction removes segment
+directories no collection refers to and VACUUMs the SQLite file:
+
+    cd backend && python -m services.maintenance footprint
+    cd backend && python -m services.maintenance compact --queries 50
+
+Open and query times are measured in a fresh subprocess before and after
+compaction, so caches of the running process do not hide the difference
+(the operating system's page cache still may).
+
+Compaction holds maintenance_lock() exclusively for the whole run. Every
+knowledge base takes it shared to open, build, delete from or snapshot a
+project, so no process writes to the store in the meantime, whether or
+not it has the project open. The timing probe's client then only reads,
+like one more worker would.
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from .concurrency import store_lock
+
+SQLITE_FILE = 'chroma.sqlite3'
+MAINTENANCE_LOCK = 'maintenance'
+# HNSW segments live in a directory named after the segment id
+_SEGMENT_DIR_PATTERN = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def maintenance_lock(persist_directory: str, shared: bool = False):
+    """Store-wide lock: compaction holds it exclusively, anything changing collections shares it"""
+    return store_lock(persist_directory, MAINTENANCE_LOCK, shared=shared)
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _connect(persist_directory: str, read_only: bool = True) -> sqlite3.Connection:
+    path = os.path.join(persist_directory, SQLITE_FILE)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No Chroma store at {persist_directory}")
+    if read_only:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30)
+    return sqlite3.connect(path, timeout=30)
+
+
+def _segment_dirs(persist_directory: str) -> List[str]:
+    return [
+        name for name in os.listdir(persist_directory)
+        if _SEGMENT_DIR_PATTERN.match(name) and os.path.isdir(os.path.join(persist_directory, name))
+    ]
+
+
+def _orphaned_segments(persist_directory: str, db: sqlite3.Connection) -> List[str]:
+    """Segment directories that no collection refers to any more.
+
+    Directories are listed before the segments table is read: Chroma
+    registers a segment when its collection is created, before the first
+    write creates the directory, so a collection created while this runs
+    can never have its directory mistaken for an orphan.
+    """
+    directories = _segment_dirs(persist_directory)
+    known = {row[0] for row in db.execute("SELECT id FROM segments")}
+    return [name for name in directories if name not in known]
+
+
+def disk_footprint(persist_directory: str) -> Dict[str, Any]:
+    """Bytes used by the store, per collection and per source, and how much compaction can reclaim.
+
+    Per-source figures are the source's chunk text plus its share (by chunk
+    count) of the collection's vector index, so they are estimates.
+    """
+    db = _connect(persist_directory)
+    try:
+        orphaned = _orphaned_segments(persist_directory, db)
+        page_size = db.execute("PRAGMA page_size").fetchone()[0]
+        page_count = db.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = db.execute("PRAGMA freelist_count").fetchone()[0]
+        log_entries = db.execute("SELECT COUNT(*) FROM embeddings_queue").fetchone()[0]
+
+        collections = {
+            collection_id: {'name': name, 'dimension': dimension, 'chunks': 0, 'text_bytes': 0,
+                            'vector_bytes': 0, 'sources': {}}
+            for collection_id, name, dimension in db.execute("SELECT id, name, dimension FROM collections")
+        }
+        for segment_id, collection_id, scope in db.execute("SELECT id, collection, scope FROM segments"):
+            path = os.path.join(persist_directory, segment_id)
+            if scope == 'VECTOR' and collection_id in collections and os.path.isdir(path):
+                collections[collection_id]['vector_bytes'] += _dir_size(path)
+
+        rows = db.execute("""
+            SELECT s.collection, src.string_value, COUNT(*), COALESCE(SUM(LENGTH(doc.string_value)), 0)
+            FROM embeddings e
+            JOIN segments s ON s.id = e.segment_id
+            LEFT JOIN embedding_metadata src ON src.id = e.id AND src.key = 'source'
+            LEFT JOIN embedding_metadata doc ON doc.id = e.id AND doc.key = 'chroma:document'
+            GROUP BY s.collection, src.string_value
+        """)
+        for collection_id, source, chunks, text_bytes in rows:
+            collection = collections.get(collection_id)
+            if collection is None:
+                continue
+            collection['chunks'] += chunks
+            collection['text_bytes'] += text_bytes
+            collection['sources'][source or '(unknown)'] = {'chunks': chunks, 'text_bytes': text_bytes}
+    finally:
+        db.close()
+
+    for collection in collections.values():
+        for entry in collection['sources'].values():
+            share = entry['chunks'] / collection['chunks'] if collection['chunks'] else 0.0
+            entry['estimated_bytes'] = entry['text_bytes'] + int(collection['vector_bytes'] * share)
+
+    orphaned_bytes = {name: _dir_size(os.path.join(persist_directory, name)) for name in orphaned}
+    sqlite_bytes = os.path.getsize(os.path.join(persist_directory, SQLITE_FILE))
+    return {
+        'persist_directory': os.path.abspath(persist_directory),
+        'total_bytes': _dir_size(persist_directory),
+        'sqlite': {
+            'bytes': sqlite_bytes,
+            'page_size': page_size,
+            'pages': page_count,
+            'free_pages': free_pages,
+            'reclaimable_bytes': free_pages * page_size,
+            'log_entries': log_entries
+        },
+        'collections': sorted(
+            (
+                {'name': c['name'], 'id': collection_id, 'dimension': c['dimension'], 'chunks': c['chunks'],
+                 'text_bytes': c['text_bytes'], 'vector_bytes': c['vector_bytes'], 'sources': c['sources']}
+                for collection_id, c in collections.items()
+            ),
+            key=lambda collection: collection['name']
+        ),
+        'orphaned_segments': [{'id': name, 'bytes': size} for name, size in orphaned_bytes.items()],
+        'reclaimable_bytes': free_pages * page_size + sum(orphaned_bytes.values())
+    }
+
+
+def compact(persist_directory: str) -> Dict[str, Any]:
+    """Delete orphaned segment directories and VACUUM the SQLite file.
+
+    Safe while clients have the store open, as long as the caller holds
+    maintenance_lock() so none of them writes. VACUUM rewrites the whole
+    file, needing that much free disk space.
+    """
+    started = time.perf_counter()
+    bytes_before = _dir_size(persist_directory)
+
+    db = _connect(persist_directory)
+    try:
+        orphaned = _orphaned_segments(persist_directory, db)
+    finally:
+        db.close()
+    removed = []
+    for name in orphaned:
+        path = os.path.join(persist_directory, name)
+        size = _dir_size(path)
+        try:
+            shutil.rmtree(path)
+            removed.append({'id': name, 'bytes': size})
+        except OSError as e:
+            print(f"Failed to remove orphaned segment {name}: {e}")
+
+    db = _connect(persist_directory, read_only=False)
+    try:
+        vacuum_started = time.perf_counter()
+        db.execute("VACUUM")
+        vacuum_seconds = time.perf_counter() - vacuum_started
+    finally:
+        db.close()
+
+    bytes_after = _dir_size(persist_directory)
+    return {
+        'removed_segments': removed,
+        'bytes_before': bytes_before,
+        'bytes_after': bytes_after,
+        'reclaimed_bytes': bytes_before - bytes_after,
+        'vacuum_seconds': round(vacuum_seconds, 3),
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    return float(np.percentile(values, pct)) if values else 0.0
+
+
+def probe(persist_directory: str, queries: int = 20, n_results: int = 5, seed: int = 0) -> Dict[str, Any]:
+    """Time opening the store and querying every non-empty collection in this process.
+
+    Queries use random vectors of each collection's dimension, so no
+    embedding model is loaded and only the index itself is measured.
+    """
+    import chromadb
+
+    started = time.perf_counter()
+    client = chromadb.PersistentClient(path=persist_directory)
+    collections = [client.get_collection(getattr(c, 'name', c)) for c in client.list_collections()]
+    open_seconds = time.perf_counter() - started
+
+    rng = np.random.default_rng(seed)
+    first_query_ms = {}
+    latencies = []
+    for collection in collections:
+        count = collection.count()
+        if not count:
+            continue
+        dimension = getattr(collection, 'dimension', None)
+        if not dimension:
+            dimension = len(collection.get(limit=1, include=['embeddings'])['embeddings'][0])
+        for index in range(queries + 1):
+            vector = rng.random(dimension, dtype=np.float32).tolist()
+            query_started = time.perf_counter()
+            collection.query(query_embeddings=[vector], n_results=min(n_results, count))
+            elapsed = (time.perf_counter() - query_started) * 1000
+            # The first query loads the index from disk
+            if index == 0:
+                first_query_ms[collection.name] = round(elapsed, 3)
+            else:
+                latencies.append(elapsed)
+
+    return {
+        'open_seconds': round(open_seconds, 4),
+        'collections': len(collections),
+        'first_query_ms': first_query_ms,
+        'query_p50_ms': round(_percentile(latencies, 50), 3),
+        'query_p99_ms': round(_percentile(latencies, 99), 3),
+        'queries': len(latencies)
+    }
+
+
+def measure(persist_directory: str, queries: int = 20, n_results: int = 5) -> Dict[str, Any]:
+    """Run probe() in a fresh interpreter, so nothing this process has loaded is reused"""
+    command = [
+        sys.executable, '-m', 'services.maintenance', 'probe',
+        '--persist-directory', os.path.abspath(persist_directory),
+        '--queries', str(queries), '--n-results', str(n_results)
+    ]
+    result = subprocess.run(command, cwd=_BACKEND_DIR, capture_output=True, text=True, timeout=600)
+    if result.returncode != 0:
+        raise Exception(f"Error measuring store: {result.stderr.strip()[-500:]}")
+    # Chroma may log to stdout; the report is the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def compact_and_measure(persist_directory: str, queries: int = 20,
+                        n_results: int = 5, measure_timing: bool = True) -> Dict[str, Any]:
+    """Compact the store, reporting its footprint and timings before and after.
+
+    Waits for running builds in every process to finish and holds off new
+    ones, and projects being opened, until it is done.
+    """
+    report: Dict[str, Any] = {}
+    with maintenance_lock(persist_directory):
+        if measure_timing:
+            report['timing_before'] = measure(persist_directory, queries, n_results)
+        report['compaction'] = compact(persist_directory)
+        if measure_timing:
+            report['timing_after'] = measure(persist_directory, queries, n_results)
+        report['footprint'] = disk_footprint(persist_directory)
+    return report
+
+
+def _format_bytes(size: float) -> str:
+    if size < 1024:
+        return f"{int(size)} B"
+    for unit in ('KB', 'MB', 'GB'):
+        size /= 1024
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report or reclaim disk space used by the Chroma store")
+    parser.add_argument("action", choices=("footprint", "compact", "probe"))
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--queries", type=int, default=20, help="Timed queries per collection")
+    parser.add_argument("--n-results", type=int, default=5)
+    parser.add_argument("--no-measure", action="store_true", help="Compact without timing the store")
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    args = parser.parse_args()
+
+    if args.action == "probe":
+        print(json.dumps(probe(args.persist_directory, args.queries, args.n_results)))
+        return
+
+    if args.action == "footprint":
+        report = disk_footprint(args.persist_directory)
+    else:
+        report = compact_and_measure(args.persist_directory, args.queries, args.n_results,
+                                     measure_timing=not args.no_measure)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    footprint = report if args.action == "footprint" else report['footprint']
+    if args.action == "compact":
+        compaction = report['compaction']
+        print(f"Removed {len(compaction['removed_segments'])} orphaned segment(s); "
+              f"{_format_bytes(compaction['bytes_before'])} -> {_format_bytes(compaction['bytes_after'])}")
+        for label in ('timing_before', 'timing_after'):
+            if label in report:
+                timing = report[label]
+                print(f"  {label.split('_')[1]:<6} open {timing['open_seconds']}s, "
+                      f"query p50 {timing['query_p50_ms']} ms, p99 {timing['query_p99_ms']} ms")
+    print(f"{footprint['persist_directory']}: {_format_bytes(footprint['total_bytes'])} "
+          f"({_format_bytes(footprint['reclaimable_bytes'])} reclaimable)")
+    for collection in footprint['collections']:
+        print(f"  {collection['name']:<40} {collection['chunks']:>7} chunks "
+              f"{_format_bytes(collection['vector_bytes'] + collection['text_bytes']):>10}")
+        for source, entry in sorted(collection['sources'].items()):
+            print(f"    {source:<38} {entry['chunks']:>7} chunks {_format_bytes(entry['estimated_bytes']):>10}")
+
+
+if __name__ == "__main__":
+    main()
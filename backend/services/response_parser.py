@@ -0,0 +1,128 @@
+import json
+from typing import Any, Dict, List, Tuple
+
+# Keys that mark a salvaged object as a test case rather than a nested value
+TEST_CASE_KEYS = ('test_id', 'test_scenario', 'steps')
+
+
+def strip_code_fence(text: str) -> str:
+    """Remove a surrounding ```json ... ``` fence if present"""
+    cleaned = text.strip()
+    if cleaned.startswith("```"):
+        cleaned = cleaned.strip("`")
+        # Remove optional language prefix like ```json
+        cleaned = cleaned.split("\n", 1)[-1]
+    return cleaned.strip()
+
+
+def strip_trailing_commas(text: str) -> str:
+    """Drop commas directly before a closing ``]`` or ``}``, leaving string literals untouched"""
+    output = []
+    comma = None
+    in_string = False
+    escaped = False
+
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char in ']}' and comma is not None:
+            output[comma] = ''
+            comma = None
+        elif char == ',':
+            comma = len(output)
+        elif char == '"':
+            in_string = True
+            comma = None
+        elif not char.isspace():
+            comma = None
+        output.append(char)
+
+    return ''.join(output)
+
+
+def parse_test_cases(output_text: str) -> Tuple[List[Dict[str, Any]], int]:
+    """Parse an LLM response into test case dicts.
+
+    Returns the test cases and how many of them had to be salvaged from
+    output that was not valid JSON as a whole (truncated arrays, stray
+    prose, trailing commas). Raises ValueError when nothing usable is found.
+    """
+    cleaned = strip_code_fence(output_text)
+    for candidate in (cleaned, strip_trailing_commas(cleaned)):
+        try:
+            return _as_test_case_list(json.loads(candidate)), 0
+        except (json.JSONDecodeError, ValueError):
+            continue
+
+    salvaged = salvage_objects(cleaned)
+    if not salvaged:
+        raise ValueError(f"Response was not valid JSON and no test cases could be salvaged\nRaw output: {output_text}")
+    return salvaged, len(salvaged)
+
+
+def _as_test_case_list(data: Any) -> List[Dict[str, Any]]:
+    if isinstance(data, dict):
+        # Some models wrap the array, e.g. {"test_cases": [...]}
+        wrapped = next((value for value in data.values() if isinstance(value, list)), None)
+        if wrapped is not None and not any(key in data for key in TEST_CASE_KEYS):
+            data = wrapped
+        else:
+            data = [data]
+    if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        raise ValueError("Expected a JSON array of objects")
+    return data
+
+
+def salvage_objects(text: str) -> List[Dict[str, Any]]:
+    """Recover every complete, parseable test case object from malformed JSON.
+
+    Scans for balanced ``{...}`` spans while respecting string literals, so
+    an object cut off by truncation is skipped but all earlier ones survive.
+    """
+    objects = []
+    depth = 0
+    start = None
+    in_string = False
+    escaped = False
+
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char == '{':
+            if depth == 0:
+                start = i
+            depth += 1
+        elif char == '}' and depth > 0:
+            depth -= 1
+            if depth == 0 and start is not None:
+                parsed = _load_object(text[start:i + 1])
+                if parsed is not None:
+                    objects.append(parsed)
+                start = None
+
+    return objects
+
+
+def _load_object(fragment: str):
+    for candidate in (fragment, strip_trailing_commas(fragment)):
+        try:
+            data = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(data, dict) and any(key in data for key in TEST_CASE_KEYS):
+            return data
+    return None
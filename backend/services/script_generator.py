@@ -1,27 +1,53 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import re
 from bs4 import BeautifulSoup
+from .cache import ResultCache
+from .deadline import Deadline
 from .knowledge_base import KnowledgeBase
+from .metrics import timed
+
+# Knowledge base context is only fetched with at least this much time left
+CONTEXT_MIN_SECONDS = 0.5
 
 class ScriptGenerator:
     """Generate Selenium test scripts from test cases"""
     
-    def __init__(self, knowledge_base: KnowledgeBase):
+    def __init__(self, knowledge_base: KnowledgeBase, cache_size: int = 128):
         self.knowledge_base = knowledge_base
+        self.cache = ResultCache(max_entries=cache_size)
     
-    def generate_selenium_script(self, test_case: Dict[str, Any], html_content: str) -> str:
-        """Generate Selenium Python script from test case and HTML"""
+    def generate_selenium_script(self, test_case: Dict[str, Any], html_content: str,
+                                 deadline: Optional[Deadline] = None,
+                                 knowledge_base: Optional[KnowledgeBase] = None) -> str:
+        """Generate Selenium Python script from test case and HTML, skipping KB context when short of time"""
+        knowledge_base = knowledge_base or self.knowledge_base
+        version = knowledge_base.version
+        cache_key = ResultCache.make_key(test_case, html_content, knowledge_base.collection_name)
+        cached = self.cache.get(cache_key, version)
+        if cached is not None:
+            return cached
+        
         try:
             # Parse HTML to extract selectors
-            soup = BeautifulSoup(html_content, 'html.parser')
-            selectors = self._extract_selectors(soup)
+            with timed('script_generator', 'parse_html'):
+                soup = BeautifulSoup(html_content, 'html.parser')
+                selectors = self._extract_selectors(soup)
             
             # Get additional context from knowledge base
-            context = self._get_relevant_context(test_case)
+            deadline = deadline or Deadline()
+            if deadline.remaining() < CONTEXT_MIN_SECONDS:
+                deadline.degrade('script', 'skipped_context', f'{deadline.remaining():.2f}s left')
+                context = ""
+            else:
+                with timed('script_generator', 'context'):
+                    context = self._get_relevant_context(test_case, deadline, knowledge_base)
             
             # Generate script based on test case type and feature
-            script = self._generate_script_template(test_case, selectors, context)
+            with timed('script_generator', 'render'):
+                script = self._generate_script_template(test_case, selectors, context)
             
+            if not deadline.degraded:
+                self.cache.put(cache_key, version, script)
             return script
             
         except Exception as e:
@@ -64,10 +90,11 @@ class ScriptGenerator:
         
         return selectors
     
-    def _get_relevant_context(self, test_case: Dict[str, Any]) -> str:
+    def _get_relevant_context(self, test_case: Dict[str, Any], deadline: Optional[Deadline] = None,
+                              knowledge_base: Optional[KnowledgeBase] = None) -> str:
         """Get relevant context from knowledge base"""
         query = f"{test_case['feature']} {test_case['test_scenario']}"
-        context_chunks = self.knowledge_base.query(query, n_results=3)
+        context_chunks = (knowledge_base or self.knowledge_base).query(query, n_results=3, deadline=deadline)
         
         context_parts = []
         for chunk in context_chunks:
@@ -0,0 +1,231 @@
+"""
+Portable knowledge base snapshots.
+
+A snapshot is a directory holding everything needed to serve a prebuilt
+index without parsing or embedding any document:
+
+    manifest.json     format version, embedding model, library versions,
+                      chunk count and a sha256 for every other file
+    embeddings.npy    float32 (chunks x dimension), loadable with mmap
+    chunks.json.gz    chunk ids, texts and metadata stored column by column
+    sources.json      the source manifest (see KnowledgeBase.list_sources)
+
+Build one where documents are processed, copy it to production nodes and
+load it with KnowledgeBase.import_snapshot (or KB_SNAPSHOT at startup):
+
+    cd backend && python -m services.snapshot export ./snapshots/kb-2024-06
+    cd backend && python -m services.snapshot verify ./snapshots/kb-2024-06
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime, timezone
+from importlib import metadata as package_metadata
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+EMBEDDINGS_FILE = 'embeddings.npy'
+CHUNKS_FILE = 'chunks.json.gz'
+SOURCES_FILE = 'sources.json'
+
+# (ids, texts, metadatas, embeddings) for a run of chunks
+ChunkBatch = Tuple[List[str], List[str], List[Dict[str, Any]], np.ndarray]
+
+
+class SnapshotError(Exception):
+    """A snapshot is missing, corrupt or incompatible with this knowledge base"""
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def library_versions() -> Dict[str, Optional[str]]:
+    versions = {}
+    for package in ('chromadb', 'sentence-transformers', 'numpy'):
+        try:
+            versions[package] = package_metadata.version(package)
+        except package_metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def write_snapshot(directory: str, chunk_count: int, dimension: int, batches: Iterable[ChunkBatch],
+                   sources: Dict[str, Dict[str, Any]], info: Dict[str, Any]) -> Dict[str, Any]:
+    """Write a snapshot directory atomically and return its manifest.
+
+    ``batches`` must yield exactly ``chunk_count`` chunks in total; their
+    embeddings are streamed into the memory-mapped output file.
+    """
+    directory = os.path.abspath(directory)
+    if os.path.exists(directory):
+        raise FileExistsError(f"Snapshot already exists: {directory}")
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    staging = os.path.join(parent, f".{os.path.basename(directory)}.tmp-{uuid.uuid4().hex}")
+    os.makedirs(staging)
+
+    try:
+        embeddings = np.lib.format.open_memmap(
+            os.path.join(staging, EMBEDDINGS_FILE), mode='w+', dtype=np.float32, shape=(chunk_count, dimension)
+        )
+        ids: List[str] = []
+        texts: List[str] = []
+        metadatas: List[Dict[str, Any]] = []
+        for batch_ids, batch_texts, batch_metadatas, batch_embeddings in batches:
+            start = len(ids)
+            embeddings[start:start + len(batch_ids)] = batch_embeddings
+            ids.extend(batch_ids)
+            texts.extend(batch_texts)
+            metadatas.extend(batch_metadatas)
+        if len(ids) != chunk_count:
+            raise SnapshotError(f"Expected {chunk_count} chunks but read {len(ids)}; was the index modified?")
+        embeddings.flush()
+        del embeddings
+
+        # One list per metadata key compresses far better than a list of dicts
+        keys = sorted({key for metadata in metadatas for key in metadata})
+        columns = {
+            'id': ids,
+            'text': texts,
+            'metadata': {key: [metadata.get(key) for metadata in metadatas] for key in keys}
+        }
+        with gzip.open(os.path.join(staging, CHUNKS_FILE), 'wt', encoding='utf-8') as f:
+            json.dump(columns, f, separators=(',', ':'))
+        with open(os.path.join(staging, SOURCES_FILE), 'w', encoding='utf-8') as f:
+            json.dump(sources, f, indent=2)
+
+        manifest = {
+            'format_version': SNAPSHOT_FORMAT_VERSION,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'chunk_count': chunk_count,
+            'embedding_dimension': dimension,
+            'source_count': len(sources),
+            'libraries': library_versions(),
+            **info,
+            'files': {
+                name: {
+                    'sha256': file_sha256(os.path.join(staging, name)),
+                    'bytes': os.path.getsize(os.path.join(staging, name))
+                }
+                for name in (EMBEDDINGS_FILE, CHUNKS_FILE, SOURCES_FILE)
+            }
+        }
+        with open(os.path.join(staging, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+        os.rename(staging, directory)
+        return manifest
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    path = os.path.join(directory, MANIFEST_FILE)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise SnapshotError(f"No snapshot manifest at {path}")
+    except ValueError as e:
+        raise SnapshotError(f"Unreadable snapshot manifest {path}: {str(e)}")
+
+    if manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError(
+            f"Snapshot format {manifest.get('format_version')} is not supported (expected {SNAPSHOT_FORMAT_VERSION})"
+        )
+    return manifest
+
+
+def verify_snapshot(directory: str, manifest: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Check every file against the manifest checksums; raise SnapshotError on a mismatch"""
+    manifest = manifest or read_manifest(directory)
+    for name, expected in manifest['files'].items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            raise SnapshotError(f"Snapshot file missing: {name}")
+        if os.path.getsize(path) != expected['bytes'] or file_sha256(path) != expected['sha256']:
+            raise SnapshotError(f"Checksum mismatch for {name}; the snapshot is corrupt or incomplete")
+    return manifest
+
+
+class Snapshot:
+    """A snapshot opened for reading; embeddings stay memory-mapped"""
+
+    def __init__(self, directory: str, verify: bool = True):
+        self.directory = directory
+        self.manifest = verify_snapshot(directory) if verify else read_manifest(directory)
+        self.embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode='r')
+        with gzip.open(os.path.join(directory, CHUNKS_FILE), 'rt', encoding='utf-8') as f:
+            self._columns = json.load(f)
+        with open(os.path.join(directory, SOURCES_FILE), 'r', encoding='utf-8') as f:
+            self.sources: Dict[str, Dict[str, Any]] = json.load(f)
+
+        expected_shape = (self.manifest['chunk_count'], self.manifest['embedding_dimension'])
+        if self.embeddings.shape != expected_shape or len(self._columns['id']) != expected_shape[0]:
+            raise SnapshotError(f"Snapshot contents do not match its manifest ({self.embeddings.shape} embeddings)")
+
+    def __len__(self) -> int:
+        return len(self._columns['id'])
+
+    def column(self, key: str) -> List[Any]:
+        """One metadata field for every chunk, in snapshot order"""
+        return self._columns['metadata'].get(key, [None] * len(self))
+
+    def metadata(self, index: int) -> Dict[str, Any]:
+        # Chroma metadata cannot hold None, which marks keys a chunk never had
+        return {
+            key: values[index] for key, values in self._columns['metadata'].items() if values[index] is not None
+        }
+
+    def batches(self, indices: List[int], batch_size: int) -> Iterable[ChunkBatch]:
+        """Chunks at ``indices`` in runs of at most batch_size"""
+        for start in range(0, len(indices), batch_size):
+            run = indices[start:start + batch_size]
+            yield (
+                [self._columns['id'][i] for i in run],
+                [self._columns['text'][i] for i in run],
+                [self.metadata(i) for i in run],
+                np.asarray(self.embeddings[run], dtype=np.float32)
+            )
+
+
+def main():
+    from .knowledge_base import KnowledgeBase
+
+    parser = argparse.ArgumentParser(description="Export, import or verify knowledge base snapshots")
+    parser.add_argument("action", choices=("export", "import", "verify"))
+    parser.add_argument("path", help="Snapshot directory")
+    parser.add_argument("--persist-directory", default="./chroma_db", help="Chroma store to export from or load into")
+    parser.add_argument("--skip-verify", action="store_true", help="Import without checking file checksums")
+    args = parser.parse_args()
+
+    if args.action == "verify":
+        manifest = verify_snapshot(args.path)
+        print(f"{args.path}: OK ({manifest['chunk_count']} chunks, {manifest['embedding_model']})")
+        return
+
+    knowledge_base = KnowledgeBase(persist_directory=args.persist_directory)
+    if args.action == "export":
+        manifest = knowledge_base.export_snapshot(args.path)
+        print(f"Exported {manifest['chunk_count']} chunks to {args.path}")
+    else:
+        manifest = knowledge_base.import_snapshot(args.path, verify=not args.skip_verify)
+        print(f"Loaded {manifest['chunk_count']} chunks from {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,423 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import json
+import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from .cache import ResultCache
+from .context_packer import ContextPacker
+from .deadline import Deadline
+from .jobs import JobStore
 from .knowledge_base import KnowledgeBase
-from .llm_client import GeminiClient
+from .llm_client import LLMClient
+from .metrics import timed
+from .tracing import propagate
+
+# Common e-commerce features to look for
+FEATURE_PATTERNS = {
+    'discount_code': ['discount', 'coupon', 'promo', 'save15'],
+    'cart': ['cart', 'add to cart', 'quantity', 'item'],
+    'shipping': ['shipping', 'delivery', 'standard', 'express'],
+    'payment': ['payment', 'credit card', 'paypal', 'pay now'],
+    'form_validation': ['validation', 'error', 'required', 'email'],
+    'user_details': ['name', 'email', 'address', 'user']
+}
+
+# Words marking a query that spans several features ("full checkout flow")
+# ("all" and "flow" are left out: "test all discount code errors" is narrow)
+BROAD_QUERY_TERMS = ['full', 'entire', 'complete', 'end-to-end', 'end to end', 'whole']
+
+# Time kept back from LLM calls so the rule-based fallback can still finish
+FALLBACK_RESERVE_SECONDS = 0.2
 
 class TestGenerator:
     """Generate test cases based on documentation and user queries"""
     
-    def __init__(self, knowledge_base: KnowledgeBase, llm_client: Optional[GeminiClient] = None):
+    def __init__(self, knowledge_base: KnowledgeBase, llm_client: Optional[LLMClient] = None,
+                 cache_size: int = 128, context_token_budget: Optional[int] = None,
+                 max_fan_out: int = 4, min_llm_seconds: Optional[float] = None,
+                 fan_out_workers: Optional[int] = None):
         self.knowledge_base = knowledge_base
         self.llm_client = llm_client
+        self.cache = ResultCache(max_entries=cache_size)
+        
+        if context_token_budget is None:
+            context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+        self.context_packer = ContextPacker(token_budget=context_token_budget)
+        
+        # Background LLM refinements started by generate_fast, keyed like the cache
+        self.jobs = JobStore()
+        self._refinements: Dict[str, str] = {}
+        self._refinements_lock = threading.Lock()
+        
+        # Broad queries are split into one LLM call per feature, run concurrently.
+        # A request takes at most max_fan_out of the shared workers and only
+        # idle ones, so requests never queue behind each other's calls
+        self.max_fan_out = max_fan_out
+        if fan_out_workers is None:
+            fan_out_workers = int(os.getenv("FAN_OUT_WORKERS", str(max_fan_out * 2)))
+        self._fan_out_executor = ThreadPoolExecutor(max_workers=fan_out_workers, thread_name_prefix="fan-out")
+        self._fan_out_slots = threading.BoundedSemaphore(fan_out_workers)
+        
+        # Below this much time left on a deadline the LLM is not worth calling
+        if min_llm_seconds is None:
+            min_llm_seconds = float(os.getenv("LLM_MIN_SECONDS", "2"))
+        self.min_llm_seconds = min_llm_seconds
+    
+    def generate_test_cases(self, query: str, filters: Optional[Dict[str, Any]] = None,
+                            token_budget: Optional[int] = None,
+                            report: Optional[Dict[str, Any]] = None,
+                            llm_client: Optional[LLMClient] = None,
+                            deadline: Optional[Deadline] = None,
+                            knowledge_base: Optional[KnowledgeBase] = None) -> List[Dict[str, Any]]:
+        """Generate test cases, reusing results until the knowledge base changes.
+        
+        ``filters`` scopes retrieval by source, content type or section; see
+        ``KnowledgeBase.query``. ``token_budget`` overrides the context budget
+        for this request, ``llm_client`` the default LLM provider and
+        ``knowledge_base`` the default (project) knowledge base. When
+        ``report`` is given it is filled with details of how the result was
+        produced (provider, context and prompt token counts).
+        
+        Every stage honours ``deadline``: retrieval fetches fewer chunks, the
+        LLM is skipped or cut short in favour of rule-based output and fan-out
+        returns the features finished in time. Shortcuts taken are recorded
+        on the deadline and such degraded results are not cached, nor is a
+        rule-based fallback standing in for a failed LLM call.
+        """
+        report = report if report is not None else {}
+        llm_client = llm_client or self.llm_client
+        knowledge_base = knowledge_base or self.knowledge_base
+        version = knowledge_base.version
+        cache_key = self._cache_key(query, filters, token_budget, llm_client, knowledge_base)
+        cached = self.cache.get(cache_key, version)
+        if cached is not None:
+            test_cases, cached_report = cached
+            report.update(cached_report, cached=True)
+            return test_cases
+        
+        deadline = deadline or Deadline()
+        test_cases = self._generate_test_cases(query, filters, token_budget, report, llm_client, deadline,
+                                               knowledge_base)
+        report['cached'] = False
+        if self._cacheable(report, llm_client, deadline):
+            self.cache.put(cache_key, version, (test_cases, dict(report)))
+        return test_cases
+    
+    def _cacheable(self, report: Dict[str, Any], llm_client: Optional[LLMClient], deadline: Deadline) -> bool:
+        """Whether a fresh result is what its cache key (which names the provider) stands for.
+        
+        With an LLM configured only LLM output is kept: a rule-based fallback
+        after an LLM error, or a fan-out missing failed features, is returned
+        once and the LLM is tried again on the next request. So is a fan-out
+        that left features out because workers were busy.
+        """
+        if deadline.degraded:
+            return False
+        if not (llm_client and llm_client.is_configured):
+            return True
+        fan_out = report.get('fan_out', {})
+        if fan_out.get('failed') or fan_out.get('dropped'):
+            return False
+        # No generator means no documentation matched; that is the same for every provider
+        return report.get('generator', 'llm') == 'llm'
+    
+    def generate_fast(self, query: str, filters: Optional[Dict[str, Any]] = None,
+                      token_budget: Optional[int] = None,
+                      report: Optional[Dict[str, Any]] = None,
+                      llm_client: Optional[LLMClient] = None,
+                      deadline: Optional[Deadline] = None,
+                      knowledge_base: Optional[KnowledgeBase] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Return rule-based test cases immediately and refine them with the LLM in the background.
+        
+        Returns the test cases and the id of the refinement job (see
+        ``get_refinement``), or None when no refinement is needed because the
+        LLM result is already cached or no LLM is configured.
+        """
+        report = report if report is not None else {}
+        llm_client = llm_client or self.llm_client
+        knowledge_base = knowledge_base or self.knowledge_base
+        version = knowledge_base.version
+        cache_key = self._cache_key(query, filters, token_budget, llm_client, knowledge_base)
+        cached = self.cache.get(cache_key, version)
+        if cached is not None:
+            test_cases, cached_report = cached
+            report.update(cached_report, cached=True)
+            return test_cases, None
+        
+        if not (llm_client and llm_client.is_configured):
+            return self.generate_test_cases(query, filters, token_budget, report, llm_client, deadline,
+                                            knowledge_base), None
+        
+        try:
+            context_chunks, context = self._retrieve_context(query, filters, token_budget, report, deadline,
+                                                             knowledge_base)
+            if not context_chunks:
+                return self._no_documentation_test_cases(), None
+            test_cases = self._generate_rule_based_test_cases(query, context, context_chunks)
+            report['generator'] = 'rule_based'
+            report['cached'] = False
+        except Exception as e:
+            raise Exception(f"Error generating test cases: {str(e)}")
+        
+        with self._refinements_lock:
+            job_id = self._refinements.get(cache_key)
+            job = self.jobs.get(job_id) if job_id else None
+            if job is None or job['status'] != 'pending':
+                # Held until the job finishes so a registry does not close the project under it
+                knowledge_base.acquire()
+                try:
+                    job_id = self.jobs.submit(self._refine, cache_key, query, filters, token_budget, llm_client,
+                                              knowledge_base)
+                except Exception:
+                    knowledge_base.release()
+                    raise
+                self._refinements[cache_key] = job_id
+        
+        return test_cases, job_id
+    
+    def _refine(self, cache_key: str, query: str, filters: Optional[Dict[str, Any]],
+                token_budget: Optional[int], llm_client: LLMClient,
+                knowledge_base: KnowledgeBase) -> Dict[str, Any]:
+        """Background job: run the full LLM-backed generation, which also fills the cache"""
+        try:
+            report = {}
+            test_cases = self.generate_test_cases(query, filters, token_budget, report, llm_client,
+                                                  knowledge_base=knowledge_base)
+            return {'test_cases': test_cases, 'report': report}
+        finally:
+            with self._refinements_lock:
+                self._refinements.pop(cache_key, None)
+            knowledge_base.release()
     
-    def generate_test_cases(self, query: str) -> List[Dict[str, Any]]:
+    def _cache_key(self, query: str, filters: Optional[Dict[str, Any]], token_budget: Optional[int],
+                   llm_client: Optional[LLMClient], knowledge_base: KnowledgeBase) -> str:
+        provider = llm_client.name if llm_client and llm_client.is_configured else None
+        # Projects share the cache; keying by collection keeps them from evicting each other's entries
+        return ResultCache.make_key(query, filters, token_budget, provider, knowledge_base.collection_name)
+    
+    def build_context(self, query: str, filters: Optional[Dict[str, Any]] = None,
+                      token_budget: Optional[int] = None,
+                      knowledge_base: Optional[KnowledgeBase] = None) -> Tuple[str, Dict[str, Any]]:
+        """Retrieve and pack the context exactly as generation would, for comparing providers"""
+        report = {}
+        _, context = self._retrieve_context(query, filters, token_budget, report, None, knowledge_base)
+        return context, report.get('context', {})
+    
+    def get_refinement(self, job_id: str, wait: float = 0) -> Optional[Dict[str, Any]]:
+        """Fetch a refinement job, blocking up to ``wait`` seconds for it to finish"""
+        return self.jobs.get(job_id, wait=wait)
+    
+    def _retrieve_context(self, query: str, filters: Optional[Dict[str, Any]], token_budget: Optional[int],
+                          report: Dict[str, Any], deadline: Optional[Deadline],
+                          knowledge_base: Optional[KnowledgeBase] = None) -> Tuple[List[Dict[str, Any]], str]:
+        """Retrieve relevant chunks and pack them into a prompt context"""
+        knowledge_base = knowledge_base or self.knowledge_base
+        with timed('test_generator', 'retrieve'):
+            context_chunks = knowledge_base.query(query, n_results=8, filters=filters, deadline=deadline)
+        if not context_chunks:
+            return context_chunks, ""
+        
+        # Build context string within the token budget
+        context, packing = self._build_context_string(context_chunks, token_budget)
+        report['context'] = packing
+        return context_chunks, context
+    
+    def _no_documentation_test_cases(self) -> List[Dict[str, Any]]:
+        return [{
+            "test_id": "TC-001",
+            "feature": "General",
+            "test_scenario": "No relevant documentation found",
+            "expected_result": "Please upload relevant documentation first",
+            "grounded_in": "No source",
+            "test_type": "informational"
+        }]
+    
+    def _generate_test_cases(self, query: str, filters: Optional[Dict[str, Any]],
+                             token_budget: Optional[int], report: Dict[str, Any],
+                             llm_client: Optional[LLMClient], deadline: Deadline,
+                             knowledge_base: KnowledgeBase) -> List[Dict[str, Any]]:
         """Generate test cases based on query and retrieved context"""
         try:
             # Retrieve relevant context from knowledge base
-            context_chunks = self.knowledge_base.query(query, n_results=8)
+            context_chunks, context = self._retrieve_context(query, filters, token_budget, report, deadline,
+                                                             knowledge_base)
             
             if not context_chunks:
-                return [{
-                    "test_id": "TC-001",
-                    "feature": "General",
-                    "test_scenario": "No relevant documentation found",
-                    "expected_result": "Please upload relevant documentation first",
-                    "grounded_in": "No source",
-                    "test_type": "informational"
-                }]
-            
-            # Build context string
-            context = self._build_context_string(context_chunks)
+                return self._no_documentation_test_cases()
             
             # Try LLM-backed generation first when configured
-            if self.llm_client and self.llm_client.is_configured:
+            use_llm = llm_client is not None and llm_client.is_configured
+            if use_llm and deadline.remaining() < self.min_llm_seconds:
+                deadline.degrade('generation', 'skipped_llm', f'{deadline.remaining():.2f}s left')
+                use_llm = False
+            
+            if use_llm:
+                report['provider'] = llm_client.name
+                features = self._plan_fan_out(query, context)
+                if features:
+                    with timed('test_generator', 'fan_out'):
+                        test_cases = self._generate_fan_out(query, features, filters, token_budget, report,
+                                                            llm_client, deadline, knowledge_base)
+                    if test_cases:
+                        report['generator'] = 'llm'
+                        return test_cases
+                    if deadline.remaining() < self.min_llm_seconds:
+                        deadline.degrade('generation', 'skipped_llm', 'no time left after fan-out')
+                        use_llm = False
+            
+            if use_llm:
+                # Added to the prompts of a fan-out that produced no cases
+                report['prompt_tokens'] = report.get('prompt_tokens', 0) + llm_client.estimate_prompt_tokens(query, context)
                 try:
-                    test_cases = self.llm_client.generate_test_cases(query, context)
+                    with timed('test_generator', 'llm'):
+                        test_cases = llm_client.generate_test_cases(query, context, timeout=self._llm_timeout(deadline))
                     if test_cases:
+                        report['generator'] = 'llm'
                         return test_cases
                 except Exception as llm_error:
-                    print(f"Gemini generation failed, falling back to rule-based logic: {llm_error}")
+                    if deadline.remaining() <= FALLBACK_RESERVE_SECONDS:
+                        deadline.degrade('generation', 'llm_timed_out')
+                    print(f"{llm_client.display_name} generation failed, falling back to rule-based logic: {llm_error}")
             
             # Fallback to rule-based generation
-            test_cases = self._generate_rule_based_test_cases(query, context, context_chunks)
+            with timed('test_generator', 'rule_based'):
+                test_cases = self._generate_rule_based_test_cases(query, context, context_chunks)
+            report['generator'] = 'rule_based'
             
             return test_cases
             
         except Exception as e:
             raise Exception(f"Error generating test cases: {str(e)}")
     
-    def _build_context_string(self, context_chunks: List[Dict[str, Any]]) -> str:
-        """Build context string from retrieved chunks"""
-        context_parts = []
-        for chunk in context_chunks:
-            source = chunk['metadata']['source']
-            text = chunk['text']
-            context_parts.append(f"[Source: {source}]\n{text}\n")
-        
-        return "\n".join(context_parts)
+    def _llm_timeout(self, deadline: Deadline) -> Optional[float]:
+        """Seconds an LLM call may take, leaving room for the rule-based fallback"""
+        remaining = deadline.remaining()
+        if remaining == float('inf'):
+            return None
+        return max(remaining - FALLBACK_RESERVE_SECONDS, 0.0)
+    
+    def _plan_fan_out(self, query: str, context: str) -> List[str]:
+        """Pick the features to generate separately for a query spanning several of them"""
+        features = list(self._extract_features(context, query))
+        query_lower = query.lower()
+        named = [
+            feature for feature in features
+            if any(keyword in query_lower for keyword in FEATURE_PATTERNS[feature])
+        ]
+        
+        words = set(re.findall(r"[\w-]+", query_lower))
+        broad = any(term in query_lower if ' ' in term else term in words for term in BROAD_QUERY_TERMS)
+        if len(named) < 2 and broad:
+            named = features
+        
+        return named[:self.max_fan_out] if len(named) >= 2 else []
+    
+    def _generate_fan_out(self, query: str, features: List[str], filters: Optional[Dict[str, Any]],
+                          token_budget: Optional[int], report: Dict[str, Any],
+                          llm_client: LLMClient, deadline: Deadline,
+                          knowledge_base: KnowledgeBase) -> List[Dict[str, Any]]:
+        """Generate each feature's test cases with its own context in concurrent LLM calls.
+        
+        Features that are not finished when the deadline runs out are left
+        out, so a slow feature costs its own cases rather than the whole batch.
+        Only as many features as there are idle workers are generated; with
+        fewer than two the query is not fanned out and an empty list is
+        returned.
+        """
+        slots = self._claim_fan_out_slots(len(features))
+        if slots < 2:
+            for _ in range(slots):
+                self._fan_out_slots.release()
+            report['fan_out'] = {'features': features, 'skipped': 'no idle workers'}
+            return []
+        dropped = features[slots:]
+        features = features[:slots]
+        
+        budget = token_budget or self.context_packer.token_budget
+        feature_budget = max(budget // len(features), 400)
+        prompt_tokens = {}
+        
+        def generate_feature(feature: str) -> Optional[List[Dict[str, Any]]]:
+            # Returns None when the deadline passed before the LLM call, freeing the worker
+            if deadline.expired:
+                return None
+            label = feature.replace('_', ' ')
+            feature_query = f"{query} ({label}: {', '.join(FEATURE_PATTERNS[feature][:3])})"
+            chunks = knowledge_base.query(feature_query, n_results=4, filters=filters, deadline=deadline)
+            if not chunks:
+                return []
+            feature_context, _ = self._build_context_string(chunks, feature_budget)
+            timeout = self._llm_timeout(deadline)
+            if timeout is not None and timeout <= 0:
+                return None
+            feature_prompt = f"{query}\nOnly cover the {label} feature."
+            prompt_tokens[feature] = llm_client.estimate_prompt_tokens(feature_prompt, feature_context)
+            return llm_client.generate_test_cases(feature_prompt, feature_context, timeout=timeout)
+        
+        futures = {}
+        for feature in features:
+            future = self._fan_out_executor.submit(propagate(generate_feature), feature)
+            future.add_done_callback(lambda _: self._fan_out_slots.release())
+            futures[feature] = future
+        wait(futures.values(), timeout=self._llm_timeout(deadline))
+        merged = []
+        seen = set()
+        failed = []
+        unfinished = []
+        for feature, future in futures.items():
+            if not future.done():
+                # Calls already running cannot be interrupted; their results are discarded
+                future.cancel()
+                unfinished.append(feature)
+                continue
+            try:
+                feature_cases = future.result()
+            except Exception as e:
+                print(f"Generation for feature {feature} failed: {e}")
+                failed.append(feature)
+                continue
+            if feature_cases is None:
+                unfinished.append(feature)
+                continue
+            
+            for test_case in feature_cases:
+                key = (str(test_case.get('feature', '')).lower(), str(test_case.get('test_scenario', '')).lower())
+                if key in seen:
+                    continue
+                seen.add(key)
+                merged.append(test_case)
+        
+        # Renumber so ids stay unique and sequential across features
+        for i, test_case in enumerate(merged, start=1):
+            test_case['test_id'] = f'TC-{i:03d}'
+        
+        if unfinished:
+            deadline.degrade('generation', 'partial_fan_out', f"dropped {', '.join(unfinished)}")
+        # Every prompt sent counts, including those of features left unfinished
+        report['prompt_tokens'] = sum(prompt_tokens.copy().values())
+        report['fan_out'] = {
+            'features': features,
+            'failed': failed,
+            'unfinished': unfinished,
+            'context_token_budget': feature_budget
+        }
+        if dropped:
+            report['fan_out']['dropped'] = dropped
+        return merged
+    
+    def _claim_fan_out_slots(self, wanted: int) -> int:
+        """Reserve up to ``wanted`` idle fan-out workers without waiting; returns how many were reserved"""
+        claimed = 0
+        while claimed < wanted and self._fan_out_slots.acquire(blocking=False):
+            claimed += 1
+        return claimed
+    
+    def _build_context_string(self, context_chunks: List[Dict[str, Any]],
+                              token_budget: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+        """Build context string from retrieved chunks, merging overlaps and fitting the token budget"""
+        with timed('test_generator', 'pack_context'):
+            return self.context_packer.pack(context_chunks, token_budget)
     
     def _generate_rule_based_test_cases(self, query: str, context: str, context_chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Generate test cases using rule-based approach"""
@@ -87,17 +449,7 @@ class TestGenerator:
         """Extract features and their specifications from context"""
         features = {}
         
-        # Common e-commerce features to look for
-        feature_patterns = {
-            'discount_code': ['discount', 'coupon', 'promo', 'save15'],
-            'cart': ['cart', 'add to cart', 'quantity', 'item'],
-            'shipping': ['shipping', 'delivery', 'standard', 'express'],
-            'payment': ['payment', 'credit card', 'paypal', 'pay now'],
-            'form_validation': ['validation', 'error', 'required', 'email'],
-            'user_details': ['name', 'email', 'address', 'user']
-        }
-        
-        for feature, keywords in feature_patterns.items():
+        for feature, keywords in FEATURE_PATTERNS.items():
             if any(keyword.lower() in context.lower() or keyword.lower() in query.lower() for keyword in keywords):
                 features[feature] = self._extract_feature_rules(feature, context)
         
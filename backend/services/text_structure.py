@@ -0,0 +1,218 @@
+"""
+Block structure of markdown-like text, and HTML rendered into that form.
+
+Structure-aware chunking (DocumentProcessor with chunk_mode='structure')
+works on blocks rather than characters: headings, paragraphs, lists,
+tables and code fences. A block is never cut unless it alone is larger
+than a chunk, so a list or table stays together with its lead-in line.
+
+HTML is first rendered to the same markdown-like text (``#`` headings,
+``-`` list items, ``|`` table rows) so one parser serves both formats.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from bs4 import BeautifulSoup, Comment, Declaration, Doctype, NavigableString, ProcessingInstruction
+
+# A block spans text[start:end] and has a kind: heading, paragraph, list,
+# table or code. Headings also carry their level and title.
+Block = Dict[str, Any]
+
+MARKDOWN_HEADING = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$')
+BANNER_HEADING = re.compile(r'^={3,}\s*(.+?)\s*={3,}$')
+LIST_ITEM = re.compile(r'^(\s*)(?:[-*+]|\d+[.)])\s+')
+TABLE_ROW = re.compile(r'^\s*\|')
+TABLE_SEPARATOR = re.compile(r'^\s*\|(?:\s*:?-+:?\s*\|)+\s*$')
+
+_HEADING_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+# Elements whose children are laid out as separate blocks
+_CONTAINER_TAGS = {
+    'html', 'body', 'main', 'article', 'section', 'div', 'header', 'footer', 'nav', 'aside', 'form',
+    'fieldset', 'figure', 'details', 'blockquote', 'p', 'dl', 'dt', 'dd', 'figcaption', 'address', 'center'
+}
+_SKIPPED_STRINGS = (Comment, Declaration, Doctype, ProcessingInstruction)
+
+
+def parse_heading(line: str) -> Optional[Dict[str, Any]]:
+    """Level and title of a markdown '#' heading or '=== TITLE ===' banner line"""
+    stripped = line.strip()
+    markdown = MARKDOWN_HEADING.match(stripped)
+    if markdown:
+        return {'level': len(markdown.group(1)), 'title': markdown.group(2)}
+    banner = BANNER_HEADING.match(stripped)
+    if banner:
+        return {'level': 1, 'title': banner.group(1)}
+    return None
+
+
+def parse_blocks(text: str) -> List[Block]:
+    """Split text into blocks separated by blank lines and headings.
+
+    A paragraph followed directly by a list (an "Options:" line) joins the
+    list, and list items separated by blank lines stay one list.
+    """
+    blocks: List[Block] = []
+    current: Optional[Block] = None
+    in_code = False
+    offset = 0
+
+    def close():
+        nonlocal current
+        if current is not None:
+            blocks.append(current)
+            current = None
+
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        line_end = offset + len(line.rstrip('\r\n'))
+        if in_code:
+            current['end'] = line_end
+            if stripped.startswith('```'):
+                in_code = False
+                close()
+        elif stripped.startswith('```'):
+            close()
+            current = {'start': offset, 'end': line_end, 'kind': 'code'}
+            in_code = True
+        elif not stripped:
+            close()
+        elif parse_heading(line):
+            close()
+            blocks.append({'start': offset, 'end': line_end, 'kind': 'heading', **parse_heading(line)})
+        else:
+            if TABLE_ROW.match(line):
+                kind = 'table'
+            elif LIST_ITEM.match(line) or (line[:1].isspace() and blocks and blocks[-1]['kind'] == 'list'):
+                kind = 'list'
+            else:
+                kind = 'paragraph'
+
+            if current is None and kind == 'list' and blocks and blocks[-1]['kind'] == 'list' \
+                    and not text[blocks[-1]['end']:offset].strip():
+                # A loose list: the blank line did not end it
+                current = blocks.pop()
+            if current is None:
+                current = {'start': offset, 'end': line_end, 'kind': kind}
+            elif current['kind'] == 'table' and kind != 'table':
+                close()
+                current = {'start': offset, 'end': line_end, 'kind': kind}
+            else:
+                if current['kind'] == 'paragraph' and kind in ('list', 'table'):
+                    current['kind'] = kind
+                current['end'] = line_end
+        offset += len(line)
+
+    close()
+    return blocks
+
+
+def split_points(text: str, block: Block) -> Tuple[List[int], str]:
+    """Offsets where an oversized list or table block may be cut, and the text to repeat after a cut.
+
+    Lists are cut before top-level items (the lead-in line stays with the
+    first item), tables before rows; a table's header row and separator are
+    kept with the first row and repeated on every later piece.
+    """
+    starts = []
+    offset = block['start']
+    indent = None
+    for line in text[block['start']:block['end']].splitlines(keepends=True):
+        if block['kind'] == 'table':
+            if TABLE_ROW.match(line):
+                starts.append(offset)
+        else:
+            item = LIST_ITEM.match(line)
+            if item:
+                if indent is None:
+                    indent = len(item.group(1))
+                if len(item.group(1)) <= indent:
+                    starts.append(offset)
+        offset += len(line)
+
+    if block['kind'] == 'table' and len(starts) > 2 and TABLE_SEPARATOR.match(text[starts[1]:starts[2]]):
+        return starts[3:], text[block['start']:starts[2]]
+    return starts[1:], ''
+
+
+def _collapse(text: str) -> str:
+    return ' '.join(text.split())
+
+
+def _render_list(element, depth: int = 0) -> List[str]:
+    lines = []
+    ordered = element.name == 'ol'
+    for number, item in enumerate(element.find_all('li', recursive=False), start=1):
+        words = []
+        nested = []
+        for child in item.children:
+            if getattr(child, 'name', None) in ('ul', 'ol'):
+                nested.extend(_render_list(child, depth + 1))
+            elif isinstance(child, NavigableString):
+                if not isinstance(child, _SKIPPED_STRINGS):
+                    words.append(str(child))
+            else:
+                words.append(child.get_text(' '))
+        marker = f"{number}." if ordered else '-'
+        lines.append(f"{'  ' * depth}{marker} {_collapse(' '.join(words))}".rstrip())
+        lines.extend(nested)
+    return lines
+
+
+def _render_table(element) -> List[str]:
+    lines = []
+    for index, row in enumerate(element.find_all('tr')):
+        cells = row.find_all(['th', 'td'])
+        if not cells:
+            continue
+        lines.append('| ' + ' | '.join(_collapse(cell.get_text(' ')) for cell in cells) + ' |')
+        if index == 0 and all(cell.name == 'th' for cell in cells):
+            lines.append('|' + ' --- |' * len(cells))
+    return lines
+
+
+def _render_blocks(element, blocks: List[str]):
+    inline: List[str] = []
+
+    def flush():
+        text = _collapse(' '.join(inline))
+        inline.clear()
+        if text:
+            blocks.append(text)
+
+    for child in element.children:
+        if isinstance(child, NavigableString):
+            if not isinstance(child, _SKIPPED_STRINGS):
+                inline.append(str(child))
+            continue
+        name = child.name
+        if name in _HEADING_TAGS:
+            flush()
+            title = _collapse(child.get_text(' '))
+            if title:
+                blocks.append(f"{'#' * int(name[1])} {title}")
+        elif name in ('ul', 'ol'):
+            flush()
+            blocks.append('\n'.join(_render_list(child)))
+        elif name == 'table':
+            flush()
+            blocks.append('\n'.join(_render_table(child)))
+        elif name == 'pre':
+            flush()
+            blocks.append(f"```\n{child.get_text().strip(chr(10))}\n```")
+        elif name in _CONTAINER_TAGS:
+            flush()
+            _render_blocks(child, blocks)
+        else:
+            inline.append(child.get_text(' '))
+    flush()
+
+
+def html_to_structured_text(html: str) -> str:
+    """Render HTML as markdown-like text that keeps headings, lists and tables recognisable"""
+    soup = BeautifulSoup(html, 'html.parser')
+    for element in soup(['script', 'style', 'noscript', 'template', 'head']):
+        element.decompose()
+    blocks: List[str] = []
+    _render_blocks(soup.body or soup, blocks)
+    return '\n\n'.join(block for block in blocks if block.strip())
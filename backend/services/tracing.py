@@ -0,0 +1,297 @@
+import contextvars
+import cProfile
+import functools
+import marshal
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+# "spans" records nested timings only; "sample" adds a sampling profile of the
+# threads working on the request; "cprofile" adds deterministic profiling
+PROFILE_MODES = ('spans', 'sample', 'cprofile')
+
+# From 3.12 cProfile hooks into sys.monitoring, which is process-wide: one
+# enabled profiler sees every thread, and a second one cannot be enabled
+PROCESS_WIDE_PROFILER = sys.version_info >= (3, 12)
+
+# Held by the one cprofile trace allowed to run at a time
+_cprofile_lock = threading.Lock()
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('qa_trace', default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar('qa_span', default=None)
+
+
+class ProfilerBusy(Exception):
+    """Another cprofile trace is already running in this process"""
+
+
+class Span:
+    """One timed step of a traced request"""
+
+    __slots__ = ('span_id', 'parent_id', 'name', 'attrs', 'thread', 'start', 'end', '_tokens', '_trace')
+
+    def __init__(self, trace: 'Trace', name: str, parent_id: Optional[int], attrs: Dict[str, Any]):
+        self._trace = trace
+        self.span_id = trace._next_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.thread = threading.current_thread().name
+        self.start = time.perf_counter()
+        self.end = None
+        self._tokens = None
+
+    def finish(self):
+        self.end = time.perf_counter()
+        if self._tokens is not None:
+            _current_span.reset(self._tokens)
+            self._tokens = None
+        self._trace._leave_thread()
+
+
+class Trace:
+    """Spans (and optionally a profile) collected for a single request.
+
+    Threads join the trace when they open a span in it; sampling only
+    covers threads while they are inside one of its spans. Only one cprofile
+    trace runs at a time. On Python 3.12+ it uses a single profiler for the
+    whole trace, so its data covers every thread in the process, including
+    work for other requests; earlier versions profile each thread inside
+    the trace's spans.
+    """
+
+    def __init__(self, name: str, mode: str = 'spans', sample_interval: float = 0.005):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.mode = mode
+        self.sample_interval = sample_interval
+        self.started_at = time.time()
+        self.duration_ms = None
+        self.spans: List[Span] = []
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self._span_ids = 0
+        # thread ident -> number of open spans in that thread
+        self._active: Dict[int, int] = {}
+        self._profiler: Optional[cProfile.Profile] = None
+        self._profilers: Dict[int, cProfile.Profile] = {}
+        self._finished_profilers: List[cProfile.Profile] = []
+        self._samples: Counter = Counter()
+        self._sample_count = 0
+        self._sampler = None
+        self._stop = threading.Event()
+
+    def _next_span_id(self) -> int:
+        with self._lock:
+            self._span_ids += 1
+            return self._span_ids
+
+    def _enter_thread(self):
+        ident = threading.get_ident()
+        with self._lock:
+            depth = self._active.get(ident, 0)
+            self._active[ident] = depth + 1
+        if depth == 0 and self.mode == 'cprofile' and not PROCESS_WIDE_PROFILER:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Something outside the traces already profiles this thread
+                return
+            self._profilers[ident] = profiler
+
+    def _leave_thread(self):
+        ident = threading.get_ident()
+        with self._lock:
+            depth = self._active.get(ident, 1) - 1
+            if depth:
+                self._active[ident] = depth
+            else:
+                self._active.pop(ident, None)
+        if depth == 0:
+            profiler = self._profilers.pop(ident, None)
+            if profiler is not None:
+                profiler.disable()
+                with self._lock:
+                    self._finished_profilers.append(profiler)
+
+    def start(self):
+        """Start the sampler or profiler; raises ProfilerBusy while another cprofile trace runs"""
+        if self.mode == 'sample':
+            self._sampler = threading.Thread(target=self._sample_loop, name=f"sampler-{self.trace_id[:8]}", daemon=True)
+            self._sampler.start()
+        elif self.mode == 'cprofile':
+            if not _cprofile_lock.acquire(blocking=False):
+                raise ProfilerBusy("Another cprofile trace is already running")
+            if PROCESS_WIDE_PROFILER:
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                except ValueError:
+                    _cprofile_lock.release()
+                    raise ProfilerBusy("Another profiler is already active in this process")
+                self._profiler = profiler
+
+    def finish(self):
+        self.duration_ms = round((time.perf_counter() - self._t0) * 1000, 3)
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+        if self.mode == 'cprofile':
+            if self._profiler is not None:
+                self._profiler.disable()
+                with self._lock:
+                    self._finished_profilers.append(self._profiler)
+                self._profiler = None
+            _cprofile_lock.release()
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.sample_interval):
+            with self._lock:
+                threads = [ident for ident in self._active if ident != own]
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            for ident in threads:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self._samples[";".join(reversed(stack))] += 1
+                self._sample_count += 1
+
+    def collapsed_stacks(self) -> str:
+        """Samples in the folded format read by flamegraph.pl and speedscope"""
+        return "".join(f"{stack} {count}\n" for stack, count in self._samples.most_common())
+
+    def pstats_dump(self) -> bytes:
+        """Merged cProfile data in the format written by ``pstats.Stats.dump_stats``"""
+        with self._lock:
+            profilers = list(self._finished_profilers)
+        if not profilers:
+            return b""
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        return marshal.dumps(stats.stats)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = list(self.spans)
+
+        nodes = {}
+        roots = []
+        for span in spans:
+            end = span.end if span.end is not None else time.perf_counter()
+            node = {
+                'name': span.name,
+                'start_ms': round((span.start - self._t0) * 1000, 3),
+                'duration_ms': round((end - span.start) * 1000, 3),
+                'thread': span.thread,
+                'children': []
+            }
+            if span.attrs:
+                node['attrs'] = span.attrs
+            nodes[span.span_id] = node
+            parent = nodes.get(span.parent_id)
+            (parent['children'] if parent is not None else roots).append(node)
+
+        summary = {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'mode': self.mode,
+            'started_at': self.started_at,
+            'duration_ms': self.duration_ms,
+            'spans': roots
+        }
+        if self.mode == 'sample':
+            summary['samples'] = self._sample_count
+        return summary
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def start_span(name: str, **attrs) -> Optional[Span]:
+    """Open a span in the active trace; returns None (and does nothing) when not tracing"""
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    parent = _current_span.get()
+    span = Span(trace, name, parent.span_id if parent is not None else None, attrs)
+    with trace._lock:
+        trace.spans.append(span)
+    trace._enter_thread()
+    span._tokens = _current_span.set(span)
+    return span
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a block as a child of the current span when a trace is active"""
+    active = start_span(name, **attrs)
+    try:
+        yield active
+    finally:
+        if active is not None:
+            active.finish()
+
+
+@contextmanager
+def traced(trace: Trace):
+    """Make ``trace`` the active trace for the block"""
+    trace.start()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.finish()
+        _current_trace.reset(token)
+
+
+def propagate(fn: Callable) -> Callable:
+    """Wrap fn so it runs in the caller's trace context when handed to another thread"""
+    if _current_trace.get() is None:
+        return fn
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+class TraceStore:
+    """Keep the most recent finished traces for download"""
+
+    def __init__(self, max_traces: int = 64):
+        self.max_traces = max_traces
+        self._traces: "OrderedDict[str, Trace]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace):
+        with self._lock:
+            self._traces[trace.trace_id] = trace
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        with self._lock:
+            return self._traces.get(trace_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            traces = list(self._traces.values())
+        return [
+            {'trace_id': trace.trace_id, 'name': trace.name, 'mode': trace.mode,
+             'started_at': trace.started_at, 'duration_ms': trace.duration_ms}
+            for trace in reversed(traces)
+        ]
@@ -0,0 +1,51 @@
+"""
+Size limits for uploaded files.
+
+Starlette parses a multipart upload into one SpooledTemporaryFile per file
+(kept in memory up to 1MB, then on disk) before the endpoint runs, and the
+document processor reads that file directly. A cap therefore has to act
+while the request body is received: UploadSizeLimit rejects a request whose
+Content-Length is too large outright, and stops reading one without a
+Content-Length as soon as it goes over.
+"""
+
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+
+class UploadTooLarge(Exception):
+    """An uploaded file exceeds the configured size cap"""
+
+
+class UploadSizeLimit:
+    """ASGI middleware capping the request body of the given paths at ``max_bytes`` (413 above it)"""
+
+    def __init__(self, app, max_bytes: int, paths=('/upload-documents',)):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or self.max_bytes <= 0 or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Upload is larger than the {self.max_bytes} byte request limit"
+        for name, value in scope['headers']:
+            if name == b'content-length' and value.isdigit() and int(value) > self.max_bytes:
+                await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.max_bytes:
+                    # Passed through the form parser to the exception handlers
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
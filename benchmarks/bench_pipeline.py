@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the QA Agent pipeline on synthetic corpora.
+
+Each scale runs in its own subprocess:
+
+    python benchmarks/bench_pipeline.py --scales 10,100 --output results.json
+    python benchmarks/bench_pipeline.py --scales 10,100 --compare results.json
+
+Stages timed: upload processing (DocumentProcessor.process_file, the path
+the API parses uploads with), knowledge base build, query latency without
+and with a section filter, test case generation (with the deterministic fake LLM) and script generation.
+Every stage gets untimed warm-up calls and is then run ``--repeats`` times;
+the median run's timings are reported, so neither one lucky run nor one
+disturbed by the rest of the machine decides the result. Peak RSS is
+measured per stage where the OS allows resetting it (Linux); elsewhere it
+is left out. ``--compare`` exits non-zero when a stage regressed by more
+than ``--threshold`` against an earlier run, ignoring timing changes
+smaller than ``--min-delta-ms`` per call.
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path.append(str(ROOT / "backend"))
+sys.path.append(str(BENCH_DIR))
+
+QUERY_TEMPLATES = [
+    "Generate test cases for {feature}",
+    "What are the validation rules for {feature}?",
+    "Negative scenarios for {feature} with invalid input",
+    "How should {feature} behave on mobile?",
+    "End-to-end checkout flow covering {feature}"
+]
+
+# Metrics where a larger value is better; every other compared metric is a cost
+HIGHER_IS_BETTER = {"throughput"}
+COMPARED_METRICS = ("p50_ms", "p99_ms", "seconds", "throughput", "peak_rss_mb")
+# Reported as the median over repeats; a best-of-N p99 would hide the tail it is meant to show
+REPEATED_METRICS = ("seconds", "throughput", "p50_ms", "p99_ms", "mean_ms", "peak_rss_mb")
+# Results before format 2 held a cumulative process peak RSS, not a per-stage one,
+# and before format 3 the best timings over repeats rather than the median ones
+REPORT_FORMAT = 3
+# Oldest baseline format each compared metric is measured the same way in
+COMPARABLE_SINCE = {"p50_ms": 3, "p99_ms": 3, "seconds": 3, "throughput": 3, "peak_rss_mb": 2}
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(q / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def reset_peak_rss() -> bool:
+    """Reset the process's peak RSS so the next reading covers one stage (Linux only)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as handle:
+            handle.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak RSS since the last reset_peak_rss(), or None where it cannot be read"""
+    try:
+        with open("/proc/self/status") as handle:
+            for line in handle:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def time_calls(items: List[Any], fn: Callable[[Any], Any], unit: str = "ops") -> Dict[str, Any]:
+    """Call fn for every item, returning latency percentiles and throughput"""
+    latencies = []
+    started = time.perf_counter()
+    for item in items:
+        call_started = time.perf_counter()
+        fn(item)
+        latencies.append((time.perf_counter() - call_started) * 1000)
+    elapsed = time.perf_counter() - started
+    return {
+        "count": len(items),
+        "seconds": round(elapsed, 4),
+        "throughput": round(len(items) / elapsed, 2) if elapsed else 0.0,
+        "throughput_unit": f"{unit}/s",
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0
+    }
+
+
+def measure(make_items: Callable[[int], List[Any]], fn: Callable[[Any], Any], unit: str,
+            repeats: int, warmup_items: List[Any]) -> Dict[str, Any]:
+    """Run a stage ``repeats`` times after calling fn untimed on ``warmup_items``.
+
+    ``make_items(repeat)`` gives the items of one run. Every timing and the
+    peak RSS are taken per run and their median over the runs is kept.
+    """
+    for item in warmup_items:
+        fn(item)
+
+    runs = []
+    for repeat in range(repeats):
+        items = make_items(repeat)
+        per_stage = reset_peak_rss()
+        run = time_calls(items, fn, unit)
+        run["peak_rss_mb"] = peak_rss_mb() if per_stage else None
+        runs.append(run)
+
+    result = dict(runs[-1], repeats=repeats)
+    for metric in REPEATED_METRICS:
+        values = [run[metric] for run in runs if run[metric] is not None]
+        result[metric] = round(statistics.median(values), 3) if values else None
+    return result
+
+
+def make_queries(count: int, offset: int = 0) -> List[str]:
+    from synthetic_corpus import FEATURES
+    queries = []
+    for i in range(offset, offset + count):
+        template = QUERY_TEMPLATES[i % len(QUERY_TEMPLATES)]
+        feature = FEATURES[(i // len(QUERY_TEMPLATES)) % len(FEATURES)]
+        # Suffix keeps every query distinct so result caches never short-circuit a measurement
+        queries.append(f"{template.format(feature=feature.lower())} #{i}")
+    return queries
+
+
+def run_scale(scale: int, queries: int, seed: int, workdir: str, repeats: int = 5,
+              warmup: int = 3) -> Dict[str, Any]:
+    """Benchmark every stage at one scale (runs inside a worker subprocess)"""
+    from synthetic_corpus import generate_corpus
+    from services.document_processor import DocumentProcessor
+    from services.knowledge_base import KnowledgeBase
+    from services.llm_providers import FakeLLMClient
+    from services.script_generator import ScriptGenerator
+    from services.test_generator import TestGenerator
+
+    results: Dict[str, Any] = {}
+    # Hands out query numbers never used before, so caches never answer a timed or warm-up call
+    fresh = itertools.count(step=queries + warmup)
+
+    started = time.perf_counter()
+    corpus = generate_corpus(scale, seed=seed)
+    corpus_bytes = sum(len(content) for _, content, _ in corpus)
+    results["corpus"] = {
+        "documents": len(corpus),
+        "bytes": corpus_bytes,
+        "generation_seconds": round(time.perf_counter() - started, 3)
+    }
+
+    # Uploads reach the processor as files on disk, so the stage parses files too
+    corpus_dir = os.path.join(workdir, "corpus")
+    os.makedirs(corpus_dir)
+    files = []
+    for name, content, content_type in corpus:
+        path = os.path.join(corpus_dir, name)
+        with open(path, "wb") as handle:
+            handle.write(content)
+        files.append((path, name, content_type))
+    del corpus
+
+    processor = DocumentProcessor()
+    documents: Dict[str, Dict[str, Any]] = {}
+
+    def process(file):
+        path, name, content_type = file
+        documents[name] = processor.process_file(path, name, content_type)
+
+    upload = measure(lambda repeat: files, process, "docs", repeats, files[:warmup])
+    upload["mb_per_second"] = round(corpus_bytes / (1024 * 1024) / upload["seconds"], 3) if upload["seconds"] else 0.0
+    results["upload"] = upload
+    documents = list(documents.values())
+
+    started = time.perf_counter()
+    knowledge_base = KnowledgeBase(persist_directory=os.path.join(workdir, "chroma"))
+    results["model_load_seconds"] = round(time.perf_counter() - started, 3)
+
+    build = measure(lambda repeat: [documents], knowledge_base.build_from_documents, "builds", repeats,
+                    [documents[:warmup]] if warmup else [])
+    build["chunks"] = knowledge_base.last_build_stats["chunks_indexed"]
+    build["chunks_per_second"] = round(build["chunks"] / build["seconds"], 2) if build["seconds"] else 0.0
+    results["build"] = build
+
+    results["query"] = measure(
+        lambda repeat: make_queries(queries, next(fresh)),
+        lambda text: knowledge_base.query(text, n_results=8),
+        "queries", repeats, make_queries(warmup, next(fresh))
+    )
+
+    # The section title shared by the most documents, so the filter spans the corpus
+    titles = collections.Counter(
+        section.split(" > ")[-1] for entry in knowledge_base.sources.values() for section in entry["sections"]
+    )
+    section_filter = {"sections": [titles.most_common(1)[0][0]]} if titles else None
+    results["query_filtered"] = measure(
+        lambda repeat: make_queries(queries, next(fresh)),
+        lambda text: knowledge_base.query(text, n_results=8, filters=section_filter),
+        "queries", repeats, make_queries(warmup, next(fresh))
+    )
+    results["query_filtered"]["filter"] = section_filter
+
+    generator = TestGenerator(knowledge_base, llm_client=FakeLLMClient(latency_seconds=0))
+    generated = []
+    results["generation"] = measure(
+        lambda repeat: make_queries(queries, next(fresh)),
+        lambda text: generated.extend(generator.generate_test_cases(text)),
+        "requests", repeats, make_queries(warmup, next(fresh))
+    )
+
+    html_content = (ROOT / "assets" / "checkout.html").read_text(encoding="utf-8")
+    script_generator = ScriptGenerator(knowledge_base)
+    test_cases = generated[:queries]
+
+    def script_cases(run: str) -> List[Dict[str, Any]]:
+        # A new test id per run keeps the script cache from answering
+        return [dict(test_case, test_id=f"TC-{run}-{i:04d}") for i, test_case in enumerate(test_cases)]
+
+    results["scripts"] = measure(
+        lambda repeat: script_cases(str(repeat)),
+        lambda test_case: script_generator.generate_selenium_script(test_case, html_content),
+        "scripts", repeats, script_cases("warmup")[:warmup]
+    )
+    return results
+
+
+def run_worker(scale: int, queries: int, seed: int, timeout: float, repeats: int, warmup: int) -> Dict[str, Any]:
+    """Run one scale in a fresh interpreter and return its results"""
+    with tempfile.TemporaryDirectory(prefix=f"qa-bench-{scale}x-") as workdir:
+        output = os.path.join(workdir, "result.json")
+        command = [
+            sys.executable, str(Path(__file__).resolve()), "--worker",
+            "--scale", str(scale), "--queries", str(queries), "--seed", str(seed),
+            "--repeats", str(repeats), "--warmup", str(warmup),
+            "--workdir", workdir, "--worker-output", output
+        ]
+        subprocess.run(command, check=True, timeout=timeout)
+        with open(output, encoding="utf-8") as handle:
+            return json.load(handle)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def time_delta_ms(metric: str, old: float, new: float, count: int) -> Optional[float]:
+    """How many milliseconds per call ``new`` is worse than ``old``, or None for metrics that are not times"""
+    if metric.endswith("_ms"):
+        return new - old
+    if metric == "seconds":
+        return (new - old) * 1000 / max(count, 1)
+    if metric == "throughput" and new:
+        return (1 / new - 1 / old) * 1000
+    return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float,
+            min_delta_ms: float = 0.0) -> List[str]:
+    """Describe every metric that got worse than the baseline by more than threshold.
+
+    Timing metrics must also have got worse by at least ``min_delta_ms`` per call.
+    """
+    regressions = []
+    baseline_format = baseline.get("meta", {}).get("format", 1)
+    metrics_compared = tuple(metric for metric in COMPARED_METRICS if baseline_format >= COMPARABLE_SINCE[metric])
+    for scale, stages in current["results"].items():
+        baseline_stages = baseline.get("results", {}).get(scale)
+        if not baseline_stages:
+            continue
+        for stage, metrics in stages.items():
+            baseline_metrics = baseline_stages.get(stage)
+            if not isinstance(metrics, dict) or not isinstance(baseline_metrics, dict):
+                continue
+            for metric in metrics_compared:
+                new, old = metrics.get(metric), baseline_metrics.get(metric)
+                if not isinstance(new, (int, float)) or not old:
+                    continue
+                change = (new - old) / old
+                worse = -change if metric in HIGHER_IS_BETTER else change
+                delta = time_delta_ms(metric, old, new, metrics.get("count", 1))
+                if worse > threshold and (delta is None or delta >= min_delta_ms):
+                    regressions.append(f"{scale} {stage}.{metric}: {old} -> {new} ({change:+.1%})")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n{'scale':>6} {'stage':<14} {'count':>6} {'p50 ms':>10} {'p99 ms':>10} {'throughput':>18} {'rss MB':>8}")
+    for scale, stages in report["results"].items():
+        for stage in ("upload", "build", "query", "query_filtered", "generation", "scripts"):
+            metrics = stages[stage]
+            throughput = f"{metrics['throughput']} {metrics['throughput_unit']}"
+            print(f"{scale:>6} {stage:<14} {metrics['count']:>6} {metrics['p50_ms']:>10} "
+                  f"{metrics['p99_ms']:>10} {throughput:>18} {metrics['peak_rss_mb'] or '-':>8}")
+        print(f"{scale:>6} corpus: {stages['corpus']['documents']} docs, "
+              f"{stages['corpus']['bytes'] / 1024:.0f} KiB, {stages['build']['chunks']} chunks indexed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the QA Agent pipeline on synthetic corpora")
+    parser.add_argument("--scales", default="10,100", help="Comma-separated multiples of assets/support_docs, e.g. 10,100,1000")
+    parser.add_argument("--queries", type=int, default=50, help="Queries, generations and scripts timed per scale")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per stage; the median is reported")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed calls per stage before timing")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline results JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed relative slowdown before flagging (0.15 = 15%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0,
+                        help="Per-call timing changes smaller than this are never flagged")
+    parser.add_argument("--timeout", type=float, default=3600, help="Seconds allowed per scale")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--scale", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        results = run_scale(args.scale, args.queries, args.seed, args.workdir, args.repeats, args.warmup)
+        with open(args.worker_output, "w", encoding="utf-8") as handle:
+            json.dump(results, handle)
+        return
+
+    scales = [int(scale) for scale in args.scales.split(",") if scale.strip()]
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "format": REPORT_FORMAT,
+            "seed": args.seed,
+            "queries": args.queries,
+            "repeats": args.repeats,
+            "warmup": args.warmup
+        },
+        "results": {}
+    }
+    for scale in scales:
+        print(f"Running {scale}x ...", flush=True)
+        report["results"][f"{scale}x"] = run_worker(scale, args.queries, args.seed, args.timeout, args.repeats,
+                                                    args.warmup)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            baseline = json.load(handle)
+        regressions = compare(report, baseline, args.threshold, args.min_delta_ms)
+        print(f"\nCompared with {args.compare} (revision {baseline.get('meta', {}).get('git_revision', '?')}):")
+        if baseline.get("meta", {}).get("format", 1) < REPORT_FORMAT:
+            print("  Baseline is from an older report format; metrics it measured differently are skipped")
+        if regressions:
+            for regression in regressions:
+                print(f"  REGRESSION {regression}")
+            sys.exit(1)
+        print(f"  No regressions above {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
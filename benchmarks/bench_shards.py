@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Build and query scaling of the sharded knowledge base.
+
+Indexes one synthetic corpus once per shard count and measures build time,
+sequential query latency, query latency with a product filter (which only
+touches the shard holding that product when sharding by product) and
+throughput under concurrent queries:
+
+    python benchmarks/bench_shards.py --scale 100 --shards 1,2,4,8 --shard-by product
+
+Documents are tagged with one of ``--products`` synthetic product names so
+both sharding strategies and product-filtered queries can be compared.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path.append(str(ROOT / "backend"))
+sys.path.append(str(BENCH_DIR))
+
+from bench_pipeline import make_queries, percentile, time_calls  # noqa: E402
+
+
+def concurrent_throughput(knowledge_base, queries: List[str], concurrency: int) -> Dict[str, Any]:
+    """Queries per second with ``concurrency`` threads sharing the query list"""
+    latencies: List[float] = []
+    lock = threading.Lock()
+    remaining = iter(queries)
+
+    def worker():
+        while True:
+            with lock:
+                text = next(remaining, None)
+            if text is None:
+                return
+            started = time.perf_counter()
+            knowledge_base.query(text, n_results=8)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "throughput": round(len(queries) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3)
+    }
+
+
+def run_shard_count(num_shards: int, shard_by: str, documents: List[Dict[str, Any]], products: List[str],
+                    queries: int, concurrency: int) -> Dict[str, Any]:
+    from services.knowledge_base import KnowledgeBase
+
+    with tempfile.TemporaryDirectory(prefix=f"qa-shards-{num_shards}-") as workdir:
+        knowledge_base = KnowledgeBase(
+            persist_directory=os.path.join(workdir, "chroma"), num_shards=num_shards, shard_by=shard_by
+        )
+        started = time.perf_counter()
+        knowledge_base.build_from_documents(documents)
+        build_seconds = time.perf_counter() - started
+        chunks = knowledge_base.last_build_stats["chunks_indexed"]
+
+        # Every query text is distinct, so the result cache never answers for the index
+        texts = make_queries(queries * 3)
+        query = time_calls(texts[:queries], lambda text: knowledge_base.query(text, n_results=8), unit="queries")
+        filtered = time_calls(
+            list(enumerate(texts[queries:queries * 2])),
+            lambda item: knowledge_base.query(
+                item[1], n_results=8, filters={"products": [products[item[0] % len(products)]]}
+            ),
+            unit="queries"
+        )
+        parallel = concurrent_throughput(knowledge_base, texts[queries * 2:], concurrency)
+
+        return {
+            "shards": num_shards,
+            "chunks": chunks,
+            "shard_chunks": knowledge_base.last_build_stats["shard_chunks"],
+            "build_seconds": round(build_seconds, 3),
+            "build_chunks_per_second": round(chunks / build_seconds, 2) if build_seconds else 0.0,
+            "query": query,
+            "filtered_query": filtered,
+            "concurrent_query": parallel
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark build and query scaling with shard count")
+    parser.add_argument("--scale", type=int, default=10, help="Corpus size in multiples of assets/support_docs")
+    parser.add_argument("--shards", default="1,2,4,8", help="Comma-separated shard counts")
+    parser.add_argument("--shard-by", choices=("source", "product"), default="source")
+    parser.add_argument("--products", type=int, default=8, help="Synthetic products documents are spread across")
+    parser.add_argument("--queries", type=int, default=100, help="Queries per measurement")
+    parser.add_argument("--concurrency", type=int, default=8, help="Threads for the concurrent measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    from synthetic_corpus import generate_corpus
+    from services.document_processor import DocumentProcessor
+
+    processor = DocumentProcessor()
+    products = [f"product-{index}" for index in range(args.products)]
+    documents = []
+    for index, (name, content, content_type) in enumerate(generate_corpus(args.scale, seed=args.seed)):
+        document = processor.process_document(content, name, content_type)
+        document["metadata"]["product"] = products[index % len(products)]
+        documents.append(document)
+
+    results = []
+    for num_shards in [int(count) for count in args.shards.split(",") if count.strip()]:
+        print(f"Running {num_shards} shard(s) ...", flush=True)
+        results.append(run_shard_count(num_shards, args.shard_by, documents, products,
+                                       args.queries, args.concurrency))
+
+    print(f"\n{len(documents)} documents, sharded by {args.shard_by}")
+    print(f"{'shards':>6} {'chunks':>7} {'build s':>8} {'chunks/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'filt p50':>9} {'filt p99':>9} {'qps @' + str(args.concurrency):>9}")
+    for result in results:
+        print(f"{result['shards']:>6} {result['chunks']:>7} {result['build_seconds']:>8} "
+              f"{result['build_chunks_per_second']:>9} {result['query']['p50_ms']:>8} {result['query']['p99_ms']:>8} "
+              f"{result['filtered_query']['p50_ms']:>9} {result['filtered_query']['p99_ms']:>9} "
+              f"{result['concurrent_query']['throughput']:>9}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump({"config": vars(args), "results": results}, handle, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
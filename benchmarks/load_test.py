@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Load test for the FastAPI backend with a local LLM stand-in.
+
+Starts the stub LLM server and a backend instance wired to it (or targets
+an already running backend with --base-url), seeds the knowledge base with
+a synthetic corpus, then drives mixed traffic at increasing concurrency:
+
+    python benchmarks/load_test.py --concurrency 1,4,16,32 --duration 30 \\
+        --latency-ms 800 --error-rate 0.02 --output load.json
+
+Reports throughput, p50/p95/p99 latency and error rate per endpoint and
+concurrency level.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import requests
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path.append(str(BENCH_DIR))
+
+from bench_pipeline import make_queries, percentile  # noqa: E402
+from stub_llm_server import add_behaviour_arguments, behaviour_from_args, start_stub_server  # noqa: E402
+from synthetic_corpus import CorpusGenerator, generate_corpus  # noqa: E402
+
+ENDPOINTS = ("generate", "script", "upload", "build")
+DEFAULT_MIX = "generate=60,script=30,upload=8,build=2"
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in mix: {name}")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def start_backend(port: int, llm_url: str, workdir: str) -> subprocess.Popen:
+    """Run uvicorn on the backend app with the stub LLM as its default provider"""
+    env = dict(
+        os.environ,
+        LLM_PROVIDER="openai_compatible",
+        LOCAL_LLM_BASE_URL=llm_url,
+        LOCAL_LLM_MODEL="stub-model",
+        PYTHONUNBUFFERED="1"
+    )
+    command = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--app-dir", str(ROOT / "backend"),
+        "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"
+    ]
+    # The backend keeps its Chroma data under the working directory
+    return subprocess.Popen(command, cwd=workdir, env=env)
+
+
+def wait_until_healthy(base_url: str, timeout: float = 180):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/health", timeout=2).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Backend at {base_url} did not become healthy within {timeout}s")
+
+
+class TrafficMix:
+    """Builds request payloads for each endpoint from a seeded random source"""
+
+    def __init__(self, documents: List[Dict[str, Any]], html_content: str, provider: str,
+                 query_pool: int, seed: int):
+        self.documents = documents
+        self.html_content = html_content
+        self.provider = provider
+        # A bounded pool of queries makes repeated queries (and cache hits) realistic
+        self.queries = make_queries(query_pool)
+        self.random = random.Random(seed)
+        self.corpus = CorpusGenerator(seed=seed + 1)
+        self.test_cases: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def request(self, session: requests.Session, base_url: str, endpoint: str, timeout: float) -> requests.Response:
+        with self._lock:
+            roll = self.random.random()
+            query = self.random.choice(self.queries)
+            test_case = self.random.choice(self.test_cases) if self.test_cases else None
+
+        if endpoint == "generate":
+            response = session.post(f"{base_url}/generate-test-cases",
+                                    json={"query": query, "provider": self.provider}, timeout=timeout)
+            if response.ok:
+                with self._lock:
+                    if len(self.test_cases) < 500:
+                        self.test_cases.extend(response.json().get("test_cases", [])[:2])
+            return response
+
+        if endpoint == "script":
+            test_case = test_case or {
+                "test_id": "TC-001", "feature": "Discount Code", "test_scenario": "Apply valid discount code SAVE15",
+                "expected_result": "Total price is reduced by 15%", "grounded_in": "product_specs.md",
+                "test_type": "positive"
+            }
+            return session.post(f"{base_url}/generate-script",
+                                json={"test_case": test_case, "html_content": self.html_content}, timeout=timeout)
+
+        if endpoint == "upload":
+            with self._lock:
+                name, content, content_type = self.corpus.document("md", int(roll * 1e6))
+            return session.post(f"{base_url}/upload-documents",
+                                files=[("files", (name, content, content_type))], timeout=timeout)
+
+        return session.post(f"{base_url}/build-knowledge-base", json=self.documents, timeout=timeout)
+
+
+def run_level(base_url: str, mix: TrafficMix, weights: Dict[str, float], concurrency: int,
+              duration: float, timeout: float, seed: int) -> Dict[str, Any]:
+    """Drive traffic from ``concurrency`` closed-loop workers for ``duration`` seconds"""
+    samples: Dict[str, List[Tuple[float, bool, str]]] = defaultdict(list)
+    # How generation requests were served: by the LLM, the rule-based fallback or the cache
+    generators: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+    names = list(weights)
+    weight_values = list(weights.values())
+
+    def worker(worker_id: int):
+        rng = random.Random(seed * 1000 + worker_id)
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            endpoint = rng.choices(names, weights=weight_values)[0]
+            started = time.perf_counter()
+            try:
+                response = mix.request(session, base_url, endpoint, timeout)
+                ok, error = response.ok, "" if response.ok else f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                response, ok, error = None, False, type(e).__name__
+            elapsed = (time.perf_counter() - started) * 1000
+            generator = None
+            if endpoint == "generate" and ok:
+                report = response.json().get("report", {})
+                generator = "cache" if report.get("cached") else report.get("generator", "none")
+            with lock:
+                samples[endpoint].append((elapsed, ok, error))
+                if generator:
+                    generators[generator] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    endpoints = {}
+    for endpoint, results in samples.items():
+        latencies = [latency for latency, _, _ in results]
+        errors = defaultdict(int)
+        for _, ok, error in results:
+            if not ok:
+                errors[error] += 1
+        endpoints[endpoint] = {
+            "requests": len(results),
+            "throughput_rps": round(len(results) / wall, 2),
+            "error_rate": round(sum(errors.values()) / len(results), 4),
+            "errors": dict(errors),
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "max_ms": round(max(latencies), 1)
+        }
+    total = sum(stats["requests"] for stats in endpoints.values())
+    return {
+        "concurrency": concurrency,
+        "seconds": round(wall, 2),
+        "requests": total,
+        "throughput_rps": round(total / wall, 2),
+        "endpoints": endpoints,
+        "generation_served_by": dict(generators)
+    }
+
+
+def seed_knowledge_base(base_url: str, scale: int, seed: int) -> List[Dict[str, Any]]:
+    """Upload and index a synthetic corpus; returns the processed documents for rebuild traffic"""
+    corpus = generate_corpus(scale, seed=seed)
+    files = [("files", (name, content, content_type)) for name, content, content_type in corpus]
+    response = requests.post(f"{base_url}/upload-documents", files=files, timeout=600)
+    response.raise_for_status()
+    documents = response.json()["documents"]
+    requests.post(f"{base_url}/build-knowledge-base", json=documents, timeout=1800).raise_for_status()
+    return documents
+
+
+def print_level(level: Dict[str, Any]):
+    print(f"\nconcurrency {level['concurrency']}: {level['requests']} requests, {level['throughput_rps']} req/s")
+    print(f"  {'endpoint':<10} {'reqs':>6} {'req/s':>8} {'err%':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for endpoint in ENDPOINTS:
+        stats = level["endpoints"].get(endpoint)
+        if stats:
+            print(f"  {endpoint:<10} {stats['requests']:>6} {stats['throughput_rps']:>8} "
+                  f"{stats['error_rate'] * 100:>5.1f}% {stats['p50_ms']:>9} {stats['p95_ms']:>9} "
+                  f"{stats['p99_ms']:>9} {stats['max_ms']:>9}")
+    if level["generation_served_by"]:
+        served = ", ".join(f"{name}={count}" for name, count in sorted(level["generation_served_by"].items()))
+        print(f"  generation served by: {served}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the QA Agent backend against a stub LLM")
+    parser.add_argument("--base-url", help="Use a running backend instead of starting one")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the backend started by this script")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of traffic per level")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Endpoint weights, e.g. generate=60,script=30,upload=8,build=2")
+    parser.add_argument("--scale", type=int, default=1, help="Synthetic corpus size in multiples of assets/support_docs")
+    parser.add_argument("--query-pool", type=int, default=200, help="Distinct queries to draw generation requests from")
+    parser.add_argument("--provider", default="openai_compatible", help="LLM provider requested for generation")
+    parser.add_argument("--request-timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    weights = parse_mix(args.mix)
+    stub = start_stub_server(behaviour_from_args(args))
+    llm_url = f"http://127.0.0.1:{stub.server_address[1]}/v1"
+    print(f"Stub LLM at {llm_url} ({args.latency_dist}, mean {args.latency_ms} ms, "
+          f"{args.error_rate:.0%} errors, {args.malformed_rate:.0%} malformed)")
+
+    backend = None
+    workdir = tempfile.TemporaryDirectory(prefix="qa-load-")
+    base_url = args.base_url
+    try:
+        if base_url is None:
+            base_url = f"http://127.0.0.1:{args.port}"
+            backend = start_backend(args.port, llm_url, workdir.name)
+        wait_until_healthy(base_url)
+
+        print(f"Seeding knowledge base with a {args.scale}x corpus ...", flush=True)
+        documents = seed_knowledge_base(base_url, args.scale, args.seed)
+        html_content = (ROOT / "assets" / "checkout.html").read_text(encoding="utf-8")
+        mix = TrafficMix(documents, html_content, args.provider, args.query_pool, args.seed)
+
+        levels = []
+        for concurrency in [int(level) for level in args.concurrency.split(",") if level.strip()]:
+            level = run_level(base_url, mix, weights, concurrency, args.duration, args.request_timeout, args.seed)
+            print_level(level)
+            levels.append(level)
+
+        report = {
+            "config": {key: value for key, value in vars(args).items()},
+            "stub_llm": dict(stub.RequestHandlerClass.behaviour.counts),
+            "levels": levels
+        }
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as handle:
+                json.dump(report, handle, indent=2)
+            print(f"\nResults written to {args.output}")
+    finally:
+        if backend is not None:
+            backend.terminate()
+            backend.wait(timeout=30)
+        stub.shutdown()
+        workdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
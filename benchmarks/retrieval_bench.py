@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Retrieval quality and latency benchmark over a labeled query set.
+
+Indexes assets/support_docs once per chunking / embedding / index
+configuration and runs the queries in retrieval_queries.json against it:
+
+    python benchmarks/retrieval_bench.py --chunk-sizes 500,1000,1500 --overlaps 100,200
+    python benchmarks/retrieval_bench.py --models all-MiniLM-L6-v2,all-mpnet-base-v2 \\
+        --hnsw "M=16;M=32,search_ef=100" --output retrieval.json
+    python benchmarks/retrieval_bench.py --chunk-modes fixed,structure \\
+        --sources product_specs.md,ui_ux_guide.txt
+
+Reports recall@k, MRR and query latency per configuration, then recommends
+the fastest configuration whose recall@5 is within ``--tolerance`` of the
+best one. A retrieved chunk counts as relevant to a labeled item when it
+comes from the item's source and contains the item's phrase, so labels do
+not depend on where chunk boundaries fall.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path.append(str(ROOT / "backend"))
+sys.path.append(str(BENCH_DIR))
+
+from bench_pipeline import percentile  # noqa: E402
+
+SUPPORT_DOCS = ROOT / "assets" / "support_docs"
+DEFAULT_QUERIES = BENCH_DIR / "retrieval_queries.json"
+CONTENT_TYPES = {".md": "text/markdown", ".txt": "text/plain", ".json": "application/json"}
+# Short names accepted by --hnsw, mapped to Chroma collection metadata keys
+HNSW_KEYS = {"M": "hnsw:M", "construction_ef": "hnsw:construction_ef", "search_ef": "hnsw:search_ef"}
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def parse_hnsw(value: str) -> List[Dict[str, int]]:
+    """'M=16;M=32,search_ef=100' -> [{'hnsw:M': 16}, {'hnsw:M': 32, 'hnsw:search_ef': 100}]"""
+    variants = []
+    for variant in value.split(";"):
+        params = {}
+        for pair in variant.split(","):
+            if not pair.strip():
+                continue
+            key, _, number = pair.partition("=")
+            if key.strip() not in HNSW_KEYS:
+                raise ValueError(f"Unknown HNSW parameter: {key} (expected one of {', '.join(HNSW_KEYS)})")
+            params[HNSW_KEYS[key.strip()]] = int(number)
+        variants.append(params)
+    return variants
+
+
+def load_documents(include_scenarios: bool, sources: List[str] = None) -> List[Any]:
+    """(filename, content, content type) for each support doc, or only for ``sources``"""
+    documents = []
+    for path in sorted(SUPPORT_DOCS.iterdir()):
+        if path.suffix not in CONTENT_TYPES or (sources and path.name not in sources):
+            continue
+        # The queries are written from the scenarios, so indexing them would leak the answers
+        if path.name == "test_scenarios.md" and not include_scenarios:
+            continue
+        documents.append((path.name, path.read_bytes(), CONTENT_TYPES[path.suffix]))
+    return documents
+
+
+def restrict_queries(queries: List[Dict[str, Any]], sources: List[str]) -> List[Dict[str, Any]]:
+    """Keep only the labeled items from ``sources``; queries left without any are dropped"""
+    restricted = []
+    for query in queries:
+        relevant = [item for item in query["relevant"] if item["source"] in sources]
+        if relevant:
+            restricted.append({**query, "relevant": relevant})
+    return restricted
+
+
+def chunk_matches(result: Dict[str, Any], item: Dict[str, str]) -> bool:
+    metadata = result["metadata"]
+    # Text repeated across sources is returned once, listing the other sources in also_in
+    if item["source"] != metadata.get("source") and item["source"] not in metadata.get("also_in", []):
+        return False
+    return normalize(item["contains"]) in normalize(result["text"])
+
+
+def score_query(results: List[Dict[str, Any]], relevant: List[Dict[str, str]], ks: List[int]) -> Dict[str, Any]:
+    """Recall@k over the labeled items and the reciprocal rank of the first relevant chunk"""
+    first_hit = {}
+    for rank, result in enumerate(results, start=1):
+        for index, item in enumerate(relevant):
+            if index not in first_hit and chunk_matches(result, item):
+                first_hit[index] = rank
+    best_rank = min(first_hit.values()) if first_hit else None
+    return {
+        "recall": {k: sum(1 for rank in first_hit.values() if rank <= k) / len(relevant) for k in ks},
+        "reciprocal_rank": 1 / best_rank if best_rank else 0.0,
+        "first_relevant_rank": best_rank
+    }
+
+
+def run_config(config: Dict[str, Any], documents: List[Any], queries: List[Dict[str, Any]],
+               ks: List[int], repeats: int) -> Dict[str, Any]:
+    """Index the documents with one configuration and evaluate every query"""
+    from services.document_processor import DocumentProcessor
+    from services.knowledge_base import KnowledgeBase
+
+    processor = DocumentProcessor(chunk_size=config["chunk_size"], chunk_overlap=config["chunk_overlap"],
+                                  chunk_mode=config["chunk_mode"])
+    processed = [processor.process_document(content, name, content_type) for name, content, content_type in documents]
+    chunk_lengths = [len(chunk["text"]) for document in processed for chunk in document["chunks"]]
+
+    with tempfile.TemporaryDirectory(prefix="qa-retrieval-") as workdir:
+        knowledge_base = KnowledgeBase(
+            persist_directory=os.path.join(workdir, "chroma"),
+            embedding_model_name=config["model"],
+            index_params=config["index_params"]
+        )
+        started = time.perf_counter()
+        knowledge_base.build_from_documents(processed)
+        build_seconds = time.perf_counter() - started
+
+        n_results = max(ks)
+        # One untimed query loads lazily initialised index structures
+        knowledge_base.query(queries[0]["query"], n_results=n_results)
+        latencies = []
+        per_query = []
+        for query in queries:
+            for _ in range(repeats):
+                # Results are cached per knowledge base version; clear so every repeat hits the index
+                knowledge_base.query_cache.clear()
+                started = time.perf_counter()
+                results = knowledge_base.query(query["query"], n_results=n_results)
+                latencies.append((time.perf_counter() - started) * 1000)
+            scores = score_query(results, query["relevant"], ks)
+            per_query.append({"id": query["id"], **scores})
+        chunks = knowledge_base.last_build_stats["chunks_indexed"]
+
+    return {
+        "config": config,
+        "chunks": chunks,
+        "avg_chunk_chars": round(sum(chunk_lengths) / max(len(chunk_lengths), 1)),
+        "build_seconds": round(build_seconds, 3),
+        "recall": {f"@{k}": round(sum(q["recall"][k] for q in per_query) / len(per_query), 4) for k in ks},
+        "mrr": round(sum(q["reciprocal_rank"] for q in per_query) / len(per_query), 4),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "misses": [q["id"] for q in per_query if q["first_relevant_rank"] is None]
+    }
+
+
+def recommend(results: List[Dict[str, Any]], recall_key: str, tolerance: float) -> Dict[str, Any]:
+    """Fastest configuration whose recall is within tolerance of the best"""
+    best_recall = max(result["recall"][recall_key] for result in results)
+    eligible = [result for result in results if result["recall"][recall_key] >= best_recall - tolerance]
+    return min(eligible, key=lambda result: (result["p50_ms"], -result["mrr"]))
+
+
+def describe(config: Dict[str, Any]) -> str:
+    index = ",".join(f"{key.split(':', 1)[1]}={value}" for key, value in config["index_params"].items())
+    return f"{config['model']} {config['chunk_mode']} size={config['chunk_size']} overlap={config['chunk_overlap']}" + (
+        f" {index}" if index else "")
+
+
+def print_report(results: List[Dict[str, Any]], ks: List[int]):
+    recall_headers = "".join(f"{'R@' + str(k):>7}" for k in ks)
+    print(f"\n{'configuration':<70} {'chunks':>6} {'avg ch':>6}{recall_headers} {'MRR':>6} {'p50 ms':>8} "
+          f"{'p99 ms':>8} {'build s':>8}")
+    for result in results:
+        recalls = "".join(f"{result['recall'][f'@{k}']:>7.3f}" for k in ks)
+        print(f"{describe(result['config']):<70} {result['chunks']:>6} {result['avg_chunk_chars']:>6}{recalls} "
+              f"{result['mrr']:>6.3f} "
+              f"{result['p50_ms']:>8} {result['p99_ms']:>8} {result['build_seconds']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality and latency per configuration")
+    parser.add_argument("--queries", default=str(DEFAULT_QUERIES), help="Labeled query set (JSON)")
+    parser.add_argument("--chunk-sizes", default="500,1000,1500", help="Comma-separated chunk sizes in characters")
+    parser.add_argument("--overlaps", default="100,200", help="Comma-separated chunk overlaps in characters")
+    parser.add_argument("--chunk-modes", default="fixed", help="Comma-separated chunking modes (fixed, structure)")
+    parser.add_argument("--models", default=None, help="Comma-separated sentence-transformers models "
+                                                       "(default: the knowledge base default)")
+    parser.add_argument("--hnsw", default="", help="';'-separated HNSW variants, e.g. 'M=16;M=32,search_ef=100'")
+    parser.add_argument("--k", default="1,3,5,8", help="Cut-offs for recall@k; the largest is the n_results queried")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs of each query")
+    parser.add_argument("--tolerance", type=float, default=0.02,
+                        help="Recall@5 a recommended configuration may give up against the best one")
+    parser.add_argument("--include-scenarios", action="store_true",
+                        help="Also index test_scenarios.md, which the queries were written from")
+    parser.add_argument("--sources", default="", help="Comma-separated support docs to index and score against "
+                                                      "(default: all)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    from services.document_processor import CHUNK_MODES
+    from services.knowledge_base import DEFAULT_EMBEDDING_MODEL
+
+    with open(args.queries, encoding="utf-8") as handle:
+        queries = json.load(handle)["queries"]
+    ks = sorted(parse_int_list(args.k))
+    models = [m.strip() for m in (args.models or DEFAULT_EMBEDDING_MODEL).split(",") if m.strip()]
+    sources = [s.strip() for s in args.sources.split(",") if s.strip()]
+    documents = load_documents(args.include_scenarios, sources)
+    if sources:
+        queries = restrict_queries(queries, sources)
+        if not queries:
+            parser.error(f"No labeled queries refer to {', '.join(sources)}")
+    chunk_modes = [m.strip() for m in args.chunk_modes.split(",") if m.strip()]
+    for mode in chunk_modes:
+        if mode not in CHUNK_MODES:
+            parser.error(f"Unknown chunk mode: {mode} (expected one of {', '.join(CHUNK_MODES)})")
+
+    configs = [
+        {"model": model, "chunk_mode": mode, "chunk_size": size, "chunk_overlap": overlap,
+         "index_params": index_params}
+        for model, mode, size, overlap, index_params in itertools.product(
+            models, chunk_modes, parse_int_list(args.chunk_sizes), parse_int_list(args.overlaps),
+            parse_hnsw(args.hnsw))
+        if overlap < size
+    ]
+
+    results = []
+    for number, config in enumerate(configs, start=1):
+        print(f"[{number}/{len(configs)}] {describe(config)}", flush=True)
+        results.append(run_config(config, documents, queries, ks, args.repeats))
+
+    print_report(results, ks)
+    recall_key = "@5" if 5 in ks else f"@{ks[-1]}"
+    best = recommend(results, recall_key, args.tolerance)
+    print(f"\nRecommended: {describe(best['config'])} "
+          f"(recall{recall_key} {best['recall'][recall_key]:.3f}, MRR {best['mrr']:.3f}, p50 {best['p50_ms']} ms)")
+    if best["misses"]:
+        print(f"  queries with no relevant chunk in the top {ks[-1]}: {', '.join(best['misses'])}")
+
+    if args.output:
+        report = {
+            "queries": len(queries),
+            "documents": [name for name, _, _ in documents],
+            "k": ks,
+            "results": results,
+            "recommended": best["config"]
+        }
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
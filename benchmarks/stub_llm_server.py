@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for a hosted LLM, speaking the OpenAI chat completions API.
+
+Point the backend at it with LLM_PROVIDER=openai_compatible and
+LOCAL_LLM_BASE_URL=http://127.0.0.1:<port>/v1. Latency follows a
+configurable distribution and a share of requests can fail, hang or return
+malformed JSON, so capacity tests see realistic upstream behaviour:
+
+    python benchmarks/stub_llm_server.py --port 9100 --latency-ms 800 \\
+        --latency-dist lognormal --error-rate 0.02 --malformed-rate 0.05
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+
+class StubBehaviour:
+    """Latency and failure model shared by all request handlers"""
+
+    def __init__(self, latency_ms: float = 500, latency_dist: str = "lognormal", latency_sigma: float = 0.5,
+                 error_rate: float = 0.0, timeout_rate: float = 0.0, timeout_seconds: float = 120,
+                 malformed_rate: float = 0.0, seed: int = None):
+        if latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency_dist}")
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self.malformed_rate = malformed_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "errors": 0, "timeouts": 0, "malformed": 0}
+
+    def sample_latency(self) -> float:
+        """Seconds to wait before answering; the mean is ``latency_ms`` for every distribution"""
+        mean = self.latency_ms / 1000
+        with self._lock:
+            if self.latency_dist == "fixed":
+                return mean
+            if self.latency_dist == "uniform":
+                return self._random.uniform(0, 2 * mean)
+            if self.latency_dist == "exponential":
+                return self._random.expovariate(1 / mean) if mean else 0.0
+            # Lognormal with the requested mean: long right tail like real LLM APIs
+            mu = math.log(mean) - self.latency_sigma ** 2 / 2 if mean else 0.0
+            return self._random.lognormvariate(mu, self.latency_sigma) if mean else 0.0
+
+    def outcome(self) -> str:
+        with self._lock:
+            self.counts["requests"] += 1
+            roll = self._random.random()
+            for name, rate in (("errors", self.error_rate), ("timeouts", self.timeout_rate),
+                               ("malformed", self.malformed_rate)):
+                if roll < rate:
+                    self.counts[name] += 1
+                    return name
+                roll -= rate
+            return "ok"
+
+
+def fake_test_cases(prompt: str, count: int = 3) -> List[Dict[str, Any]]:
+    """Deterministic test cases derived from the prompt, grounded in its [Source: ...] tags"""
+    sources = sorted(set(re.findall(r"\[Source: ([^\]]+)\]", prompt))) or ["No source"]
+    match = re.search(r'User request:\s*"""(.*?)"""', prompt, re.S)
+    request = match.group(1).strip() if match else "the documented behaviour"
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    test_types = ["positive", "negative", "exploratory"]
+    return [
+        {
+            "test_id": f"TC-{i + 1:03d}",
+            "feature": request.splitlines()[0][:60],
+            "test_scenario": f"{test_types[i % 3].capitalize()} check {digest[i * 6:i * 6 + 6]} for {request[:80]}",
+            "expected_result": "Behaviour matches the documentation",
+            "grounded_in": ", ".join(sources),
+            "test_type": test_types[i % 3],
+            "steps": ["Open the checkout page", f"Follow {sources[i % len(sources)]}", "Verify the documented outcome"]
+        }
+        for i in range(count)
+    ]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    behaviour: StubBehaviour = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "stub-model", "object": "model"}]})
+        elif self.path == "/stats":
+            self._send_json(200, dict(self.behaviour.counts))
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        prompt = "\n".join(str(message.get("content", "")) for message in request.get("messages", []))
+        outcome = self.behaviour.outcome()
+        if outcome == "timeouts":
+            time.sleep(self.behaviour.timeout_seconds)
+        else:
+            time.sleep(self.behaviour.sample_latency())
+
+        if outcome == "errors":
+            self._send_json(503, {"error": {"message": "Stub upstream overloaded", "type": "server_error"}})
+            return
+
+        content = json.dumps(fake_test_cases(prompt))
+        if outcome == "malformed":
+            # Cut the array mid-object, as a model hitting its output limit would
+            content = "Here are the test cases:\n" + content[: int(len(content) * 0.7)]
+
+        self._send_json(200, {
+            "id": f"chatcmpl-{hashlib.md5(prompt.encode('utf-8')).hexdigest()[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub-model"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(content.split())}
+        })
+
+
+def start_stub_server(behaviour: StubBehaviour, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Serve the stub in a background thread; port 0 picks a free port"""
+    handler = type("BoundStubHandler", (StubHandler,), {"behaviour": behaviour})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    return server
+
+
+def add_behaviour_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency-ms", type=float, default=500, help="Mean response latency")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Spread of the lognormal distribution")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 503")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Share of requests that hang")
+    parser.add_argument("--timeout-seconds", type=float, default=120, help="How long a hanging request hangs")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of responses with truncated JSON")
+    parser.add_argument("--stub-seed", type=int, default=None)
+
+
+def behaviour_from_args(args: argparse.Namespace) -> StubBehaviour:
+    return StubBehaviour(
+        latency_ms=args.latency_ms, latency_dist=args.latency_dist, latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate, timeout_rate=args.timeout_rate, timeout_seconds=args.timeout_seconds,
+        malformed_rate=args.malformed_rate, seed=args.stub_seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub LLM server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_stub_server(behaviour_from_args(args), args.host, args.port)
+    print(f"Stub LLM listening on http://{args.host}:{server.server_address[1]}/v1 (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Synthetic support-document corpora for benchmarks.
+
+Documents are assembled from sentences of the sample docs in
+assets/support_docs, re-mixed with seeded randomness so that every file is
+distinct (and survives near-duplicate removal) while keeping the vocabulary
+and structure of real product documentation. The same seed and scale always
+produce byte-identical corpora.
+"""
+
+import json
+import random
+import re
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import fitz  # PyMuPDF
+
+ROOT = Path(__file__).resolve().parent.parent
+SUPPORT_DOCS = ROOT / "assets" / "support_docs"
+
+# (filename, content, content type) as accepted by DocumentProcessor.process_document
+Document = Tuple[str, bytes, str]
+
+FORMATS = ("md", "json", "html", "pdf")
+CONTENT_TYPES = {
+    "md": "text/markdown",
+    "json": "application/json",
+    "html": "text/html",
+    "pdf": "application/pdf"
+}
+
+FEATURES = [
+    "Discount Codes", "Shopping Cart", "Shipping Options", "Payment Processing",
+    "Form Validation", "User Details", "Order Summary", "Gift Cards",
+    "Loyalty Points", "Returns", "Wishlist", "Inventory Alerts"
+]
+API_GROUPS = ["cart", "discount", "shipping", "payment", "orders", "customers", "inventory", "returns"]
+HTTP_METHODS = ["GET", "POST", "PUT", "DELETE"]
+
+
+def seed_size_bytes() -> int:
+    """Total size of the sample documents a scale factor multiplies"""
+    return sum(path.stat().st_size for path in SUPPORT_DOCS.iterdir() if path.is_file())
+
+
+def load_seed_sentences() -> List[str]:
+    """Sentences and list items from the sample markdown, text and JSON docs"""
+    sentences = []
+    for path in sorted(SUPPORT_DOCS.iterdir()):
+        text = path.read_text(encoding="utf-8")
+        if path.suffix == ".json":
+            text = "\n".join(re.findall(r'"description":\s*"([^"]+)"', text))
+        for line in text.splitlines():
+            line = re.sub(r"^[#=\-*\d.\s]+", "", line).strip(" =")
+            for sentence in re.split(r"(?<=[.!?])\s+", line):
+                if len(sentence.split()) >= 4:
+                    sentences.append(sentence)
+    return sentences
+
+
+class CorpusGenerator:
+    """Produce documents in every supported format from the seed sentences"""
+
+    def __init__(self, seed: int = 0, doc_size: int = None):
+        self.random = random.Random(seed)
+        self.sentences = load_seed_sentences()
+        # One file per format per scale unit keeps the corpus at scale x seed size
+        self.doc_size = doc_size or seed_size_bytes() // len(FORMATS)
+
+    def _sentence(self) -> str:
+        sentence = self.random.choice(self.sentences)
+        # Vary amounts and codes so repeated sentences do not produce identical chunks
+        sentence = re.sub(r"\d+", lambda match: str(self.random.randint(1, 999)), sentence)
+        return f"{sentence} Reference SKU-{self.random.randint(10000, 99999)}."
+
+    def _paragraph(self, sentences: int) -> str:
+        return " ".join(self._sentence() for _ in range(sentences))
+
+    def _sections(self, index: int) -> Tuple[str, List[Dict[str, object]]]:
+        """A titled document as a list of sections with paragraphs and bullet lists"""
+        feature = self.random.choice(FEATURES)
+        title = f"{feature} Guide {index}"
+        sections = []
+        size = 0
+        while size < self.doc_size:
+            section = {
+                "heading": f"{self.random.choice(FEATURES)} Rules {len(sections) + 1}",
+                "paragraphs": [self._paragraph(self.random.randint(3, 6)) for _ in range(self.random.randint(1, 3))],
+                "bullets": [self._sentence() for _ in range(self.random.randint(0, 4))]
+            }
+            sections.append(section)
+            size += sum(len(text) for text in section["paragraphs"] + section["bullets"]) + len(section["heading"])
+        return title, sections
+
+    def markdown(self, index: int) -> str:
+        title, sections = self._sections(index)
+        lines = [f"# {title}", ""]
+        for section in sections:
+            lines += [f"## {section['heading']}", ""]
+            for paragraph in section["paragraphs"]:
+                lines += [paragraph, ""]
+            lines += [f"- {bullet}" for bullet in section["bullets"]]
+            lines.append("")
+        return "\n".join(lines)
+
+    def html(self, index: int) -> str:
+        title, sections = self._sections(index)
+        parts = [f"<html><head><title>{title}</title></head><body>", f"<h1>{title}</h1>"]
+        for section in sections:
+            parts.append(f"<h2>{section['heading']}</h2>")
+            parts += [f"<p>{paragraph}</p>" for paragraph in section["paragraphs"]]
+            if section["bullets"]:
+                parts.append("<ul>" + "".join(f"<li>{bullet}</li>" for bullet in section["bullets"]) + "</ul>")
+        parts.append("</body></html>")
+        return "\n".join(parts)
+
+    def api_spec(self, index: int) -> str:
+        endpoints: Dict[str, Dict[str, object]] = {}
+        size = 0
+        while size < self.doc_size:
+            group = endpoints.setdefault(self.random.choice(API_GROUPS), {})
+            name = f"operation_{len(group) + 1}"
+            endpoint = {
+                "method": self.random.choice(HTTP_METHODS),
+                "path": f"/v{index}/{name.replace('_', '-')}/{self.random.randint(1, 999)}",
+                "description": self._sentence(),
+                "parameters": {
+                    f"param_{i}": {
+                        "type": self.random.choice(["string", "integer", "number", "boolean"]),
+                        "required": self.random.random() < 0.5,
+                        "description": self._sentence()
+                    }
+                    for i in range(self.random.randint(1, 3))
+                }
+            }
+            group[name] = endpoint
+            size += len(json.dumps(endpoint))
+        return json.dumps({"api_version": f"{index}.0", "endpoints": endpoints}, indent=2)
+
+    def pdf(self, index: int) -> bytes:
+        title, sections = self._sections(index)
+        doc = fitz.open()
+        lines = [title, ""]
+        for section in sections:
+            lines += [section["heading"], *section["paragraphs"], *(f"- {bullet}" for bullet in section["bullets"]), ""]
+
+        # Roughly one page per 2,500 characters of text
+        page_text: List[str] = []
+        for line in lines + [None]:
+            if line is None or sum(len(text) for text in page_text) > 2500:
+                page = doc.new_page()
+                page.insert_textbox(fitz.Rect(40, 40, 555, 800), "\n".join(page_text), fontsize=8)
+                page_text = []
+            if line is not None:
+                page_text.append(line)
+        content = doc.tobytes()
+        doc.close()
+        return content
+
+    def document(self, fmt: str, index: int) -> Document:
+        name = f"synthetic_{index:05d}.{fmt}"
+        if fmt == "md":
+            content = self.markdown(index).encode("utf-8")
+        elif fmt == "html":
+            content = self.html(index).encode("utf-8")
+        elif fmt == "json":
+            content = self.api_spec(index).encode("utf-8")
+        else:
+            content = self.pdf(index)
+        return name, content, CONTENT_TYPES[fmt]
+
+
+def generate_corpus(scale: int, seed: int = 0, formats=FORMATS) -> List[Document]:
+    """Documents totalling roughly ``scale`` times the size of assets/support_docs"""
+    generator = CorpusGenerator(seed=seed)
+    return [generator.document(fmt, index) for index in range(scale) for fmt in formats]
@@ -218,6 +218,11 @@ def test_case_generation_page():
         - "Payment method selection"
         """)
     
+    fast_mode = st.checkbox(
+        "⚡ Fast mode",
+        help="Show rule-based test cases immediately while the AI-generated set is prepared in the background"
+    )
+    
     # Generate test cases
     if st.button("🎯 Generate Test Cases", type="primary"):
         if not query.strip():
@@ -228,12 +233,14 @@ def test_case_generation_page():
             try:
                 response = requests.post(
                     f"{API_BASE_URL}/generate-test-cases",
-                    json={"query": query}
+                    json={"query": query, "mode": "fast" if fast_mode else "full"}
                 )
                 
                 if response.status_code == 200:
                     result = response.json()
                     st.session_state.generated_test_cases = result['test_cases']
+                    refinement = result.get('refinement')
+                    st.session_state.refinement_job_id = refinement['job_id'] if refinement else None
                     
                     st.success(f"✅ Generated {len(result['test_cases'])} test cases!")
                     
@@ -245,6 +252,29 @@ def test_case_generation_page():
             except Exception as e:
                 st.error(f"❌ Error: {str(e)}")
     
+    # Swap in the AI-generated set once the background refinement finishes
+    if st.session_state.refinement_job_id:
+        st.info("🤖 AI-generated test cases are being prepared in the background.")
+        if st.button("🔄 Load AI-generated test cases"):
+            try:
+                response = requests.get(
+                    f"{API_BASE_URL}/generate-test-cases/jobs/{st.session_state.refinement_job_id}",
+                    params={"wait": 15}
+                )
+                job = response.json() if response.status_code == 200 else None
+                
+                if job and job['status'] == 'done':
+                    st.session_state.generated_test_cases = job['result']['test_cases']
+                    st.session_state.refinement_job_id = None
+                    st.success(f"✅ Loaded {len(job['result']['test_cases'])} AI-generated test cases!")
+                elif job and job['status'] == 'failed':
+                    st.session_state.refinement_job_id = None
+                    st.warning(f"AI generation failed, keeping the rule-based test cases: {job['error']}")
+                else:
+                    st.info("Still generating, try again in a few seconds.")
+            except requests.exceptions.ConnectionError:
+                st.error("❌ Cannot connect to API. Make sure the FastAPI server is running.")
+    
     # Display generated test cases
     if st.session_state.generated_test_cases:
         st.subheader("📋 Generated Test Cases")
@@ -421,6 +451,8 @@ if __name__ == "__main__":
         st.session_state.generated_test_cases = []
     if 'html_content' not in st.session_state:
         st.session_state.html_content = ""
+    if 'refinement_job_id' not in st.session_state:
+        st.session_state.refinement_job_id = None
     
     show_sidebar_status()
     main()
\ No newline at end of file
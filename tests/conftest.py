@@ -0,0 +1,68 @@
+import os
+import re
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+# Selenium scripts written by the script generator are not part of the suite
+collect_ignore = ['generated_scripts', 'sample_generated_script.py']
+
+
+class HashingEmbedder:
+    """Deterministic bag-of-words embeddings with the SentenceTransformer encode interface"""
+
+    dimension = 64
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in re.findall(r'\w+', text.lower()):
+            vector[zlib.crc32(word.encode('utf-8')) % self.dimension] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector + 1.0 / np.sqrt(self.dimension)
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs) -> np.ndarray:
+        if isinstance(sentences, str):
+            return self._embed(sentences)
+        return np.array([self._embed(text) for text in sentences], dtype=np.float32).reshape(-1, self.dimension)
+
+
+@pytest.fixture
+def embedder():
+    return HashingEmbedder()
+
+
+@pytest.fixture
+def make_kb(tmp_path, embedder):
+    """Create KnowledgeBase instances over a temporary store; all of them are closed afterwards"""
+    from services.knowledge_base import KnowledgeBase
+
+    created = []
+
+    def make(**kwargs):
+        kwargs.setdefault('persist_directory', str(tmp_path / 'db'))
+        kwargs.setdefault('embedding_model', embedder)
+        knowledge_base = KnowledgeBase(**kwargs)
+        created.append(knowledge_base)
+        return knowledge_base
+
+    yield make
+    for knowledge_base in created:
+        knowledge_base.close()
+
+
+@pytest.fixture
+def process():
+    """Process a text document the way /upload-documents does"""
+    from services.document_processor import DocumentProcessor
+
+    def process(filename: str, text: str, content_type: str = 'text/markdown', **kwargs):
+        return DocumentProcessor(**kwargs).process_document(text.encode('utf-8'), filename, content_type)
+
+    return process
@@ -0,0 +1,34 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                'benchmarks'))
+
+from bench_pipeline import REPORT_FORMAT, compare, measure  # noqa: E402
+
+
+def test_timings_are_the_median_over_repeats():
+    # Run 1 is fast and run 3 slow: neither decides the reported latency
+    delays = {0: 0.02, 1: 0.0, 2: 0.08}
+
+    result = measure(lambda repeat: [delays[repeat]], time.sleep, 'calls', 3, [])
+
+    assert result['repeats'] == 3
+    assert 15 <= result['p99_ms'] < 60 and 15 <= result['p50_ms'] < 60
+
+
+def report(fmt, p99_ms, peak_rss_mb):
+    return {'meta': {'format': fmt},
+            'results': {'10x': {'query': {'count': 1, 'p99_ms': p99_ms, 'peak_rss_mb': peak_rss_mb}}}}
+
+
+def test_older_baselines_only_compare_metrics_measured_the_same_way():
+    current = report(REPORT_FORMAT, 100.0, 300.0)
+
+    assert compare(current, report(REPORT_FORMAT, 50.0, 100.0), 0.15) == [
+        '10x query.p99_ms: 50.0 -> 100.0 (+100.0%)', '10x query.peak_rss_mb: 100.0 -> 300.0 (+200.0%)'
+    ]
+    # Best-of-repeats timings are not held against median ones
+    assert compare(current, report(2, 50.0, 100.0), 0.15) == ['10x query.peak_rss_mb: 100.0 -> 300.0 (+200.0%)']
+    assert compare(current, report(1, 50.0, 100.0), 0.15) == []
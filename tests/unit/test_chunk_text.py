@@ -0,0 +1,44 @@
+import threading
+
+from services.document_processor import DocumentProcessor
+
+SENTENCES = ' '.join(f"Sentence number {i} describes one checkout rule." for i in range(40))
+
+
+def chunk(text, chunk_size, overlap):
+    """Run _chunk_text in a thread so a loop that never advances fails instead of hanging"""
+    result = []
+    worker = threading.Thread(
+        target=lambda: result.append(DocumentProcessor()._chunk_text(text, 'rules.md', chunk_size, overlap)),
+        daemon=True
+    )
+    worker.start()
+    worker.join(5)
+    assert result, "_chunk_text did not finish"
+    return result[0]
+
+
+def test_every_chunk_breaks_at_a_sentence():
+    chunks = chunk(SENTENCES, 200, 50)
+
+    assert len(chunks) > 3
+    assert all(piece['text'].endswith('.') for piece in chunks)
+    # Breaks are taken after the first chunk too, not only while start is small
+    assert all(piece['metadata']['end_char'] - piece['metadata']['start_char'] < 200 for piece in chunks[:-1])
+
+
+def test_no_duplicate_chunk_after_the_end():
+    chunks = chunk(SENTENCES, 200, 50)
+
+    ends = [piece['metadata']['end_char'] for piece in chunks]
+    assert ends[-1] == len(SENTENCES)
+    assert ends.count(len(SENTENCES)) == 1
+
+
+def test_start_advances_when_the_break_is_shorter_than_the_overlap():
+    # A sentence break near the midpoint leaves less than the overlap to step past
+    chunks = chunk(SENTENCES, 100, 80)
+
+    starts = [piece['metadata']['start_char'] for piece in chunks]
+    assert starts == sorted(set(starts))
+    assert chunks[-1]['metadata']['end_char'] == len(SENTENCES)
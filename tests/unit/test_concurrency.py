@@ -0,0 +1,154 @@
+import threading
+import time
+
+import pytest
+
+from services.concurrency import ReadWriteLock, SingleFlight
+
+
+def run(target):
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread
+
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    inside = threading.Barrier(3, timeout=5)
+
+    def read():
+        with lock.read_locked():
+            # Every reader must be inside at once for the barrier to open
+            inside.wait()
+
+    threads = [run(read) for _ in range(3)]
+    for thread in threads:
+        thread.join(5)
+
+    assert not inside.broken
+
+
+def test_writer_excludes_readers_and_other_writers():
+    lock = ReadWriteLock()
+    events = []
+
+    def write(name):
+        with lock.write_locked():
+            events.append(f'{name} in')
+            time.sleep(0.02)
+            events.append(f'{name} out')
+
+    def read():
+        with lock.read_locked():
+            events.append('reader in')
+            events.append('reader out')
+
+    threads = [run(lambda: write('w1')), run(read), run(lambda: write('w2')), run(read)]
+    for thread in threads:
+        thread.join(5)
+
+    # Whoever holds a write lock is never interleaved with anyone else
+    for index, event in enumerate(events):
+        if event.endswith(' in') and event.startswith('w'):
+            assert events[index + 1] == event.replace(' in', ' out')
+
+
+def test_waiting_writer_blocks_new_readers():
+    lock = ReadWriteLock()
+    lock.acquire_read()
+    order = []
+
+    writer = run(lambda: (lock.acquire_write(), order.append('writer'), lock.release_write()))
+    # Wait until the writer is queued behind the active reader
+    for _ in range(500):
+        with lock._cond:
+            if lock._writers_waiting:
+                break
+        time.sleep(0.001)
+    reader = run(lambda: (lock.acquire_read(), order.append('reader'), lock.release_read()))
+    time.sleep(0.05)
+    assert order == []
+
+    lock.release_read()
+    writer.join(5)
+    reader.join(5)
+
+    # The swap is not starved by readers arriving after it queued
+    assert order == ['writer', 'reader']
+
+
+def wait_for_followers(flight, count):
+    for _ in range(500):
+        if flight.stats()['coalesced'] >= count:
+            return
+        time.sleep(0.001)
+
+
+def test_identical_in_flight_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def generate():
+        calls.append(1)
+        release.wait(5)
+        return {'cases': 3}
+
+    threads = [run(lambda: results.append(flight.do('same request', generate))) for _ in range(4)]
+    wait_for_followers(flight, 3)
+    assert flight.stats() == {'executions': 1, 'coalesced': 3, 'in_flight': 1}
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert all(result == {'cases': 3} for result, _ in results)
+    # Nothing is remembered once the call has finished
+    assert flight.do('same request', lambda: 'again') == ('again', False)
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_followers_get_the_leaders_exception():
+    flight = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def fail():
+        release.wait(5)
+        raise ValueError('LLM unavailable')
+
+    def call():
+        try:
+            flight.do('request', fail)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [run(call) for _ in range(3)]
+    wait_for_followers(flight, 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 3 and len({id(error) for error in errors}) == 1
+    with pytest.raises(KeyError):
+        flight.do('request', lambda: {}['missing'])
+
+
+def test_different_keys_run_independently():
+    flight = SingleFlight()
+    both_running = threading.Barrier(2, timeout=5)
+
+    def generate(key):
+        # Deadlocks (and breaks the barrier) if the second key waited on the first
+        both_running.wait()
+        return key
+
+    results = []
+    threads = [run(lambda key=key: results.append(flight.do(key, lambda: generate(key)))) for key in ('a', 'b')]
+    for thread in threads:
+        thread.join(5)
+
+    assert sorted(results) == [('a', False), ('b', False)]
+    assert flight.stats()['coalesced'] == 0
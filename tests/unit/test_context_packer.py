@@ -0,0 +1,45 @@
+from services.context_packer import ContextPacker, estimate_tokens
+
+
+def chunk(source, text, start, distance=0.5, index=0):
+    return {'text': text, 'distance': distance,
+            'metadata': {'source': source, 'start_char': start, 'end_char': start + len(text), 'chunk_index': index}}
+
+
+def test_overlapping_chunks_are_stitched_once():
+    document = "Express shipping costs ten dollars. Orders ship the same day."
+    first, second = document[:40], document[30:]
+
+    context, stats = ContextPacker().pack([chunk('shipping.md', second, 30, 0.2, 1),
+                                           chunk('shipping.md', first, 0, 0.4, 0)])
+
+    assert context == f"[Source: shipping.md]\n{document}\n"
+    assert stats['passages'] == 1 and stats['chunks'] == 2
+
+
+def test_passages_are_packed_by_relevance():
+    chunks = [chunk('far.md', 'Unrelated returns policy text.', 0, 0.9),
+              chunk('near.md', 'SAVE15 gives fifteen percent off.', 0, 0.1)]
+
+    context, _ = ContextPacker().pack(chunks)
+
+    assert context.index('near.md') < context.index('far.md')
+
+
+def test_budget_truncates_on_a_sentence_and_drops_the_rest():
+    long_text = "The SAVE15 code applies a discount. " * 20
+    chunks = [chunk('a.md', long_text, 0, 0.1), chunk('b.md', 'Express shipping costs ten dollars.', 0, 0.2)]
+
+    context, stats = ContextPacker(min_passage_tokens=10).pack(chunks, token_budget=60)
+
+    assert stats['context_tokens'] <= 60 and estimate_tokens(context) <= 60
+    assert stats['passages_truncated'] == 1 and stats['passages_dropped'] == 1
+    assert context.rstrip().endswith('discount.') and 'b.md' not in context
+
+
+def test_separate_sections_of_one_source_stay_apart():
+    chunks = [chunk('a.md', 'Cart totals update live.', 0), chunk('a.md', 'Payment needs a valid card.', 500)]
+
+    _, stats = ContextPacker().pack(chunks)
+
+    assert stats['passages'] == 2
@@ -0,0 +1,116 @@
+import math
+
+import pytest
+
+from services import test_generator
+from services.deadline import Deadline
+from services.llm_providers import FakeLLMClient
+from services.script_generator import ScriptGenerator
+
+CHECKOUT_DOC = """# Checkout
+
+## Discount Codes
+
+The SAVE15 discount code applies a 15% discount to the cart subtotal.
+
+## Shipping
+
+Standard shipping is free. Express shipping costs $10.
+
+## Payment
+
+Cards are charged when the order ships.
+
+## Returns
+
+Returns are free within thirty days.
+"""
+
+TEST_CASE = {'test_id': 'TC-001', 'feature': 'Discount Code', 'test_scenario': 'Apply SAVE15',
+             'steps': ['Enter SAVE15', 'Click Apply'], 'expected_result': '15% off',
+             'grounded_in': 'checkout.md', 'test_type': 'positive'}
+
+
+class CountingLLMClient(FakeLLMClient):
+    def __init__(self, latency_seconds=0.0):
+        super().__init__(latency_seconds=latency_seconds)
+        self.calls = 0
+        self.timeouts = []
+
+    def _generate(self, prompt, timeout=None):
+        self.calls += 1
+        self.timeouts.append(timeout)
+        return super()._generate(prompt, timeout)
+
+
+@pytest.fixture
+def knowledge_base(make_kb, process):
+    knowledge_base = make_kb()
+    knowledge_base.build_from_documents([process('checkout.md', CHECKOUT_DOC, chunk_mode='structure')])
+    return knowledge_base
+
+
+def actions(deadline):
+    return [entry['action'] for entry in deadline.degradations]
+
+
+def test_unbounded_deadline_never_degrades():
+    deadline = Deadline.from_ms(None)
+
+    assert deadline.remaining() == math.inf and not deadline.expired and not deadline.degraded
+
+
+def test_retrieval_fetches_fewer_chunks_when_short_of_time(knowledge_base):
+    short = Deadline(0.3)
+    expired = Deadline(0)
+
+    assert len(knowledge_base.query('checkout', n_results=4)) == 4
+    # Different texts, since a cached result is served whatever the deadline
+    assert len(knowledge_base.query('checkout rules', n_results=4, deadline=short)) == 2
+    assert short.degradations == [{'stage': 'retrieval', 'action': 'reduced_n_results', 'detail': '4 -> 2'}]
+    assert len(knowledge_base.query('checkout steps', n_results=4, deadline=expired)) == 1
+
+
+def test_llm_is_skipped_below_its_minimum_time(knowledge_base):
+    llm = CountingLLMClient()
+    generator = test_generator.TestGenerator(knowledge_base, llm, min_llm_seconds=5)
+    deadline = Deadline(2)
+    report = {}
+
+    test_cases = generator.generate_test_cases('discount code', report=report, deadline=deadline)
+
+    assert test_cases and report['generator'] == 'rule_based' and llm.calls == 0
+    assert actions(deadline) == ['skipped_llm']
+    # A degraded result is not cached: with time to spare the LLM is used
+    report = {}
+    generator.generate_test_cases('discount code', report=report)
+    assert report['generator'] == 'llm' and not report['cached'] and llm.calls == 1
+
+
+def test_slow_llm_is_cut_short_for_the_rule_based_fallback(knowledge_base):
+    llm = CountingLLMClient(latency_seconds=5)
+    generator = test_generator.TestGenerator(knowledge_base, llm, min_llm_seconds=0)
+    deadline = Deadline(test_generator.FALLBACK_RESERVE_SECONDS + 0.6)
+    report = {}
+
+    test_cases = generator.generate_test_cases('discount code', report=report, deadline=deadline)
+
+    assert test_cases and report['generator'] == 'rule_based'
+    # The LLM call was given what was left minus the fallback reserve
+    assert llm.calls == 1 and 0 < llm.timeouts[0] <= 0.6
+    assert 'llm_timed_out' in actions(deadline)
+    assert not deadline.expired
+
+
+def test_script_skips_knowledge_base_context_when_short_of_time(knowledge_base):
+    generator = ScriptGenerator(knowledge_base)
+    html = '<form><input id="discount-code"><button id="apply">Apply</button></form>'
+    deadline = Deadline(0.1)
+
+    script = generator.generate_selenium_script(TEST_CASE, html, deadline=deadline)
+
+    assert 'SAVE15' in script
+    assert actions(deadline) == ['skipped_context']
+    assert generator.cache.stats()['entries'] == 0
+    generator.generate_selenium_script(TEST_CASE, html)
+    assert generator.cache.stats()['entries'] == 1
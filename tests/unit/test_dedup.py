@@ -0,0 +1,73 @@
+from services.dedup import NearDuplicateFilter
+
+BOILERPLATE = ("Contact support at help@example.com for questions about your order. "
+               "Our team answers within one business day, Monday to Friday.")
+SHIPPING = "Express shipping costs ten dollars and delivers within one to two business days."
+DISCOUNT = "The SAVE15 code applies a fifteen percent discount to the subtotal before shipping."
+
+
+def test_find_duplicates_points_at_the_first_copy():
+    texts = [BOILERPLATE, SHIPPING, BOILERPLATE.replace('Friday', 'Friday.'), DISCOUNT, BOILERPLATE]
+
+    assert NearDuplicateFilter().find_duplicates(texts) == {2: 0, 4: 0}
+
+
+def test_distinct_texts_are_kept():
+    assert NearDuplicateFilter().find_duplicates([SHIPPING, DISCOUNT, BOILERPLATE]) == {}
+
+
+def test_repeats_within_a_source_are_dropped(make_kb, process):
+    knowledge_base = make_kb()
+    doc = process('manual.md', 'placeholder')
+    doc['chunks'] = [
+        {'text': text, 'metadata': {'source': 'manual.md', 'chunk_index': index}}
+        for index, text in enumerate([BOILERPLATE, SHIPPING, BOILERPLATE])
+    ]
+
+    knowledge_base.build_from_documents([doc])
+
+    assert knowledge_base.last_build_stats['duplicates_removed_by_source'] == {'manual.md': 1}
+    assert knowledge_base.sources['manual.md']['chunk_count'] == 2
+
+
+def test_identical_sources_keep_their_own_chunks(make_kb, process):
+    knowledge_base = make_kb()
+    text = f"# Support\n\n{BOILERPLATE}\n\n{SHIPPING}\n"
+    knowledge_base.build_from_documents([process('a.md', text), process('b.md', text)])
+
+    assert knowledge_base.last_build_stats['duplicates_removed'] == 0
+    assert knowledge_base.sources['b.md']['chunk_count'] == knowledge_base.sources['a.md']['chunk_count'] > 0
+    results = knowledge_base.query('express shipping', n_results=5, filters={'sources': ['b.md']})
+    assert results and all(r['metadata']['source'] == 'b.md' for r in results)
+
+    knowledge_base.delete_source('a.md')
+
+    results = knowledge_base.query('express shipping', n_results=5)
+    assert results and all(r['metadata']['source'] == 'b.md' for r in results)
+
+
+def chunked(name, texts):
+    """A processed document whose chunks are exactly ``texts``"""
+    return {'filename': name, 'content_type': 'text/markdown', 'text_content': '\n\n'.join(texts),
+            'chunks': [{'text': text, 'metadata': {'source': name, 'chunk_index': index}}
+                       for index, text in enumerate(texts)]}
+
+
+def test_paragraph_shared_by_two_files_takes_one_result(make_kb):
+    knowledge_base = make_kb()
+    knowledge_base.build_from_documents([chunked('a.md', [BOILERPLATE, SHIPPING]),
+                                         chunked('b.md', [BOILERPLATE, DISCOUNT])])
+
+    results = knowledge_base.query(BOILERPLATE, n_results=3)
+
+    shared = [result for result in results if result['text'] == BOILERPLATE]
+    assert len(shared) == 1
+    assert {shared[0]['metadata']['source'], *shared[0]['metadata']['also_in']} == {'a.md', 'b.md'}
+    # The freed slot goes to the next distinct chunk
+    assert {result['text'] for result in results} == {BOILERPLATE, SHIPPING, DISCOUNT}
+    assert knowledge_base.stats()['cross_source_duplicates_collapsed'] == 1
+
+    # Each source still holds its own copy
+    assert knowledge_base.sources['b.md']['chunk_count'] == 2
+    filtered = knowledge_base.query(BOILERPLATE, n_results=1, filters={'sources': ['b.md']})
+    assert filtered[0]['metadata']['source'] == 'b.md' and 'also_in' not in filtered[0]['metadata']
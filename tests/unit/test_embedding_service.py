@@ -0,0 +1,149 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from services import embedding_service
+from services.embedding_service import EmbeddingClient, EmbeddingServer, MicroBatcher
+
+BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'backend')
+
+
+@pytest.fixture
+def server(tmp_path, embedder, monkeypatch):
+    monkeypatch.setattr(embedding_service, 'load_embedding_model', lambda name: embedder)
+    server = EmbeddingServer(str(tmp_path / 'embed.sock'), 'test-model', max_batch_size=8, max_wait_ms=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_client_matches_the_model_and_slices_bulk_requests(server, embedder):
+    client = EmbeddingClient(server.socket_path, 'test-model', connect_timeout=5, request_slice_size=10)
+    texts = [f"chunk number {i} about checkout" for i in range(25)]
+
+    embeddings = client.encode(texts, batch_size=64)
+
+    assert embeddings.shape == (25, embedder.dimension)
+    np.testing.assert_allclose(embeddings, embedder.encode(texts), rtol=1e-6)
+    np.testing.assert_allclose(client.encode('one query'), embedder.encode('one query'), rtol=1e-6)
+    # 25 texts in slices of 10, then the single query
+    assert server.batcher.stats()['requests'] == 4
+
+
+class GatedModel:
+    """Embedder whose first encode blocks until released, so requests pile up behind it"""
+
+    def __init__(self, embedder):
+        self.embedder = embedder
+        self.started, self.release = threading.Event(), threading.Event()
+        self.batches = []
+
+    def get_sentence_embedding_dimension(self):
+        return self.embedder.dimension
+
+    def encode(self, texts, batch_size=32):
+        self.batches.append(list(texts))
+        self.started.set()
+        self.release.wait(5)
+        if 'fail' in texts:
+            raise RuntimeError('model crashed')
+        return self.embedder.encode(texts)
+
+
+def encode_in_threads(batcher, requests):
+    results, threads = {}, []
+    for texts in requests:
+        def call(texts=texts):
+            try:
+                results[tuple(texts)] = batcher.encode(texts)
+            except RuntimeError as e:
+                results[tuple(texts)] = e
+        threads.append(threading.Thread(target=call))
+        threads[-1].start()
+    return results, threads
+
+
+def wait_until_queued(batcher, count):
+    for _ in range(500):
+        if batcher.stats()['queued'] >= count:
+            return
+        time.sleep(0.002)
+
+
+def test_concurrent_requests_share_one_forward_pass(embedder):
+    model = GatedModel(embedder)
+    batcher = MicroBatcher(model, max_batch_size=8, max_wait_ms=50)
+    try:
+        first, first_threads = encode_in_threads(batcher, [['warm up']])
+        assert model.started.wait(5)
+        queries = [[f'query {i}'] for i in range(5)]
+        results, threads = encode_in_threads(batcher, queries)
+        wait_until_queued(batcher, 5)
+        model.release.set()
+        for thread in first_threads + threads:
+            thread.join(5)
+    finally:
+        batcher.close()
+
+    # The five queries waiting behind the first call went through the model together
+    assert sorted(model.batches[1]) == sorted(text for texts in queries for text in texts)
+    assert batcher.stats()['batches'] == 2
+    for texts in queries:
+        np.testing.assert_allclose(results[tuple(texts)], embedder.encode(texts), rtol=1e-6)
+
+
+def test_interactive_requests_go_before_queued_bulk_work(embedder):
+    model = GatedModel(embedder)
+    batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=0)
+    try:
+        _, first_threads = encode_in_threads(batcher, [['warm up']])
+        assert model.started.wait(5)
+        _, bulk_threads = encode_in_threads(batcher, [[f'chunk {i}' for i in range(8)]])
+        wait_until_queued(batcher, 2)
+        _, query_threads = encode_in_threads(batcher, [['user query']])
+        wait_until_queued(batcher, 3)
+        model.release.set()
+        for thread in first_threads + bulk_threads + query_threads:
+            thread.join(5)
+    finally:
+        batcher.close()
+
+    assert model.batches[1] == ['user query']
+
+
+def test_model_errors_reach_every_caller_in_the_batch(embedder):
+    model = GatedModel(embedder)
+    batcher = MicroBatcher(model, max_batch_size=8, max_wait_ms=50)
+    try:
+        _, first_threads = encode_in_threads(batcher, [['warm up']])
+        assert model.started.wait(5)
+        results, threads = encode_in_threads(batcher, [['fail'], ['innocent bystander']])
+        wait_until_queued(batcher, 2)
+        model.release.set()
+        for thread in first_threads + threads:
+            thread.join(5)
+    finally:
+        batcher.close()
+
+    assert all(isinstance(result, RuntimeError) for result in results.values())
+
+
+def test_client_rejects_a_different_model(server):
+    with pytest.raises(ValueError):
+        EmbeddingClient(server.socket_path, 'other-model', connect_timeout=5)
+
+
+def test_knowledge_base_import_does_not_load_sentence_transformers():
+    code = "import sys, services.knowledge_base; print('sentence_transformers' in sys.modules)"
+    result = subprocess.run([sys.executable, '-c', code], cwd=BACKEND, capture_output=True, text=True,
+                            env={**os.environ, 'PYTHONPATH': os.pathsep.join(sys.path)})
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == 'False'
@@ -0,0 +1,85 @@
+import fitz
+import pytest
+
+from services.document_processor import DocumentProcessor
+
+MARKDOWN = '''# Checkout Guide
+
+## Payment
+
+Card payments are charged when the order ships.
+
+## Refunds
+
+Refunds reach the original card within five days.
+'''
+
+HTML = '''<html><body>
+<h1>Account Help</h1>
+<h2>Payment</h2><p>Saved cards can be removed from the account page.</p>
+<h2>Password</h2><p>Passwords must be reset every ninety days.</p>
+</body></html>'''
+
+PDF_PAGES = ['Card payments over five hundred dollars need approval.',
+             'Refund requests are reviewed by the payments team.']
+
+
+def pdf_document():
+    pdf = fitz.open()
+    for text in PDF_PAGES:
+        pdf.new_page().insert_text((72, 72), text)
+    content = pdf.tobytes()
+    pdf.close()
+    return DocumentProcessor(chunk_size=100, chunk_overlap=0).process_document(content, 'policy.pdf',
+                                                                               'application/pdf')
+
+
+@pytest.fixture
+def kb(make_kb, process):
+    knowledge_base = make_kb(dedup_threshold=None)
+    knowledge_base.build_from_documents([
+        process('checkout.md', MARKDOWN, chunk_mode='structure'),
+        process('account.html', HTML, content_type='text/html', chunk_mode='structure'),
+        pdf_document()
+    ])
+    return knowledge_base
+
+
+def found(kb, **filters):
+    return [(r['metadata']['source'], r['metadata'].get('section')) for r in
+            kb.query('card payments and refunds', n_results=10, filters=filters)]
+
+
+def test_section_filters_match_any_heading_level_across_formats(kb):
+    assert sorted(found(kb, sections=['Payment'])) == [('account.html', 'Account Help > Payment'),
+                                                       ('checkout.md', 'Checkout Guide > Payment')]
+    assert sorted(found(kb, sections=['Checkout Guide'])) == [('checkout.md', 'Checkout Guide > Payment'),
+                                                              ('checkout.md', 'Checkout Guide > Refunds')]
+    assert found(kb, sections=['Account Help > Password']) == [('account.html', 'Account Help > Password')]
+    assert found(kb, sections=['Page 2']) == [('policy.pdf', 'Page 2')]
+
+
+def test_page_filter_matches_pdf_pages(kb):
+    results = kb.query('card payments and refunds', n_results=10, filters={'pages': [1]})
+
+    assert [(r['metadata']['source'], r['metadata']['page']) for r in results] == [('policy.pdf', 1)]
+    assert PDF_PAGES[0] in results[0]['text']
+    assert len(found(kb, pages=[1, 2])) == 2
+
+
+def test_source_and_content_type_filters_combine_with_sections(kb):
+    assert {source for source, _ in found(kb, sources=['account.html'])} == {'account.html'}
+    assert {source for source, _ in found(kb, content_types=['application/pdf'])} == {'policy.pdf'}
+    assert found(kb, sources=['checkout.md'], sections=['Refunds']) == [('checkout.md', 'Checkout Guide > Refunds')]
+    assert found(kb, sources=['policy.pdf'], sections=['Refunds']) == []
+
+
+def test_filtered_and_unfiltered_search_latency_are_reported_apart(kb):
+    kb.query('card payments', n_results=3)
+    kb.query('card payments', n_results=3, filters={'sections': ['Payment']})
+    kb.query('refunds', n_results=3, filters={'pages': [2]})
+
+    latency = kb.stats()['search_latency']
+    assert latency['unfiltered']['count'] == 1
+    assert latency['filtered']['count'] == 2
+    assert latency['filtered']['max_ms'] >= latency['filtered']['avg_ms'] > 0
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from services.llm_client import GeminiClient
+
+CASES = json.dumps([{
+    "test_id": "TC-001", "feature": "Discount", "test_scenario": "Apply SAVE15",
+    "expected_result": "15% off", "grounded_in": "checkout.md", "test_type": "positive",
+    "steps": ["Enter SAVE15", "Click Apply"]
+}])
+
+
+class InvalidArgument(Exception):
+    """Stands in for google.api_core.exceptions.InvalidArgument (a 400 response)"""
+
+
+class BlockedResponse:
+    @property
+    def text(self):
+        raise ValueError("The response.text quick accessor requires the response to contain a valid Part")
+
+
+class TextResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Records generate_content calls; structured calls raise or return ``structured``"""
+
+    def __init__(self, structured):
+        self.structured = structured
+        self.calls = []
+
+    def generate_content(self, prompt, generation_config=None, request_options=None):
+        self.calls.append('structured' if generation_config else 'plain')
+        if generation_config is None:
+            return TextResponse(CASES)
+        if isinstance(self.structured, Exception):
+            raise self.structured
+        return self.structured
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.delenv('GEMINI_API_KEY', raising=False)
+    monkeypatch.delenv('GEMINI_STRUCTURED_OUTPUT', raising=False)
+    return GeminiClient()
+
+
+def use_model(client, structured):
+    client._model = FakeModel(structured)
+    return client._model
+
+
+def test_structured_output_is_used_when_accepted(client):
+    model = use_model(client, TextResponse(CASES))
+
+    assert client.generate_test_cases('discount', 'SAVE15 gives 15%')[0]['test_id'] == 'TC-001'
+    assert model.calls == ['structured'] and client.structured_output
+
+
+def test_blocked_response_is_not_a_schema_rejection(client):
+    model = use_model(client, BlockedResponse())
+
+    with pytest.raises(RuntimeError):
+        client.generate_test_cases('discount', 'SAVE15 gives 15%')
+    assert model.calls == ['structured']
+    assert client.structured_output
+
+
+def test_unrelated_value_error_keeps_structured_output(client):
+    model = use_model(client, ValueError("Invalid input: prompt is empty"))
+
+    with pytest.raises(RuntimeError):
+        client.generate_test_cases('discount', 'SAVE15 gives 15%')
+    assert model.calls == ['structured']
+    assert client.structured_output
+
+
+@pytest.mark.parametrize('error', [
+    ValueError("Unknown field for GenerationConfig: response_schema"),
+    TypeError("__init__() got an unexpected keyword argument 'response_mime_type'"),
+    InvalidArgument("400 JSON mode is not enabled for this model"),
+])
+def test_schema_rejection_falls_back_to_plain_text(client, error):
+    model = use_model(client, error)
+
+    assert client.generate_test_cases('discount', 'SAVE15 gives 15%')[0]['feature'] == 'Discount'
+    assert model.calls == ['structured', 'plain']
+    assert not client.structured_output
+
+
+def test_other_invalid_argument_is_raised(client):
+    model = use_model(client, InvalidArgument("400 API key not valid"))
+
+    with pytest.raises(RuntimeError):
+        client.generate_test_cases('discount', 'SAVE15 gives 15%')
+    assert model.calls == ['structured'] and client.structured_output
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from services import json_records
+from services.json_records import format_path, iter_json_records, path_titles
+
+API_SPEC = {
+    'info': {'title': 'Shop API', 'version': '1.2'},
+    'endpoints': {
+        name: {'method': 'POST', 'path': f'/cart/{name}', 'description': f'{name} the cart item ' * 3}
+        for name in ('add_item', 'remove_item', 'apply_discount')
+    },
+}
+
+
+def records(value, max_chars, **kwargs):
+    return [(format_path(path), json.loads(text)) for path, text in
+            iter_json_records(json.dumps(value, indent=2), max_chars, **kwargs)]
+
+
+def test_small_document_is_one_record():
+    assert records({'a': 1, 'b': [1, 2]}, 200) == [('$', {'a': 1, 'b': [1, 2]})]
+
+
+def test_collection_of_sizeable_objects_gives_one_record_each():
+    found = records(API_SPEC, 500)
+
+    assert [path for path, _ in found] == ['$.info', '$.endpoints.add_item', '$.endpoints.remove_item',
+                                           '$.endpoints.apply_discount']
+    assert found[2][1] == API_SPEC['endpoints']['remove_item']
+
+
+def test_large_arrays_are_grouped_into_slices_within_budget():
+    items = [{'sku': f'SKU-{i}', 'price': i} for i in range(50)]
+    text = json.dumps({'items': items})
+    # Items below min_record_chars are grouped rather than kept one per record
+    found = list(iter_json_records(text, 200, min_record_chars=100))
+
+    assert len(found) > 1
+    assert all(len(format_path(path)) + 1 + len(record) <= 200 for path, record in found)
+    # A lone element is recorded under its own index rather than as a slice
+    rebuilt = []
+    for path, record in found:
+        rebuilt.extend(json.loads(record) if isinstance(path[-1], slice) else [json.loads(record)])
+    assert rebuilt == items
+    assert format_path(found[0][0]) == '$.items[0:7]'
+
+
+def test_each_container_is_decoded_at_most_once(monkeypatch):
+    decoder = json_records._DECODER
+    decoded = []
+
+    class CountingDecoder:
+        def raw_decode(self, text, start):
+            if text[start] in '{[':
+                decoded.append(start)
+            return decoder.raw_decode(text, start)
+
+    monkeypatch.setattr(json_records, '_DECODER', CountingDecoder())
+    document = {'spec': API_SPEC, 'items': [{'sku': f'SKU-{i}', 'tags': ['a', 'b']} for i in range(200)]}
+    found = list(iter_json_records(json.dumps(document, indent=2), 500))
+
+    assert len(found) > 1
+    assert decoded and len(decoded) == len(set(decoded))
+
+
+def test_paths_render_quoted_keys_and_titles():
+    path = ['endpoints', 'cart item', 3, slice(0, 4)]
+
+    assert format_path(path) == '$.endpoints["cart item"][3][0:4]'
+    assert path_titles(path) == ['endpoints', 'cart item[3][0:4]']
+
+
+@pytest.mark.parametrize('text', ['', '{"a": 1} {"b": 2}', '{"a": [1, 2}', '{"a": "unterminated'])
+def test_malformed_documents_raise_value_error(text):
+    with pytest.raises(ValueError):
+        list(iter_json_records(text, 100))
@@ -0,0 +1,117 @@
+import itertools
+import threading
+import time
+
+import pytest
+
+
+def collection_names(knowledge_base):
+    return sorted(knowledge_base._collection_names())
+
+
+def test_rebuild_replaces_live_data_and_leaves_no_shadows(make_kb, process):
+    knowledge_base = make_kb()
+    knowledge_base.build_from_documents([process('old.md', '# Old\n\nLegacy checkout flow with coupons.')])
+    first_version = knowledge_base.version
+
+    knowledge_base.build_from_documents([process('new.md', '# New\n\nExpress shipping costs ten dollars.')])
+
+    assert knowledge_base.version > first_version
+    assert knowledge_base.get_all_sources() == ['new.md']
+    results = knowledge_base.query('express shipping', n_results=5)
+    assert [r['metadata']['source'] for r in results] == ['new.md']
+    assert collection_names(knowledge_base) == ['qa_documents']
+
+
+def test_failed_rebuild_keeps_serving_the_previous_index(make_kb, process, embedder, monkeypatch):
+    knowledge_base = make_kb()
+    knowledge_base.build_from_documents([process('specs.md', '# Specs\n\nSAVE15 gives fifteen percent off.')])
+    version = knowledge_base.version
+
+    def broken_encode(sentences, batch_size=32, **kwargs):
+        raise RuntimeError('model crashed')
+
+    monkeypatch.setattr(embedder, 'encode', broken_encode)
+    with pytest.raises(Exception, match='model crashed'):
+        knowledge_base.build_from_documents([process('other.md', '# Other\n\nUnrelated text.')])
+    monkeypatch.undo()
+
+    assert knowledge_base.version == version
+    assert knowledge_base.get_all_sources() == ['specs.md']
+    assert knowledge_base.query('SAVE15 discount', n_results=1)[0]['metadata']['source'] == 'specs.md'
+    assert collection_names(knowledge_base) == ['qa_documents']
+
+
+def test_reopened_store_serves_the_last_build(make_kb, process):
+    make_kb().build_from_documents([process('specs.md', '# Specs\n\nPayPal redirects for payment.')])
+
+    reopened = make_kb()
+
+    assert reopened.get_all_sources() == ['specs.md']
+    assert reopened.query('paypal payment', n_results=1)[0]['metadata']['source'] == 'specs.md'
+
+
+@pytest.mark.parametrize('num_shards', [1, 2])
+def test_queries_during_a_swap_see_the_old_or_the_new_index(make_kb, process, monkeypatch, num_shards):
+    knowledge_base = make_kb(num_shards=num_shards)
+    builds = {
+        'old': [process('old-a.md', '# A\n\nShipping options for the old catalog.'),
+                process('old-b.md', '# B\n\nDiscount codes for the old catalog.')],
+        'new': [process('new-a.md', '# A\n\nShipping options for the new catalog.'),
+                process('new-b.md', '# B\n\nDiscount codes for the new catalog.')],
+    }
+    expected = [{doc['filename'] for doc in docs} for docs in builds.values()]
+    knowledge_base.build_from_documents(builds['old'])
+
+    # Slow every rename so queries arrive while the swap is half done
+    collection_type = type(knowledge_base.shards[0])
+    modify = collection_type.modify
+    renames = []
+
+    def slow_modify(collection, *args, **kwargs):
+        started = time.perf_counter()
+        time.sleep(0.02)
+        try:
+            return modify(collection, *args, **kwargs)
+        finally:
+            renames.append((started, time.perf_counter()))
+
+    # Slow searches too, so they are still running when the old shards are dropped
+    search = collection_type.query
+
+    def slow_search(collection, *args, **kwargs):
+        time.sleep(0.005)
+        return search(collection, *args, **kwargs)
+
+    monkeypatch.setattr(collection_type, 'modify', slow_modify)
+    monkeypatch.setattr(collection_type, 'query', slow_search)
+    stop = threading.Event()
+    seen, errors, spans = [], [], []
+
+    def query_loop():
+        for i in itertools.count():
+            if stop.is_set():
+                return
+            started = time.perf_counter()
+            try:
+                # A new query text each time, so every query searches rather than hitting the cache
+                results = knowledge_base.query(f'catalog options {i}', n_results=4)
+            except Exception as e:
+                errors.append(e)
+                continue
+            seen.append({result['metadata']['source'] for result in results})
+            spans.append((started, time.perf_counter()))
+
+    reader = threading.Thread(target=query_loop)
+    reader.start()
+    try:
+        for name in ['new', 'old', 'new']:
+            knowledge_base.build_from_documents(builds[name])
+    finally:
+        stop.set()
+        reader.join()
+
+    assert errors == []
+    # Some queries were issued while a rename was in progress
+    assert any(start < rename_end and rename_start < end for start, end in spans for rename_start, rename_end in renames)
+    assert all(sources in expected for sources in seen)
@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from services import knowledge_base as kb_module
+from services.knowledge_base import KnowledgeBaseRegistry
+
+
+@pytest.fixture
+def registry(tmp_path, embedder, monkeypatch):
+    monkeypatch.setattr(kb_module, 'load_embedding_model', lambda name: embedder)
+    registry = KnowledgeBaseRegistry(persist_directory=str(tmp_path / 'db'), max_open=2)
+    yield registry
+    for knowledge_base in registry.open_projects().values():
+        knowledge_base.close()
+
+
+def test_idle_projects_are_evicted(registry):
+    registry.get('alpha')
+    registry.get('beta')
+
+    assert list(registry.open_projects()) == ['default', 'beta']
+    assert registry.stats()['evictions'] == 1
+
+
+def test_projects_in_use_are_not_evicted(registry, process):
+    with registry.use('alpha') as alpha:
+        registry.get('beta')
+        registry.get('gamma')
+
+        assert 'alpha' in registry.open_projects()
+        alpha.build_from_documents([process('a.md', '# A\n\nExpress shipping costs ten dollars.')])
+        assert alpha.query('express shipping', n_results=1)[0]['metadata']['source'] == 'a.md'
+
+    # Once released it is an ordinary idle project again
+    registry.get('delta')
+    assert 'alpha' not in registry.open_projects()
+
+
+def test_reopening_a_project_keeps_shadows_of_a_running_build(make_kb, process, embedder, monkeypatch):
+    building = make_kb(project='shop')
+    started, resume = threading.Event(), threading.Event()
+    encode = embedder.encode
+
+    def slow_encode(sentences, batch_size=32, **kwargs):
+        started.set()
+        resume.wait(10)
+        return encode(sentences, batch_size=batch_size, **kwargs)
+
+    monkeypatch.setattr(embedder, 'encode', slow_encode)
+    errors = []
+
+    def build():
+        try:
+            building.build_from_documents([process('a.md', '# A\n\nSAVE15 gives fifteen percent off.')])
+        except Exception as e:
+            errors.append(e)
+
+    worker = threading.Thread(target=build)
+    worker.start()
+    try:
+        assert started.wait(10)
+        # A second instance of the project, as after eviction and reopening, mid-build
+        make_kb(project='shop')
+    finally:
+        resume.set()
+        worker.join()
+    monkeypatch.undo()
+
+    assert errors == []
+    assert building.get_all_sources() == ['a.md']
+    assert building._collection_names() == ['qa_documents_shop']
+
+
+def test_leftover_shadows_are_dropped_on_open(make_kb):
+    knowledge_base = make_kb(project='shop')
+    knowledge_base.client.create_collection('qa_documents_shop__shadow_leftover')
+
+    make_kb(project='shop')
+
+    assert 'qa_documents_shop__shadow_leftover' not in knowledge_base._collection_names()
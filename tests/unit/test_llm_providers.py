@@ -0,0 +1,98 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from services import test_generator
+from services.llm_providers import FakeLLMClient, OpenAICompatibleClient, create_llm_providers
+
+CASES = [{
+    "test_id": "TC-001", "feature": "Discount", "test_scenario": "Apply SAVE15",
+    "expected_result": "15% off", "grounded_in": "checkout.md", "test_type": "positive",
+    "steps": ["Enter SAVE15", "Click Apply"]
+}]
+
+
+class OtherLLMClient(FakeLLMClient):
+    name = "other"
+
+    def __init__(self):
+        super().__init__(cases_per_call=1)
+        self.calls = 0
+
+    def _generate(self, prompt, timeout=None):
+        self.calls += 1
+        return super()._generate(prompt, timeout)
+
+
+@pytest.fixture
+def chat_server():
+    """Local OpenAI-compatible server answering every completion with CASES"""
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            requests_seen.append((self.path, self.headers.get('Authorization'), body))
+            payload = json.dumps({'choices': [{'message': {'content': json.dumps(CASES)}}]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}/v1/', requests_seen
+    server.shutdown()
+    server.server_close()
+
+
+def test_providers_are_configured_from_the_environment(monkeypatch, tmp_path):
+    for name in ('LOCAL_LLM_BASE_URL', 'LLAMA_MODEL_PATH', 'GEMINI_API_KEY'):
+        monkeypatch.delenv(name, raising=False)
+    providers = create_llm_providers()
+
+    assert sorted(providers) == ['fake', 'gemini', 'llama_cpp', 'openai_compatible']
+    assert {name for name, provider in providers.items() if provider.is_configured} == {'fake'}
+
+    monkeypatch.setenv('LOCAL_LLM_BASE_URL', 'http://localhost:8080/v1/')
+    local = create_llm_providers()['openai_compatible']
+    assert local.is_configured and local.base_url == 'http://localhost:8080/v1'
+
+
+def test_openai_compatible_client_sends_the_shared_prompt(chat_server, monkeypatch):
+    base_url, requests_seen = chat_server
+    monkeypatch.setenv('LOCAL_LLM_API_KEY', 'secret')
+    client = OpenAICompatibleClient(base_url=base_url, model_name='qwen2.5')
+
+    test_cases = client.generate_test_cases('discount code', '[Source: checkout.md]\nSAVE15 gives 15% off')
+
+    assert [case['test_id'] for case in test_cases] == ['TC-001']
+    (path, authorization, body), = requests_seen
+    assert path == '/v1/chat/completions' and authorization == 'Bearer secret'
+    assert body['model'] == 'qwen2.5'
+    assert body['messages'][0]['content'] == client._build_prompt('discount code',
+                                                                  '[Source: checkout.md]\nSAVE15 gives 15% off')
+
+
+def test_requested_provider_is_used_and_cached_separately(make_kb, process):
+    knowledge_base = make_kb()
+    knowledge_base.build_from_documents([process('checkout.md', '# Discounts\n\nSAVE15 gives 15% off.')])
+    generator = test_generator.TestGenerator(knowledge_base, FakeLLMClient())
+    other = OtherLLMClient()
+
+    default_report, other_report, cached_report = {}, {}, {}
+    default_cases = generator.generate_test_cases('discount code', report=default_report)
+    other_cases = generator.generate_test_cases('discount code', report=other_report, llm_client=other)
+    generator.generate_test_cases('discount code', report=cached_report, llm_client=other)
+
+    assert default_report['provider'] == 'fake' and len(default_cases) == 3
+    # Not served from the default provider's cached result
+    assert other_report['provider'] == 'other' and not other_report['cached'] and len(other_cases) == 1
+    assert cached_report['cached'] and other.calls == 1
@@ -0,0 +1,72 @@
+import os
+import statistics
+import sys
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                'benchmarks'))
+
+from load_test import parse_mix  # noqa: E402
+from services.llm_providers import OpenAICompatibleClient  # noqa: E402
+from stub_llm_server import LATENCY_DISTRIBUTIONS, StubBehaviour, start_stub_server  # noqa: E402
+
+CONTEXT = '[Source: checkout.md]\nThe SAVE15 code takes 15% off the cart subtotal.'
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**behaviour):
+        behaviour.setdefault('latency_ms', 0)
+        server = start_stub_server(StubBehaviour(seed=0, **behaviour))
+        servers.append(server)
+        return server, OpenAICompatibleClient(base_url=f'http://127.0.0.1:{server.server_address[1]}/v1')
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize('distribution', LATENCY_DISTRIBUTIONS)
+def test_latency_distributions_keep_the_requested_mean(distribution):
+    behaviour = StubBehaviour(latency_ms=200, latency_dist=distribution, seed=1)
+
+    samples = [behaviour.sample_latency() for _ in range(4000)]
+
+    assert statistics.mean(samples) == pytest.approx(0.2, rel=0.1)
+    assert min(samples) >= 0
+
+
+def test_backend_client_gets_grounded_cases_from_the_stub(stub):
+    server, client = stub()
+
+    test_cases = client.generate_test_cases('discount code', CONTEXT)
+
+    assert len(test_cases) == 3
+    assert {case['grounded_in'] for case in test_cases} == {'checkout.md'}
+    port = server.server_address[1]
+    assert requests.get(f'http://127.0.0.1:{port}/stats', timeout=5).json()['requests'] == 1
+
+
+def test_injected_failures_reach_the_client(stub):
+    _, failing = stub(error_rate=1.0)
+    with pytest.raises(Exception):
+        failing.generate_test_cases('discount code', CONTEXT)
+
+    _, truncating = stub(malformed_rate=1.0)
+    # The cut-off array still yields the cases that were complete
+    test_cases = truncating.generate_test_cases('discount code', CONTEXT)
+    assert 1 <= len(test_cases) < 3
+    assert truncating.stats()['salvaged_responses'] == 1
+
+
+def test_traffic_mix_names_known_endpoints_only():
+    assert parse_mix('generate=60, script=30,upload=8,build=2') == {
+        'generate': 60.0, 'script': 30.0, 'upload': 8.0, 'build': 2.0
+    }
+    with pytest.raises(ValueError):
+        parse_mix('generate=60,search=40')
@@ -0,0 +1,65 @@
+import threading
+
+from services import maintenance
+from services.maintenance import compact_and_measure, disk_footprint
+
+SHIPPING = '# Shipping\n\nExpress shipping costs ten dollars.'
+RETURNS = '# Returns\n\nReturns are free within thirty days of shipping.'
+
+
+def test_compaction_reclaims_dropped_collections_and_keeps_live_data(tmp_path, make_kb, process):
+    store = str(tmp_path / 'db')
+    kb = make_kb(persist_directory=store)
+    for round_number in range(3):
+        kb.build_from_documents([process('shipping.md', SHIPPING * (round_number + 1)), process('returns.md', RETURNS)])
+
+    before = disk_footprint(store)
+    collection, = [c for c in before['collections'] if c['chunks']]
+    assert collection['name'] == 'qa_documents'
+    assert set(collection['sources']) == {'shipping.md', 'returns.md'}
+    assert all(entry['estimated_bytes'] >= entry['text_bytes'] > 0 for entry in collection['sources'].values())
+
+    report = compact_and_measure(store, queries=3)
+
+    assert report['compaction']['bytes_after'] <= report['compaction']['bytes_before']
+    assert report['footprint']['orphaned_segments'] == []
+    assert report['footprint']['sqlite']['free_pages'] == 0
+    assert report['timing_before']['queries'] == report['timing_after']['queries'] > 0
+    assert {result['metadata']['source'] for result in kb.query('shipping costs', n_results=2)} == \
+        {'shipping.md', 'returns.md'}
+
+
+def test_builds_and_project_opens_wait_for_compaction(tmp_path, make_kb, process, monkeypatch):
+    store = str(tmp_path / 'db')
+    kb = make_kb(persist_directory=store)
+    kb.build_from_documents([process('shipping.md', SHIPPING)])
+    compacting, resume = threading.Event(), threading.Event()
+    compact = maintenance.compact
+
+    def slow_compact(persist_directory):
+        compacting.set()
+        resume.wait(30)
+        return compact(persist_directory)
+
+    monkeypatch.setattr(maintenance, 'compact', slow_compact)
+    finished = []
+    threads = [
+        threading.Thread(target=compact_and_measure, args=(store,), kwargs={'measure_timing': False}),
+        threading.Thread(target=lambda: finished.append(kb.build_from_documents([process('returns.md', RETURNS)]))),
+        # A project nobody has opened yet
+        threading.Thread(target=lambda: finished.append(make_kb(persist_directory=store, project='billing')))
+    ]
+    threads[0].start()
+    try:
+        assert compacting.wait(10)
+        for thread in threads[1:]:
+            thread.start()
+        threads[1].join(0.5)
+        assert finished == []
+    finally:
+        resume.set()
+        for thread in threads:
+            thread.join(30)
+
+    assert len(finished) == 2
+    assert kb.get_all_sources() == ['returns.md']
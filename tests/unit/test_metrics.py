@@ -0,0 +1,89 @@
+import pytest
+
+from services import metrics
+from services.metrics import MetricsRegistry, cache_collector, timed
+
+
+def test_query_caches_of_every_open_project_are_reported(make_kb, process):
+    open_projects = {}
+    registry = MetricsRegistry()
+    registry.register_collector(cache_collector(
+        lambda: [({'cache': 'kb_queries', 'project': name}, kb.query_cache.stats())
+                 for name, kb in open_projects.items()]
+    ))
+    for project in ('default', 'billing'):
+        open_projects[project] = make_kb(project=project)
+        open_projects[project].build_from_documents([process(f'{project}.md', '# Fees\n\nLate fees are five dollars.')])
+    # A project opened after the collector was registered
+    open_projects['billing'].query('late fees')
+    open_projects['billing'].query('late fees')
+
+    lines = registry.render().splitlines()
+
+    assert 'qa_cache_hits_total{cache="kb_queries",project="billing"} 1' in lines
+    assert 'qa_cache_misses_total{cache="kb_queries",project="billing"} 1' in lines
+    assert 'qa_cache_hits_total{cache="kb_queries",project="default"} 0' in lines
+    assert lines.count('# TYPE qa_cache_hits_total counter') == 1
+
+
+def test_counters_and_gauges_render_in_the_text_format():
+    registry = MetricsRegistry()
+    requests = registry.counter('qa_http_requests_total', 'HTTP requests', ('route', 'status'))
+    in_flight = registry.gauge('qa_http_in_flight', 'Requests in flight')
+    requests.inc(route='/sources', status='200')
+    requests.inc(2, route='/sources', status='200')
+    requests.inc(route='/say "hi"\\now', status='500')
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+
+    assert registry.render() == (
+        '# HELP qa_http_requests_total HTTP requests\n'
+        '# TYPE qa_http_requests_total counter\n'
+        'qa_http_requests_total{route="/sources",status="200"} 3\n'
+        'qa_http_requests_total{route="/say \\"hi\\"\\\\now",status="500"} 1\n'
+        '# HELP qa_http_in_flight Requests in flight\n'
+        '# TYPE qa_http_in_flight gauge\n'
+        'qa_http_in_flight 1\n'
+    )
+    with pytest.raises(ValueError):
+        requests.inc(route='/sources')
+
+
+def test_histogram_buckets_are_cumulative_with_sum_and_count():
+    registry = MetricsRegistry()
+    latency = registry.histogram('qa_stage_seconds', 'Stage latency', ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, stage='search')
+
+    lines = registry.render().splitlines()
+
+    assert lines == [
+        '# HELP qa_stage_seconds Stage latency',
+        '# TYPE qa_stage_seconds histogram',
+        'qa_stage_seconds_bucket{stage="search",le="0.1"} 2',
+        'qa_stage_seconds_bucket{stage="search",le="1"} 3',
+        'qa_stage_seconds_bucket{stage="search",le="+Inf"} 4',
+        'qa_stage_seconds_count{stage="search"} 4',
+        'qa_stage_seconds_sum{stage="search"} 3.65',
+    ]
+
+
+def test_timed_stages_record_latency_and_errors():
+    with timed('test_metrics', 'timed'):
+        pass
+    with pytest.raises(RuntimeError):
+        with timed('test_metrics', 'timed'):
+            raise RuntimeError('boom')
+
+    rendered = metrics.REGISTRY.render().splitlines()
+    assert 'qa_stage_duration_seconds_count{component="test_metrics",stage="timed"} 2' in rendered
+    assert 'qa_stage_errors_total{component="test_metrics",stage="timed"} 1' in rendered
+
+
+def test_failing_collector_does_not_break_the_scrape():
+    registry = MetricsRegistry()
+    registry.gauge('qa_up', 'Service is up').set(1)
+    registry.register_collector(lambda: 1 / 0)
+
+    assert registry.render().splitlines()[-1] == 'qa_up 1'
@@ -0,0 +1,49 @@
+import pytest
+
+from services.response_parser import parse_test_cases, salvage_objects, strip_trailing_commas
+
+CASE = '{"test_id": "TC-%03d", "test_scenario": "Apply SAVE15", "steps": ["Enter {code}", "Click \\"Apply\\""]}'
+
+
+def parsed_case(number):
+    return {'test_id': f'TC-{number:03d}', 'test_scenario': 'Apply SAVE15', 'steps': ['Enter {code}', 'Click "Apply"']}
+
+
+def test_valid_array_is_parsed_without_salvage():
+    assert parse_test_cases(f"[{CASE % 1}, {CASE % 2}]") == ([parsed_case(1), parsed_case(2)], 0)
+
+
+@pytest.mark.parametrize('text', [
+    f'```json\n[{CASE % 1},]\n```',
+    f'{{"test_cases": [{CASE % 1}]}}',
+    CASE % 1,
+])
+def test_fences_trailing_commas_and_wrappers_are_accepted(text):
+    assert parse_test_cases(text) == ([parsed_case(1)], 0)
+
+
+def test_trailing_commas_inside_strings_are_kept():
+    case = '{"test_id": "TC-001", "steps": ["Type \\"a,]\\" in the tags box", "Type b, }"],}'
+
+    assert strip_trailing_commas(case) == '{"test_id": "TC-001", "steps": ["Type \\"a,]\\" in the tags box", "Type b, }"]}'
+    # The repaired array is parsed whole, and the salvaged object alike
+    steps = ['Type "a,]" in the tags box', 'Type b, }']
+    assert parse_test_cases(f'[{case},]') == ([{'test_id': 'TC-001', 'steps': steps}], 0)
+    assert parse_test_cases(f'[{case}, {{"test_id": "TC-0') == ([{'test_id': 'TC-001', 'steps': steps}], 1)
+
+
+def test_truncated_array_keeps_the_complete_cases():
+    text = f'Here are the tests:\n[{CASE % 1}, {CASE % 2}, {{"test_id": "TC-003", "steps": ["Ente'
+
+    assert parse_test_cases(text) == ([parsed_case(1), parsed_case(2)], 2)
+
+
+def test_salvage_skips_objects_that_are_not_test_cases():
+    text = f'[{{"note": "ignore me"}}, {CASE % 1}, {{"test_id": "TC-002", "steps": [],}}]  trailing prose'
+
+    assert [case['test_id'] for case in salvage_objects(text)] == ['TC-001', 'TC-002']
+
+
+def test_nothing_usable_raises():
+    with pytest.raises(ValueError, match='no test cases could be salvaged'):
+        parse_test_cases('Sorry, I cannot help with that.')
@@ -0,0 +1,64 @@
+import pytest
+
+TOPICS = {
+    'shipping.md': 'Express shipping costs ten dollars and arrives in two days.',
+    'returns.md': 'Returns are free within thirty days of delivery.',
+    'payment.md': 'Card payments are charged when the order ships.',
+    'discounts.md': 'The SAVE15 code takes fifteen percent off the cart.',
+    'accounts.md': 'Passwords must be reset every ninety days.',
+    'search.md': 'Search results are sorted by relevance then price.'
+}
+
+
+@pytest.fixture
+def documents(process):
+    return [process(name, f'# {name[:-3].title()}\n\n{text}') for name, text in TOPICS.items()]
+
+
+def ranked_sources(kb, query='shipping and returns costs'):
+    return [result['metadata']['source'] for result in kb.query(query, n_results=4)]
+
+
+def collections(kb):
+    return sorted(name for name in kb._collection_names() if name.startswith('qa_documents'))
+
+
+def test_rebuilds_repartition_from_one_shard_to_two_and_back(make_kb, documents):
+    single = make_kb(num_shards=1)
+    single.build_from_documents(documents)
+    expected = ranked_sources(single)
+
+    # A new shard count is only picked up by the next rebuild
+    reopened = make_kb(num_shards=2)
+    assert len(reopened.shards) == 1 and ranked_sources(reopened) == expected
+    reopened.build_from_documents(documents)
+
+    assert collections(reopened) == ['qa_documents__shard_0', 'qa_documents__shard_1']
+    counts = [shard.count() for shard in reopened.shards]
+    assert sum(counts) == len(TOPICS) and all(counts)
+    assert {entry['shard'] for entry in reopened.list_sources()} == {0, 1}
+    # Scatter-gather over both shards ranks exactly like the single collection
+    assert ranked_sources(reopened) == expected
+    assert len(make_kb(num_shards=2).shards) == 2
+
+    back = make_kb(num_shards=1)
+    back.build_from_documents(documents)
+
+    assert collections(back) == ['qa_documents']
+    assert back.shards[0].count() == len(TOPICS)
+    assert ranked_sources(back) == expected
+
+
+def test_filtered_queries_only_search_the_shards_that_can_match(make_kb, documents):
+    for doc in documents:
+        doc.setdefault('metadata', {})['product'] = 'store' if doc['filename'] != 'accounts.md' else 'accounts'
+    kb = make_kb(num_shards=4, shard_by='product')
+    kb.build_from_documents(documents)
+
+    accounts = kb._target_shards({'products': ['accounts']})
+    shipping = kb._target_shards({'sources': ['shipping.md']})
+
+    assert len(accounts) == 1 and accounts[0].count() == 1
+    assert len(shipping) == 1 and shipping[0].count() == len(TOPICS) - 1
+    assert [r['metadata']['source'] for r in kb.query('passwords', n_results=3, filters={'products': ['accounts']})] \
+        == ['accounts.md']
@@ -0,0 +1,87 @@
+import os
+import subprocess
+import sys
+import threading
+
+TESTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(os.path.dirname(TESTS), 'backend')
+
+SHIPPING = '# Shipping\n\nExpress shipping costs ten dollars.'
+RETURNS = '# Returns\n\nReturns are free within thirty days of shipping.'
+
+
+def in_other_process(store, code):
+    """Run code in a separate worker process with ``kb`` and ``process`` bound to the same store"""
+    prelude = (
+        "import sys\n"
+        f"sys.path.insert(0, {TESTS!r})\n"
+        "from conftest import HashingEmbedder\n"
+        "from services.document_processor import DocumentProcessor\n"
+        "from services.knowledge_base import KnowledgeBase\n"
+        f"kb = KnowledgeBase(persist_directory={store!r}, embedding_model=HashingEmbedder())\n"
+        "def process(name, text):\n"
+        "    return DocumentProcessor().process_document(text.encode(), name, 'text/markdown')\n"
+    )
+    subprocess.run([sys.executable, '-c', prelude + code], cwd=BACKEND, check=True, timeout=120,
+                   env={**os.environ, 'PYTHONPATH': os.pathsep.join(sys.path)})
+
+
+def sources_of(results):
+    return {result['metadata']['source'] for result in results}
+
+
+def test_workers_see_each_others_rebuilds_and_deletes(tmp_path, make_kb, process):
+    store = str(tmp_path / 'db')
+    worker = make_kb(persist_directory=store)
+    worker.build_from_documents([process('old.md', '# Old\n\nShipping used to cost five dollars.')])
+    assert sources_of(worker.query('shipping costs', n_results=3)) == {'old.md'}
+    version = worker.version
+
+    in_other_process(store, "kb.build_from_documents([process('shipping.md', %r), process('returns.md', %r)])"
+                     % (SHIPPING, RETURNS))
+
+    # The cached result for the same query is not served any more
+    assert worker.version != version
+    assert sources_of(worker.query('shipping costs', n_results=3)) == {'shipping.md', 'returns.md'}
+    assert sorted(worker.get_all_sources()) == ['returns.md', 'shipping.md']
+
+    in_other_process(store, "kb.delete_source('shipping.md')")
+
+    results = worker.query('shipping costs', n_results=3)
+    assert sources_of(results) == {'returns.md'} and all(result['text'] for result in results)
+    assert worker.get_all_sources() == ['returns.md']
+
+
+def test_opening_the_store_keeps_another_workers_build(tmp_path, make_kb, process, embedder, monkeypatch):
+    store = str(tmp_path / 'db')
+    building = make_kb(persist_directory=store)
+    started, resume = threading.Event(), threading.Event()
+    encode = embedder.encode
+
+    def slow_encode(sentences, batch_size=32, **kwargs):
+        started.set()
+        resume.wait(30)
+        return encode(sentences, batch_size=batch_size, **kwargs)
+
+    monkeypatch.setattr(embedder, 'encode', slow_encode)
+    errors = []
+
+    def build():
+        try:
+            building.build_from_documents([process('shipping.md', SHIPPING)])
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=build)
+    thread.start()
+    try:
+        assert started.wait(10)
+        # A worker starting up mid-build, which cleans up after interrupted rebuilds
+        in_other_process(store, "assert kb.get_all_sources() == []")
+    finally:
+        resume.set()
+        thread.join()
+    monkeypatch.undo()
+
+    assert errors == []
+    assert building.get_all_sources() == ['shipping.md']
@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+from services.snapshot import CHUNKS_FILE, MANIFEST_FILE, SnapshotError
+
+DOCS = {
+    'discounts.md': '# Discounts\n\nThe SAVE15 code applies a fifteen percent discount.',
+    'shipping.md': '# Shipping\n\nExpress shipping costs ten dollars.',
+}
+
+
+@pytest.fixture
+def exported(tmp_path, make_kb, process):
+    source = make_kb(persist_directory=str(tmp_path / 'source'))
+    source.build_from_documents([process(name, text) for name, text in DOCS.items()])
+    directory = str(tmp_path / 'snapshot')
+    manifest = source.export_snapshot(directory)
+    return source, directory, manifest
+
+
+def test_round_trip_serves_the_same_index(tmp_path, make_kb, exported):
+    source, directory, manifest = exported
+    target = make_kb(persist_directory=str(tmp_path / 'target'), num_shards=2)
+
+    assert target.import_snapshot(directory)['chunk_count'] == manifest['chunk_count']
+
+    assert target.get_all_sources() == source.get_all_sources()
+    for query in ('SAVE15 discount', 'express shipping'):
+        expected = source.query(query, n_results=2)
+        found = target.query(query, n_results=2)
+        assert [r['text'] for r in found] == [r['text'] for r in expected]
+        assert [r['metadata'] for r in found] == [r['metadata'] for r in expected]
+    assert not [name for name in target._collection_names() if '__shadow' in name]
+
+
+def test_existing_snapshot_is_not_overwritten(exported):
+    source, directory, _ = exported
+
+    with pytest.raises(FileExistsError):
+        source.export_snapshot(directory)
+
+
+def test_corrupt_snapshot_is_rejected_and_live_index_kept(tmp_path, make_kb, process, exported):
+    _, directory, _ = exported
+    with open(os.path.join(directory, CHUNKS_FILE), 'ab') as f:
+        f.write(b'junk')
+    target = make_kb(persist_directory=str(tmp_path / 'target'))
+    target.build_from_documents([process('live.md', '# Live\n\nReturns are free within 30 days.')])
+
+    with pytest.raises(SnapshotError, match='Checksum mismatch'):
+        target.import_snapshot(directory)
+
+    assert target.get_all_sources() == ['live.md']
+
+
+def test_snapshot_from_another_model_is_rejected(tmp_path, make_kb, exported):
+    _, directory, _ = exported
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    manifest['embedding_model'] = 'other-model'
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+
+    with pytest.raises(SnapshotError, match='other-model'):
+        make_kb(persist_directory=str(tmp_path / 'target')).import_snapshot(directory)
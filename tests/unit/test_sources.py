@@ -0,0 +1,54 @@
+import hashlib
+import os
+
+import pytest
+
+SHIPPING = '# Shipping\n\nExpress shipping costs ten dollars.'
+RETURNS = '# Returns\n\nReturns are free within thirty days.'
+
+
+@pytest.fixture
+def kb(make_kb, process):
+    knowledge_base = make_kb()
+    knowledge_base.build_from_documents([process('shipping.md', SHIPPING), process('returns.md', RETURNS)])
+    return knowledge_base
+
+
+def test_sources_are_listed_from_the_manifest(kb, make_kb):
+    entries = {entry['source']: entry for entry in kb.list_sources()}
+
+    assert sorted(entries) == ['returns.md', 'shipping.md']
+    shipping = entries['shipping.md']
+    assert shipping['chunk_count'] == 1
+    assert shipping['content_hash'] == hashlib.sha256(SHIPPING.encode()).hexdigest()
+    assert shipping['size_bytes'] == len(SHIPPING)
+    assert shipping['sections'] == ['Shipping']
+    # A fresh instance reads the same manifest back without scanning chunks
+    assert make_kb().list_sources() == kb.list_sources()
+
+
+@pytest.mark.parametrize('num_shards', [1, 2])
+def test_deleting_a_source_removes_its_chunks_and_manifest_entry(make_kb, process, num_shards):
+    kb = make_kb(num_shards=num_shards)
+    kb.build_from_documents([process('shipping.md', SHIPPING), process('returns.md', RETURNS)])
+    version = kb.version
+
+    removed = kb.delete_source('shipping.md')
+
+    assert removed['source'] == 'shipping.md'
+    assert kb.version != version
+    assert kb.get_all_sources() == ['returns.md']
+    assert {r['metadata']['source'] for r in kb.query('express shipping costs', n_results=5)} == {'returns.md'}
+    assert make_kb(num_shards=num_shards).get_all_sources() == ['returns.md']
+    with pytest.raises(KeyError):
+        kb.delete_source('shipping.md')
+
+
+def test_missing_manifest_is_rebuilt_from_chunk_metadata(kb, make_kb):
+    os.remove(kb.manifest_path)
+
+    reopened = make_kb()
+
+    assert sorted(reopened.get_all_sources()) == ['returns.md', 'shipping.md']
+    assert all(entry['chunk_count'] == 1 for entry in reopened.list_sources())
+    assert os.path.exists(kb.manifest_path)
@@ -0,0 +1,101 @@
+from pathlib import Path
+
+import pytest
+
+from services.text_structure import html_to_structured_text, parse_blocks, split_points
+
+SUPPORT_DOCS = Path(__file__).resolve().parents[2] / 'assets' / 'support_docs'
+
+SPEC = """# Shop
+
+## Discounts
+
+### Valid Codes
+- SAVE15 takes 15% off the subtotal
+
+### Validation
+- Invalid codes show "Invalid discount code"
+
+## Shipping
+
+Standard shipping is free.
+"""
+
+
+def blocks_of(text):
+    return [(block['kind'], text[block['start']:block['end']]) for block in parse_blocks(text)]
+
+
+def test_parse_blocks_keeps_lead_in_lines_and_loose_lists_together():
+    text = "## Options\n\nPayment options:\n- Card\n\n- PayPal\n  redirects away\n\nAfter the list."
+
+    assert blocks_of(text) == [
+        ('heading', '## Options'),
+        ('list', 'Payment options:\n- Card\n\n- PayPal\n  redirects away'),
+        ('paragraph', 'After the list.'),
+    ]
+
+
+def test_parse_blocks_ignores_headings_inside_code_fences():
+    text = "```\n# not a heading\n```\n=== REAL ==="
+
+    assert [kind for kind, _ in blocks_of(text)] == ['code', 'heading']
+
+
+def test_split_points_repeat_the_table_header():
+    text = "| a | b |\n| --- | --- |\n| 1 | 2 |\n| 3 | 4 |"
+    cuts, repeated = split_points(text, parse_blocks(text)[0])
+
+    assert [text[cut:cut + 9] for cut in cuts] == ['| 3 | 4 |']
+    assert repeated == "| a | b |\n| --- | --- |\n"
+
+
+def test_html_is_rendered_as_markdown_blocks():
+    html = ("<html><head><style>p{}</style></head><body><h2>Cart</h2><p>Items <b>listed</b></p>"
+            "<ul><li>One<ul><li>Nested</li></ul></li></ul><table><tr><th>A</th></tr><tr><td>1</td></tr></table>"
+            "</body></html>")
+
+    assert html_to_structured_text(html) == "## Cart\n\nItems listed\n\n- One\n  - Nested\n\n| A |\n| --- |\n| 1 |"
+
+
+def test_each_section_keeps_its_own_label(process):
+    chunks = process('spec.md', SPEC, chunk_mode='structure')['chunks']
+
+    assert [chunk['metadata']['section'] for chunk in chunks] == [
+        'Shop > Discounts > Valid Codes',
+        'Shop > Discounts > Validation',
+        'Shop > Shipping',
+    ]
+    # Bare parent headings are carried into their first subsection
+    assert chunks[0]['text'].startswith('# Shop\n\n## Discounts\n\n### Valid Codes')
+    assert chunks[1]['text'].startswith('Shop > Discounts\n### Validation')
+    assert 'Standard shipping' not in chunks[1]['text']
+
+
+@pytest.mark.parametrize('name', ['product_specs.md', 'business_requirements.md', 'ui_ux_guide.txt'])
+@pytest.mark.parametrize('chunk_size', [300, 1000])
+def test_chunks_with_breadcrumbs_stay_within_chunk_size(process, name, chunk_size):
+    text = (SUPPORT_DOCS / name).read_text(encoding='utf-8')
+    chunks = process(name, text, chunk_mode='structure', chunk_size=chunk_size, chunk_overlap=50)['chunks']
+
+    assert max(len(chunk['text']) for chunk in chunks) <= chunk_size
+
+
+def test_oversized_table_is_split_between_rows_with_its_header(process):
+    rows = "\n".join(f"| item {i} | ${i}.99 |" for i in range(40))
+    text = f"# Prices\n\n| Item | Price |\n| --- | --- |\n{rows}\n"
+    chunks = process('prices.md', text, chunk_mode='structure', chunk_size=200, chunk_overlap=20)['chunks']
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(chunk['text']) <= 200
+        assert chunk['metadata']['section'] == 'Prices'
+    for chunk in chunks[1:]:
+        assert chunk['text'].startswith('Prices\n| Item | Price |\n| --- | --- |\n| item ')
+
+
+def test_invalid_chunk_mode_is_rejected():
+    from services.document_processor import DocumentProcessor
+
+    with pytest.raises(ValueError):
+        DocumentProcessor(chunk_mode='sentences')
@@ -0,0 +1,185 @@
+import threading
+
+import pytest
+
+from services import test_generator
+from services.context_packer import estimate_tokens
+from services.deadline import Deadline
+from services.llm_providers import FakeLLMClient
+
+CHECKOUT_DOC = """# Checkout
+
+## Discount Codes
+
+The SAVE15 discount code applies a 15% discount to the cart subtotal.
+
+## Shipping
+
+Standard shipping is free. Express shipping costs $10.
+"""
+
+
+class FlakyLLMClient(FakeLLMClient):
+    """Fake LLM whose first ``failures`` calls raise"""
+
+    def __init__(self, failures: int = 0):
+        super().__init__()
+        self.failures = failures
+        self.calls = 0
+
+    def _generate(self, prompt, timeout=None):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("model unavailable")
+        return super()._generate(prompt, timeout)
+
+
+@pytest.fixture
+def knowledge_base(make_kb, process):
+    knowledge_base = make_kb()
+    knowledge_base.build_from_documents([process('checkout.md', CHECKOUT_DOC)])
+    return knowledge_base
+
+
+def generate(generator, query='discount code'):
+    report = {}
+    test_cases = generator.generate_test_cases(query, report=report)
+    return test_cases, report
+
+
+def test_llm_result_is_cached(knowledge_base):
+    llm = FlakyLLMClient()
+    generator = test_generator.TestGenerator(knowledge_base, llm)
+
+    _, first = generate(generator)
+    _, second = generate(generator)
+
+    assert first['generator'] == 'llm' and not first['cached']
+    assert second['cached'] and llm.calls == 1
+
+
+def test_fallback_after_llm_error_is_not_cached(knowledge_base):
+    llm = FlakyLLMClient(failures=1)
+    generator = test_generator.TestGenerator(knowledge_base, llm)
+
+    _, first = generate(generator)
+    assert first['generator'] == 'rule_based'
+
+    # The next request asks the LLM again instead of replaying the fallback
+    _, second = generate(generator)
+    assert second['generator'] == 'llm' and not second['cached']
+    assert llm.calls == 2
+
+    _, third = generate(generator)
+    assert third['cached'] and third['generator'] == 'llm'
+
+
+def test_rule_based_result_is_cached_without_llm(knowledge_base):
+    generator = test_generator.TestGenerator(knowledge_base, None)
+
+    _, first = generate(generator)
+    _, second = generate(generator)
+
+    assert first['generator'] == 'rule_based'
+    assert second['cached']
+
+
+class GatedLLMClient(FakeLLMClient):
+    """Fake LLM whose per-feature (fan-out) calls wait until ``release`` is set"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+        self.waiting = threading.Semaphore(0)
+
+    def _generate(self, prompt, timeout=None):
+        if 'Only cover the' in prompt:
+            self.waiting.release()
+            self.release.wait(5)
+        return super()._generate(prompt, timeout)
+
+
+@pytest.mark.parametrize('query, fans_out', [
+    ('full checkout', True),
+    ('end-to-end checkout test', True),
+    ('test all discount code cases', False),
+    ('discount code flow', False),
+])
+def test_only_broad_queries_fan_out(knowledge_base, query, fans_out):
+    generator = test_generator.TestGenerator(knowledge_base, FakeLLMClient())
+
+    assert bool(generator._plan_fan_out(query, CHECKOUT_DOC)) == fans_out
+
+
+def test_fan_out_only_uses_idle_workers(knowledge_base):
+    llm = GatedLLMClient()
+    generator = test_generator.TestGenerator(knowledge_base, llm, fan_out_workers=2)
+    first = {}
+    worker = threading.Thread(target=lambda: first.update(report=generate(generator, 'full checkout')[1]))
+    worker.start()
+    try:
+        assert llm.waiting.acquire(timeout=5) and llm.waiting.acquire(timeout=5)
+
+        # Both workers are busy: the second request takes the single-prompt path instead of queueing
+        _, second = generate(generator, 'complete checkout')
+        assert second['generator'] == 'llm'
+        assert second['fan_out'] == {'features': ['discount_code', 'cart', 'shipping'], 'skipped': 'no idle workers'}
+    finally:
+        llm.release.set()
+        worker.join()
+
+    assert first['report']['fan_out']['features'] == ['discount_code', 'cart']
+    assert first['report']['fan_out']['dropped'] == ['shipping']
+    # Left out features mean an incomplete result, which is not cached
+    assert not generate(generator, 'full checkout')[1]['cached']
+
+
+def test_fan_out_reports_the_prompt_tokens_of_every_call(knowledge_base):
+    prompts = []
+
+    class RecordingLLMClient(FakeLLMClient):
+        def _generate(self, prompt, timeout=None):
+            prompts.append(prompt)
+            return super()._generate(prompt, timeout)
+
+    generator = test_generator.TestGenerator(knowledge_base, RecordingLLMClient())
+
+    _, report = generate(generator, 'full checkout')
+
+    assert report['generator'] == 'llm' and len(prompts) == len(report['fan_out']['features']) > 1
+    assert report['prompt_tokens'] == sum(estimate_tokens(prompt) for prompt in prompts)
+
+
+def test_fan_out_skips_features_past_the_deadline(knowledge_base):
+    llm = FlakyLLMClient()
+    generator = test_generator.TestGenerator(knowledge_base, llm)
+    # Too little time left for an LLM call once the fallback reserve is kept back
+    deadline = Deadline(test_generator.FALLBACK_RESERVE_SECONDS / 2)
+    report = {}
+
+    cases = generator._generate_fan_out('full checkout', ['discount_code', 'shipping'], None, None, report,
+                                        llm, deadline, knowledge_base)
+    # Let the workers finish whatever they still run
+    generator._fan_out_executor.shutdown(wait=True)
+
+    assert cases == [] and llm.calls == 0
+    assert report['fan_out']['unfinished'] == ['discount_code', 'shipping']
+
+
+def test_refinement_holds_the_knowledge_base_until_done(knowledge_base):
+    release = threading.Event()
+
+    class BlockedLLMClient(FakeLLMClient):
+        def _generate(self, prompt, timeout=None):
+            release.wait(5)
+            return super()._generate(prompt, timeout)
+
+    generator = test_generator.TestGenerator(knowledge_base, BlockedLLMClient())
+
+    _, job_id = generator.generate_fast('discount code')
+    assert knowledge_base.in_use
+
+    release.set()
+    assert generator.get_refinement(job_id, wait=5)['status'] == 'done'
+    assert not knowledge_base.in_use
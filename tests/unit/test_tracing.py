@@ -0,0 +1,80 @@
+import io
+import marshal
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.document_processor import DocumentProcessor
+from services.tracing import ProfilerBusy, Trace, propagate, span, traced
+
+
+def busy_work():
+    return sum(i * i for i in range(20000))
+
+
+def profiled_functions(trace):
+    stats = marshal.loads(trace.pstats_dump())
+    return {name for (_, _, name) in stats}
+
+
+def test_cprofile_trace_covers_worker_threads():
+    trace = Trace('GET /ask', mode='cprofile')
+    with traced(trace):
+        with span('request'):
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                def job():
+                    with span('worker'):
+                        return busy_work()
+                futures = [pool.submit(propagate(job)) for _ in range(2)]
+                [future.result() for future in futures]
+
+    assert 'busy_work' in profiled_functions(trace)
+
+
+def test_concurrent_cprofile_trace_is_rejected():
+    first = Trace('GET /a', mode='cprofile')
+    with traced(first):
+        with pytest.raises(ProfilerBusy):
+            with traced(Trace('GET /b', mode='cprofile')):
+                pass
+        # Span traces do not use the profiler and still run
+        with traced(Trace('GET /c', mode='spans')) as other:
+            with span('step'):
+                pass
+        assert other.to_dict()['spans'][0]['name'] == 'step'
+
+    # The profiler is free again once the first trace finishes
+    second = Trace('GET /d', mode='cprofile')
+    with traced(second):
+        with span('step'):
+            busy_work()
+    assert 'busy_work' in profiled_functions(second)
+
+
+def test_rejected_trace_leaves_no_active_trace():
+    from services.tracing import current_trace
+
+    with traced(Trace('GET /a', mode='cprofile')) as first:
+        with pytest.raises(ProfilerBusy):
+            with traced(Trace('GET /b', mode='cprofile')):
+                pass
+        assert current_trace() is first
+    assert current_trace() is None
+
+
+@pytest.mark.parametrize('on_disk', [False, True])
+def test_upload_spans_cover_reading_the_file(on_disk):
+    content = b'# Checkout\n\nThe SAVE15 code applies a 15% discount.\n'
+    stream = tempfile.TemporaryFile() if on_disk else io.BytesIO()
+    stream.write(content)
+    trace = Trace('POST /upload-documents', mode='spans')
+    with traced(trace):
+        with span('upload', filename='checkout.md'):
+            DocumentProcessor().process_stream(stream, 'checkout.md', 'text/markdown')
+    stream.close()
+
+    upload, = trace.to_dict()['spans']
+    assert [child['name'] for child in upload['children']] == [
+        'document_processor.read', 'document_processor.extract', 'document_processor.chunk'
+    ]
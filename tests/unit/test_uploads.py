@@ -0,0 +1,93 @@
+import tempfile
+
+import fitz
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from services.document_processor import DocumentProcessor
+from services.uploads import UploadSizeLimit
+
+GUIDE = "# Checkout\n\n## Discount Codes\n\nThe SAVE15 code applies a 15% discount.\n" * 40
+BOUNDARY = 'test-boundary'
+
+
+def multipart(filename: str, content: bytes) -> bytes:
+    return (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="files"; filename="{filename}"\r\n'
+            f'Content-Type: text/markdown\r\n\r\n').encode() + content + f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.state.received = []
+
+    @app.post('/upload-documents')
+    async def upload(files: list[UploadFile] = File(...)):
+        app.state.received.extend(file.filename for file in files)
+        return {'files': len(files)}
+
+    app.add_middleware(UploadSizeLimit, max_bytes=4096)
+    return TestClient(app)
+
+
+def test_small_upload_is_accepted(client):
+    response = client.post('/upload-documents', files=[('files', ('a.md', b'short', 'text/markdown'))])
+
+    assert response.status_code == 200 and client.app.state.received == ['a.md']
+
+
+def test_declared_length_over_the_cap_is_rejected_before_parsing(client):
+    response = client.post('/upload-documents', files=[('files', ('big.md', b'x' * 8192, 'text/markdown'))])
+
+    assert response.status_code == 413
+    assert client.app.state.received == []
+
+
+def test_streamed_body_over_the_cap_is_cut_off(client):
+    body = multipart('big.md', b'x' * 8192)
+
+    def chunks():
+        for offset in range(0, len(body), 1024):
+            yield body[offset:offset + 1024]
+
+    # A generator body is sent chunked, without a Content-Length
+    response = client.post('/upload-documents', content=chunks(),
+                           headers={'content-type': f'multipart/form-data; boundary={BOUNDARY}'})
+
+    assert response.status_code == 413
+    assert client.app.state.received == []
+
+
+def spooled(content: bytes, max_size: int):
+    stream = tempfile.SpooledTemporaryFile(max_size=max_size)
+    stream.write(content)
+    stream.seek(0)
+    return stream
+
+
+@pytest.mark.parametrize('max_size', [1 << 20, 16])
+def test_process_stream_matches_process_document(max_size):
+    processor = DocumentProcessor()
+    expected = processor.process_document(GUIDE.encode(), 'guide.md', 'text/markdown')
+
+    with spooled(GUIDE.encode(), max_size) as stream:
+        rolled = stream._rolled
+        document = processor.process_stream(stream, 'guide.md', 'text/markdown')
+        # A small upload is read from memory, not written to disk to map it
+        assert stream._rolled == rolled
+
+    assert document['chunks'] == expected['chunks']
+    assert document['metadata'] == expected['metadata']
+
+
+def test_process_stream_reads_pdf_from_disk():
+    pdf = fitz.open()
+    pdf.new_page().insert_text((72, 72), 'Express shipping costs $10')
+    content = pdf.tobytes()
+
+    with spooled(content, 16) as stream:
+        document = DocumentProcessor().process_stream(stream, 'spec.pdf', 'application/pdf')
+
+    assert 'Express shipping costs $10' in document['text_content']
+    assert document['metadata']['size_bytes'] == len(content)